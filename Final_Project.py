@@ -1,110 +1,177 @@
-import sys
-import cv2
-import numpy
-from PyQt5 import QtWidgets,QtGui,uic
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt, QThread
-from fer import FER
-from fer import Video
-import pyaudio
-import flask
 import time
-import speech_recognition as sr
-import string
-from playsound import playsound
+launchTime = time.monotonic() # when the program started, startup milestones are measured from here
+import sys
+import logging
+from PyQt5 import QtWidgets,QtGui,QtCore,uic
+from PyQt5.QtCore import pyqtSignal, Qt, QThread
+from ui_bus import UiUpdateBus
+from report_engine import ReportHistory, reportText
+from filler_words import DEFAULT_LEXICON
+import os
+from audio_cues import openCueEngine, toneCue
+from live_stats import LiveStatsServer
+from metrics import Metrics, registerMetricsRoutes
+from startup import ModelWarmup, StartupTimeline, buildFer
+# OpenCV, SpeechRecognition and Flask (with the pipelines, the frame renderer and the web server built on them) are
+# imported on the model warm-up thread once the window is on screen (see startupModules), so the window does not wait
+# for them
 
 #///////////////GLOBAL VARIABLES/////////////////////////
-isSpeaking = False # variable to keep track if the speaker is speaking or not
-speechRateSamples = [] # array to hold the samples of speech rates of the speaker
-emotionsList = [] # array that tracks the emotions that are used by the user
-emotionNum = [] # Array that tracks "emotion use" each index in this array corresponds with the respective emotion in emotionsList[]
-ahCounter = None # variable to keep track of how many filler words the speaker has used
-t = 0 # variable to keep track of how long the speaker has talked in seconds
+# The speech itself (clock, report, session log, Ah Count, the camera, microphone and audience pipelines) is a
+# SpeechSession from speech_core.py, created by Build_Session() once the window is on screen. This window is a front-end over it: it
+# reads the settings, shows what the session reports through its events, and starts and stops it
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s") # startup report and worker errors to the console
+logger = logging.getLogger("toastmaster")
+session = None # the SpeechSession this window coaches, built once the window is on screen (see Build_Session)
+sessionManager = None # the other rooms' speeches under /sessions, built with the web application (see Build_Web_App)
+renderer = None # prepares preview frames on the video thread, built with the session
+reportHistory = None # index of every saved report, opened the first time a report is saved or imported
+lastSummary = None # the report generated most recently, this is what the Save Report button saves
+reportFileName = "ToastMaster Report.txt" # text copy of the most recent report
+uiBus = UiUpdateBus() # worker threads publish widget changes here, the GUI thread applies them (see Apply_UI_Updates)
+uiRefreshRate = 30 # times per second the GUI applies the published widget changes
+sessionLogFolder = "Session Logs" # folder the session recordings are written to
+webServerPort = 5000 # port of the web server the ah-counter connects to
+webServerThreads = 8 # number of web requests handled at the same time
+sessionFolder = "Sessions" # logs and reports of the extra speeches run through /sessions
+sessionIdleSeconds = 1800 # an extra speech nobody has touched for this long is closed and saved
+sessionVideoSources = ("synthetic",) # cameras the extra speeches may use, e.g. (1, 2) for two more webcams
+sessionAudioSources = () # microphones the extra speeches may use, e.g. (1, 2) or ("default",)
+sessionUploadFolder = "Session Uploads" # recordings the extra speeches may play back instead of a camera or microphone
+liveStatsPort = 5001 # port of the live stats stream evaluators can watch, http://<this computer>:5001/, None to turn it off
+liveStats = LiveStatsServer(port=liveStatsPort) # pushes the live state of the speech to any number of observers
+timerCues = True # beep when the flag changes and when the time limit is reached
+timerCueTones = {"green": 523, "yellow": 659, "red": 784, "limit": 440} # pitch of each timer beep, Hz
+fillerLexicon = DEFAULT_LEXICON # filler words and phrases counted automatically from the transcript
+ahMergePolicy = "max" # how the client's count and the automatic count make the Ah Count: "max", "sum", "manual" or "auto"
+speechBackend = "google" # speech recognizer to use: "google", "sphinx" or "stub" (offline, for testing)
+speechBackendName = speechBackend # name of the recognizer, used in the GUI messages (its full name once the session is built)
+speechWorkers = 2 # number of phrases that may be recognised at the same time
+speechRateSource = "transcript" # where the speech rate samples in the report come from: "transcript" (recognised words) or "local" (syllables in the raw audio)
+videoSource = 0 # camera index, a video file to replay instead of the webcam, or "synthetic" for generated frames
+audioSource = "default" # microphone device index ("default" for the default microphone), or a WAV file to play back instead
+audienceSource = None # second camera pointed at the audience (camera index, video file or "synthetic"), None for no audience mode
+audienceMaxFaces = 16 # most audience faces classified per frame, the largest (nearest) ones are kept
+ferWorkers = 1 # number of threads running Facial Expression Recognition, raise this on machines with more cores
+ferTracking = True # track the face between detections instead of running full-frame face detection on every frame
+ferRedetectEvery = 10 # when tracking, run full face detection at least once every this many frames
+startupTimeline = StartupTimeline(launchTime) # time to the window, to the model being ready and to the first emotion
+metricsEnabled = True # time every pipeline stage for /metrics, costs about 2 us per stage (see metrics.py)
+traceSpeeches = False # record a Chrome trace of every speech, saved next to its session log as .trace.json
+metrics = Metrics(enabled=metricsEnabled) # latency histograms, queue depths and error counts of every stage, served on /metrics
+ferTrackingConfidence = 0.6 # when tracking, re-detect the face if the tracker's confidence (0 to 1) drops below this
 
 #================================ FACIAL EXPRESSION RECOGNITION ============================================================
-# This class describes the video thread
-class VideoThread(QThread):
-    new_frame_signal = pyqtSignal(numpy.ndarray)
-
-    def run(self):
-        # Capture from Webcam
-        width = 400 # Width of the captured video frame, units in pixels
-        height = 300 # Height of the captured video frame, units in pixels
-        video_capture_device = cv2.VideoCapture(0)
-        video_capture_device.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        video_capture_device.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-
-        fps = 0 # initialize fps counter to 0
-        detector = FER() # initialize Facial Expression Recognition
-
-        global isSpeaking # access global isSpeaking variable 
-
-        while True:
-            startTime = time.time() # Get the start time for the fps calculation
-
-            # I averaged about 20 fps, so 30 frames would allow for a time difference of a little more than a second
-            frameCounter = 50       # Let the for loop count to this number before calculating new fps
-
-            for i in range(0, frameCounter): # for loop to allow a time difference to calculate fps
-                if self.isInterruptionRequested():
-                    video_capture_device.release()
-                    return
-                else:
-                    ret, frame = video_capture_device.read()
-                    if ret:
-                        self.new_frame_signal.emit(frame)
-
-                        # When no face is detected, the emotion [] array is empty, so when detector.top_emotion() is called, 
-                        # an IndexError is thrown. The try: will execute code when a face is detected, and therefore no IndexError.
-                        # except IndexError as error: this code will execute when no face is detected, and the IndexError is thrown. 
-                        try:
-                            emotion, score = detector.top_emotion(frame) # get the top emotion and score from the video frame
-                            if isSpeaking:
-                                if emotion in emotionsList: # save the emotion to a list and keep track of number of times emotion is recognized
-                                    index = emotionsList.index(emotion) # Get the index of current emotion
-                                    emotionNum[index] += emotionNum[index] # add 1 to the array at the index of current emotion to keep track of "emotion use"
-                                else:
-                                    emotionsList.append(emotion) # if emotion does not exist yet, append it into the array
-                                    emotionNum.append(1) # begin keeping track of this new emotion in the array that tracks "emotion use"
-
-                            UI.emotionMagLabel.setText("Emotion Magnitude: " + str(score)) # Output the magnitude of emotion to GUI
-                            UI.emotionTypeLabel.setText("  Current Emotion: " + emotion) # Output the type of emotion to GUI
-
-                        except IndexError as error: # no face is detected
-                            UI.emotionMagLabel.setText("Emotion Magnitude: " + "N/A") # Magnitude of emotion is unavailabe since no face is detected
-                            UI.emotionTypeLabel.setText("  Current Emotion: " + "N/A") # Type of emotion is unavailabe since no face is detected
-
-                        UI.outputFPS.setText("Frames Per Second: " + str(fps)) # Output the current fps                
-            
-            stopTime = time.time() # Get the stop time for the fps calculation
-            fps = round(frameCounter / float(stopTime - startTime),3) # calculate the current fps, and round the answer to 3 decimal places
-
-# This function runs whenever a new frame arrives, so it should happen about 20-30 times a second, for FPS in a range of 20-30 fps
-def Update_Image(frame):
-    # If the Mirror Video button is toggled, mirror the output of the video feed 
-    if UI.mirrorToggle.isChecked() == True: # Check to see if the Mirror Button is Toggles
-        frame = cv2.flip(frame,1) # Flip the current frame of the video feed
-
-
-    height, width, channel = frame.shape # gather information from current frame
-    h = UI.lblOutput.height() # Get the height from the lblOutput, this is used for setting the size of the image inside the label
-    w = UI.lblOutput.width()  # Get the width from the lblOutput, this is used for setting the size of the image inside the label
-    bytesPerLine = 3 * width
-    qImg = QtGui.QImage(frame.data, width, height, bytesPerLine, QtGui.QImage.Format_RGB888) # generate qImg
-    qImg = qImg.rgbSwapped()
-
-    # Map the pixels of the frame from the video feed to the lblOutput object. 
-    # .scaled() specifies how the mapped pixels are scaled to the size of lblOutput. Here, I specify that I want to preserve
-    # the aspect ratio of the frame from the video feed
-    UI.lblOutput.setPixmap(QtGui.QPixmap(qImg).scaled(w,h,Qt.KeepAspectRatio,Qt.FastTransformation))
+# The session captures the camera on its own thread and runs Facial Expression Recognition on separate worker
+# threads that always score the newest frame, so the preview runs at the full camera rate and emotion scoring runs as
+# fast as the CPU allows. This object only turns the captured frames into images for the preview
+class VideoPreview(QtCore.QObject):
+    new_frame_signal = pyqtSignal(QtGui.QImage, int) # display-ready image and the renderer buffer it points into
+
+    # Runs on the video thread for every captured frame. Scaling, mirroring and colour conversion happen here, in
+    # preallocated buffers, so only a ready-to-draw QImage is sent to the GUI (at most once per screen refresh)
+    def Render_Frame(self, frame):
+        with metrics.stage("render"):
+            rendered = renderer.render(frame)
+        if rendered is None: # throttled, or the GUI is still drawing every buffer
+            return
+        index, rgb = rendered
+        height, width, channel = rgb.shape
+        image = QtGui.QImage(rgb.data, width, height, rgb.strides[0], QtGui.QImage.Format_RGB888) # no copy, points into the buffer
+        self.new_frame_signal.emit(image, index)
+
+# This function runs on the video thread once a second with the capture, inference and dropped frame stats
+def Show_Video_Stats(stats):
+    uiBus.setText("outputFPS", "Camera FPS: " + str(stats["captureFps"]) + "  FER FPS: " + str(stats["inferenceFps"]) +
+                         "  Dropped: " + str(stats["dropped"]))
+
+# Build the detector for one FER worker thread. Workers wait here until the model has been loaded and warmed up in the
+# background, the first one gets that model and any others build their own
+def Make_Detector():
+    ferWarmup.wait()
+    detector = ferWarmup.take() or buildFer()
+    if ferTracking: # detect the face every few frames and only classify the tracked face in between
+        from face_tracker import TrackingDetector
+        return TrackingDetector(detector, ferRedetectEvery, ferTrackingConfidence)
+    return detector
+
+# The audience worker uses a plain FER model of its own, it needs every face rather than a tracked speaker
+def Make_Audience_Detector():
+    ferWarmup.wait()
+    return buildFer()
+
+# This function runs on the audience worker thread, in frame order, every time an audience frame has been scored
+def Update_Audience(result):
+    if not session.speaking: # only the audience's reaction to the speech counts
+        return
+    liveStats.publish(audienceFaces=len(result.faces or []), audienceEmotion=result.emotion)
+
+# This function runs on the warm-up thread as the emotion model loads, to show how far along it is
+def Show_Model_Status(status, seconds):
+    if status == "imported": # the libraries are loaded, the rest can start while the model is built
+        uiBus.call(Start_Services)
+    elif status == "ready":
+        startupTimeline.mark("model ready")
+        uiBus.publish("statusbar", "message", "Emotion model ready (" + str(round(seconds, 1)) + " s)")
+    elif status.startswith("failed"):
+        uiBus.publish("statusbar", "message", "Emotion model could not be loaded: " + status[len("failed: "):])
+    else:
+        uiBus.publish("statusbar", "message", "Emotion model " + status + "...")
+
+# This function runs on a FER worker thread every time a frame has been scored
+def Update_Emotion(result):
+    if result.emotion is None: # no face is detected
+        uiBus.setText("emotionMagLabel", "Emotion Magnitude: " + "N/A") # Magnitude of emotion is unavailabe since no face is detected
+        uiBus.setText("emotionTypeLabel", "  Current Emotion: " + "N/A") # Type of emotion is unavailabe since no face is detected
+        liveStats.publish(emotion=None, score=None)
+        return
+
+    emotion, score = result.emotion, result.score
+    if startupTimeline.mark("first emotion"): # the first emotion since launch, startup is complete
+        Report_Startup()
+    uiBus.setText("emotionMagLabel", "Emotion Magnitude: " + str(score)) # Output the magnitude of emotion to GUI
+    uiBus.setText("emotionTypeLabel", "  Current Emotion: " + emotion) # Output the type of emotion to GUI
+    liveStats.publish(emotion=emotion, score=score)
+
+# This function runs whenever a new frame arrives, at most once per screen refresh. The frame has already been
+# scaled, mirrored and converted on the video thread, so all that is left is to copy it into a pixmap
+def Update_Image(image, index):
+    with metrics.stage("update_image", gui=True):
+        UI.lblOutput.setPixmap(QtGui.QPixmap.fromImage(image)) # fromImage copies the pixels, so the buffer can be reused
+    renderer.release(index) # let the video thread write into this buffer again
+    renderer.setTargetSize(UI.lblOutput.width(), UI.lblOutput.height()) # keep the rendered size matched to lblOutput
+
+# This function runs whenever the Mirror Video button is toggled
+def Set_Mirror(checked):
+    renderer.mirror = checked # the video thread mirrors the frames from now on
 #----------------------------------END FACIAL RECOGNITION THREAD----------------------------------------------------------
 
 #========================================= WEB SERVER ====================================================================
 class FlaskServer(QThread):
-    app = flask.Flask(__name__) # instantiate the flask application
-    app.config["DEBUG"] = False # Set DEBUG to False so others can access the web server
+    app = None # the flask application, built by Build_Web_App() before the server is first started
+
+    # A fresh server for every start, so the thread can be stopped and started again
+    def start(self):
+        from web_server import ServerRunner
+        self.server = ServerRunner(self.app, host='0.0.0.0', port=webServerPort, threads=webServerThreads) # Allow anyone on the network to connect to the web server
+        super().start()
 
     def run(self):
-       self.app.run(host='0.0.0.0') # Allow anyone on the network to connect to the web server
+       self.server.serve() # returns once Stop_Server() is called
+
+    # Stop accepting requests, close the clients' keep-alive connections and let run() return, safe to call from any
+    # thread. Waits at most timeout seconds, returns True when the server stopped in time
+    def Stop_Server(self, timeout=2.0):
+        return self.server.stop(timeout)
+
+# Build the web application: the ah-counter's routes, /metrics and the other rooms' /sessions. Called by
+# Start_Services(), so Flask has already been imported on the warm-up thread
+def Build_Web_App():
+    global sessionManager # access global sessionManager variable
+    import flask
+    from session_server import SessionManager, registerSessionRoutes, textError, colorError
+    app = flask.Flask(__name__) # instantiate the flask application
+    app.config["DEBUG"] = False # Set DEBUG to False so others can access the web server
 
     @app.route('/', methods=['GET'])
     def Home():
@@ -120,234 +187,277 @@ class FlaskServer(QThread):
 
     @app.route('/set_text', methods=['POST']) # run Set_Text when the client requests to post to http://10.0.2.5:5000/set_text
     # This function will update the text fields for the server gui
-    def Set_Text(): 
-        global isSpeaking 
-        global ahCounter
-        UI.statusbar.showMessage(flask.request.json['status']) # Get the text for the field 'status'
-        if ahCounter == None:
-            prevCount = 0
-        else:
-            prevCount = int(ahCounter)
-        ahCounter = flask.request.json['ahCount'] # set ahCounter from client input
-        UI.ahCountLabel.setText("Ah Count: " + ahCounter) # Get the text for the field 'ahCount'
-        if isSpeaking and prevCount < int(ahCounter): # only play the audio to ding the speaker if incrementing Ah-Counter and if they are speaking
-            playsound('ring.wav') # play audio to ding the speaker
-        return flask.jsonify(flask.request.json) # return json object
+    def Set_Text():
+        error = textError(flask.request.get_json(silent=True)) # a body the session cannot use
+        if error is not None:
+            return flask.jsonify(error=error), 400
+        if not session.setText(flask.request.json): # an older update that arrived after a newer one
+            return flask.jsonify(stale=True)
+        return flask.jsonify(flask.request.json) # return json object, the session shows the status and Ah Count through its events
 
     @app.route('/set_color', methods=['POST']) # run Set_Color when the client requests to post to http://10.0.2.5:5000/set_color
     # This function will update the lblOutput colors, based upon the values set by the client
     def Set_Color():
-        redColorValue = flask.request.json['red'] # Get the current red rgb value from client
-        greenColorValue = flask.request.json['green'] # Get the current green rgb value from client
-        blueColorValue = flask.request.json['blue'] # Get the current blue rgb value from client
-        BG_Color = "rgb(" + str(redColorValue) + "," + str(greenColorValue) + "," + str(blueColorValue) + ");" # set the background variable to the values read in from client
-        FG_Color = "rgb(255,255,255);" # set the foreground variable to these values
-        UI.ahCountLabel.setStyleSheet("QLabel {background-color :" + BG_Color + "color : " + FG_Color + "}") # Set the colors of the QLabel widget using values from BG_Color and FG_Color
-        UI.redMagLabel.setText("Red:   " + str(redColorValue)) # Output the current value of red rgb background color from client
-        UI.greenMagLabel.setText("Green: " + str(greenColorValue)) # Output the current value of green rgb background color from client
-        UI.blueMagLabel.setText("Blue:  " + str(blueColorValue)) # Output the current value of blue rgb background color from client
+        error = colorError(flask.request.get_json(silent=True)) # a body the session cannot use
+        if error is not None:
+            return flask.jsonify(error=error), 400
+        if not session.setColor(flask.request.json): # an older update that arrived after a newer one
+            return flask.jsonify(stale=True)
         return flask.jsonify(flask.request.json) # return json object
+
+    registerMetricsRoutes(app, metrics) # /metrics for Prometheus, /trace for a Chrome trace, and every request timed
+    sessionManager = SessionManager(sessionFolder, idleSeconds=sessionIdleSeconds, videoSources=sessionVideoSources,
+                                    audioSources=sessionAudioSources, uploadFolder=sessionUploadFolder,
+                                    detectorFactory=Make_Detector, ferWorkers=ferWorkers)
+    registerSessionRoutes(app, sessionManager) # other rooms' speeches, each with its own state, under /sessions/<id>
+    return app
+
+# Show and stream the Ah Count, and ding the speaker when it went up. Called for the client's count and for the
+# fillers found in the transcript, from the web server and speech recognition threads
+def Show_Ah_Count(total, increased):
+    uiBus.setText("ahCountLabel", "Ah Count: " + str(total)) # Get the text for the field 'ahCount'
+    liveStats.publish(ahCount=total)
+    if session.speaking and increased: # only play the audio to ding the speaker if the Ah Count went up and they are speaking
+        cueEngine.play('ding') # ding the speaker, mixed over any ding still ringing, without holding up the reply
+
+# This function runs when the ah-counter client sends its status text
+def Show_Status(status):
+    uiBus.publish("statusbar", "message", status)
+
+# This function runs when the ah-counter client sends a colour, [red, green, blue]
+def Show_Color(color):
+    redColorValue, greenColorValue, blueColorValue = color
+    BG_Color = "rgb(" + str(redColorValue) + "," + str(greenColorValue) + "," + str(blueColorValue) + ");" # set the background variable to the values read in from client
+    FG_Color = "rgb(255,255,255);" # set the foreground variable to these values
+    uiBus.setStyle("ahCountLabel", "QLabel {background-color :" + BG_Color + "color : " + FG_Color + "}") # Set the colors of the QLabel widget using values from BG_Color and FG_Color
+    uiBus.setText("redMagLabel", "Red:   " + str(redColorValue)) # Output the current value of red rgb background color from client
+    uiBus.setText("greenMagLabel", "Green: " + str(greenColorValue)) # Output the current value of green rgb background color from client
+    uiBus.setText("blueMagLabel", "Blue:  " + str(blueColorValue)) # Output the current value of blue rgb background color from client
 #-------------------------------------END WEB SERVER THREAD--------------------------------------------------
 
 #=======================================SPEECH RECOGNITION==================================================
-class SpeechRecognitionThread(QThread):
-
-    def run(self):
-        # obtain audio from the microphone
-        phraseTimeLimit = 5 # the amount of time, in seconds to record speaking audio from microphone
-        speechRate = 0 # current speech rate of the speaker
-        totalNumWords = 0 # total number of words speaker says
-        global isSpeaking # use global isSpeaking variable
-
-        # This will be used to calculate words per minute
-        speechRateMultiplier = 60 / phraseTimeLimit # 60 seconds / phraseTimeLimit in seconds. 
-        UI.speechOutputLabel.setText("Start speech once your voice is recognized. OR Simply say 'Start Speech'!") # output text to speechOutputLabel
-
-        # obtain audio from the microphone
-        r = sr.Recognizer()
-        #r.energy_threshold = 100 # energy threshold of microphone to determine what volume is considered speaking or not
-
-        # This will be used to calculate words per minute
-        speechRateMultiplier = 60 / phraseTimeLimit # 60 seconds / phraseTimeLimit in seconds. 
-
-        m = sr.Microphone() # instantiate a microphone variable
-        pyAudio = pyaudio.PyAudio() # instantiate a pyaudio variable to see what microphones are available
-        print(pyAudio.get_device_count()) # output to terminal the number of microphones available **debugging purposes only**
-        print(m.list_microphone_names()) # output to terminal the names of the availabel microphones **debugging purposes only**
-
-        # Test speech recognition using Google API
-        while True:
-            with sr.Microphone() as source:
-                audio = r.listen(source, phrase_time_limit=phraseTimeLimit)
-            # recognize speech using Google Speech Recognition
-            try:
-                # for testing purposes, we're just using the default API key
-                # to use another API key, use `r.recognize_google(audio, key="GOOGLE_SPEECH_RECOGNITION_API_KEY")`
-                # instead of `r.recognize_google(audio)`
-                googleRecognizedAudio = r.recognize_google(audio)
-                #print("Google Speech Recognition thinks you said: " + googleRecognizedAudio)
-                res = len(str(googleRecognizedAudio).split())
-                if ("start speech" in googleRecognizedAudio) and (isSpeaking == False): # if user says "start speech", have the startBtn clicked to start speech
-                    UI.startBtn.click() # click the start button
-                if ("stop speech" in googleRecognizedAudio) and isSpeaking: # if the user says "stop speech", have the stopBtn clicked to stop speech
-                    UI.stopBtn.click() # click the stop button
-                    
-                speechRate = res * speechRateMultiplier # calculate speech rate as words per minute (w/m) or (wpm)
-                UI.speechOutputLabel.setText("You said: " + googleRecognizedAudio) # Output the recognized audio
-                UI.numWordsLabel.setText("# Words: " + str(res)) # output number of words said
-                UI.speechRateLabel.setText("Speech Rate: " + str(speechRate) + "wpm") # output current speech rate
-                totalNumWords = totalNumWords + res # calculate total number of words said in speech so far
-                speechRateSamples.append(speechRate) # keep track of the speechRate samples we have calculated
-            except sr.UnknownValueError: # if audio is unrecognizable
-                UI.speechOutputLabel.setText("Google Speech Recognition could not understand audio")
-                UI.numWordsLabel.setText("# Words: N/A")
-                UI.speechRateLabel.setText("Speech Rate: 0 wpm")
-            except sr.RequestError as e: # if bad internet connection or if Google's API is unavailable
-                UI.speechOutputLabel.setText("Could not request results from Google Speech Recognition service; {0}".format(e))
-                UI.numWordsLabel.setText("# Words: N/A")
-                UI.speechRateLabel.setText("Speech Rate: 0 wpm")
+# The microphone stays open for the whole session. The session's speech thread records and splits the audio into
+# phrases, and each phrase is recognised on a worker thread, so nothing is missed while a recognition is in flight
+
+# This function runs every 250 ms with the speaking rate measured locally from the microphone audio
+def Update_Local_Rate(stats):
+    if speechRateSource == "local":
+        uiBus.setText("speechRateLabel", "Speech Rate: " + str(stats["wordsPerMinute"]) + "wpm")
+        liveStats.publish(wpm=stats["wordsPerMinute"])
+
+# This function runs every time a phrase has been recognised, in the order the phrases were spoken
+def Update_Speech(result):
+    if result.text is None:
+        import speech_recognition as sr # already loaded by the speech pipeline
+        if isinstance(result.error, sr.RequestError): # if bad internet connection or if the recognizer is unavailable
+            uiBus.setText("speechOutputLabel", "Could not request results from " + speechBackendName + " service; {0}".format(result.error))
+        else: # if audio is unrecognizable
+            uiBus.setText("speechOutputLabel", speechBackendName + " could not understand audio")
+        uiBus.setText("numWordsLabel", "# Words: N/A")
+        uiBus.setText("speechRateLabel", "Speech Rate: 0 wpm")
+        return
+
+    speechRate = round(result.wordsPerMinute(), 1) # words per minute (w/m) or (wpm) over the time the phrase actually took
+    uiBus.setText("speechOutputLabel", "You said: " + result.text) # Output the recognized audio
+    uiBus.setText("numWordsLabel", "# Words: " + str(result.wordCount())) # output number of words said
+    if speechRateSource == "transcript":
+        uiBus.setText("speechRateLabel", "Speech Rate: " + str(speechRate) + "wpm (live: " + str(session.localWpm) + "wpm)") # output current speech rate
+        liveStats.publish(wpm=speechRate)
+
+# This function runs for every voice command the speaker says
+def Voice_Command(command):
+    if command == "start speech" and not session.running: # if user says "start speech", have the startBtn clicked to start speech
+        uiBus.call(UI.startBtn.click) # click the start button
+    if command == "stop speech" and session.speaking: # if the user says "stop speech", have the stopBtn clicked to stop speech
+        uiBus.call(UI.stopBtn.click) # click the stop button
+    if command == "pause speech" and session.speaking: # if the user says "pause speech", hold the timer
+        pauseSpeech()
+    if command == "resume speech" and session.clock.paused(): # if the user says "resume speech", carry on timing
+        resumeSpeech()
 #--------------------------------END SPEECH RECOGNITION THREAD-----------------------------------------------
 
 #==========================================TIMER=============================================================
-class TimerThread(QThread):
-    def run(self):
-        greenThreshold = (UI.greenThreshMinBox.value() * 60) + (UI.greenThreshSecBox.value()) # Green threshold flag in seconds
-        yellowThreshold = (UI.yellowThreshMinBox.value() * 60) + (UI.yellowThreshSecBox.value()) # yellow threshold flag in seconds
-        redThreshold = (UI.redThreshMinBox.value() * 60) + (UI.redThreshSecBox.value()) # red threshold flag in seconds
-        speechTimeLimit = (UI.speechLimitMinBox.value() * 60) + (UI.speechLimitSecBox.value()) # Time limit in seconds
-        global isSpeaking # access global isSpeaking variable
-        isSpeaking = True # the speaker is now speaking
-        global t # access global time variable 
-        while t <= speechTimeLimit: # while under the speech time limit
-            mins, secs = divmod(t, 60) # convert t to seconds and minutes
-            if greenThreshold <= t and t < yellowThreshold: # time for green flag?
-                UI.timeLeftLabel.setStyleSheet("background-color: green")
-                UI.timerLabel.setStyleSheet("background-color: green")
-            elif yellowThreshold <= t and t < redThreshold: # time for yellow flag?
-                UI.timeLeftLabel.setStyleSheet("background-color: yellow") 
-                UI.timerLabel.setStyleSheet("background-color: yellow")
-            elif redThreshold <= t: # time for red flag?
-                UI.timeLeftLabel.setStyleSheet("background-color: red")
-                UI.timerLabel.setStyleSheet("background-color: red")
-            timer = '{:02d}:{:02d}'.format(mins, secs) # convert timer values to a string
-            UI.timeLeftLabel.setText(timer) # output the current timer values to GUI
-            time.sleep(1) # wait 1 second
-            t += 1 # add one to timer variable
-        UI.timeLeftLabel.setText("Limit\nReached") #output to GUI that time limit has been reached
-        isSpeaking = False # speaker is no longer speaking
+# The session fires the flag and time limit events exactly when they are due on its clock, and ticks once a second.
+# Nothing adds up sleeps, so the timer cannot drift, and pausing the clock holds it
+
+# Read the thresholds from the speech settings page, before the speech is started
+def Read_Settings():
+    greenThreshold = (UI.greenThreshMinBox.value() * 60) + (UI.greenThreshSecBox.value()) # Green threshold flag in seconds
+    yellowThreshold = (UI.yellowThreshMinBox.value() * 60) + (UI.yellowThreshSecBox.value()) # yellow threshold flag in seconds
+    redThreshold = (UI.redThreshMinBox.value() * 60) + (UI.redThreshSecBox.value()) # red threshold flag in seconds
+    speechTimeLimit = (UI.speechLimitMinBox.value() * 60) + (UI.speechLimitSecBox.value()) # Time limit in seconds
+    session.setThresholds(greenThreshold, yellowThreshold, redThreshold, speechTimeLimit)
+
+def Show_Time(due):
+    mins, secs = divmod(int(due), 60) # convert the session time to minutes and seconds
+    uiBus.setText("timeLeftLabel", '{:02d}:{:02d}'.format(mins, secs)) # output the current timer values to GUI
+    liveStats.publish(elapsed=int(due))
+
+# Runs once when a threshold is crossed, so the stylesheets are only set when the flag actually changes
+def Show_Flag(flag, due):
+    uiBus.setStyle("timeLeftLabel", "background-color: " + flag)
+    uiBus.setStyle("timerLabel", "background-color: " + flag)
+    if timerCues:
+        cueEngine.play(flag)
+    liveStats.publish(flag=flag)
+
+# The session has stopped recording, the speaker is no longer speaking
+def Limit_Reached(due):
+    uiBus.setText("timeLeftLabel", "Limit\nReached") #output to GUI that time limit has been reached
+    if timerCues:
+        cueEngine.play("limit")
+    liveStats.publish(speaking=False, elapsed=int(due), flag="limit")
 #--------------------------------------END TIMER THREAD-----------------------------------------------
 
 #==========================================FILE I/O===================================================
-def saveReport(totalAvgSpeechRate, topEmotion, leastEmotion, mins, secs):
-    global ahCounter # access global ahCount variable
-    reportFile = open("ToastMaster Report.txt", "w+") # open file in writing mode (overwrite if file already exists)
-
-    # The follow .write statements will write the contents of the report to the "ToastMaster Report.txt" file
-    reportFile.write("===========TOASTMASTERS' TOOLBOX REPORT===========\n")
-    reportFile.write("   Average Words per Minute: " + str(totalAvgSpeechRate) + "\n")
-    reportFile.write("  Your Most Used Emotion is: " + str(topEmotion) + "\n")
-    reportFile.write(" Your Least Used Emotion is: " + str(leastEmotion) + "\n")
-    reportFile.write("Number of Filler Words Used: " + ahCounter + "\n")
-    reportFile.write("              You Spoke for: " + str(mins) + " minutes, " + str(secs) + " seconds\n")
+# The report history is opened the first time it is needed, so the app does not touch it unless reports are used
+def getReportHistory():
+    global reportHistory # access global reportHistory variable
+    if reportHistory is None:
+        reportHistory = ReportHistory()
+    return reportHistory
+
+def saveReport():
+    global lastSummary # access global lastSummary variable
+    if lastSummary is None: # no report has been generated yet
+        return
+    speaker, ok = QtWidgets.QInputDialog.getText(UI, "Save Report", "Speaker's name:", text=lastSummary["speaker"]) # the history is kept per speaker
+    if not ok:
+        return
+    lastSummary["speaker"] = speaker.strip() or "Speaker"
+
+    reportFile = open(reportFileName, "w+") # open file in writing mode (overwrite if file already exists)
+    reportFile.write(reportText(lastSummary)) # write the contents of the report to the report text file
     reportFile.close() # close the file
+    getReportHistory().add(lastSummary) # save the full report as JSON and index it by speaker and date
+    uiBus.publish("statusbar", "message", "Report saved for " + lastSummary["speaker"])
 
 def importReport():
-    reportFile = open("Toastmaster Report.txt", "r") # open report file as read only
-    reportData = reportFile.read() # read in contents of file
+    if os.path.exists(reportFileName):
+        reportFile = open(reportFileName, "r") # open report file as read only
+        reportData = reportFile.read() # read in contents of file
+        reportFile.close() # close the file
+    else: # no text copy, fall back to the newest report in the history
+        summary = getReportHistory().latest()
+        reportData = reportText(summary) if summary is not None else "No saved reports found"
     UI.reportOutputLabel.setText(reportData) # output contents of file to GUI
-    reportFile.close() # close the file
 #------------------------------------END FILE I/0 METHODS-----------------------------------------
 
 #=====================================REPORTING METHODS==========================================
+# The report is kept up to date by the session while the speech is given, so this only reads the running totals
 def generateReport():
-    global ahCounter # access global ahCounter variable
-    global t # access global timer variable
-    if ahCounter == None: # if ahCounter is empty
-        ahCounter = "0" # set ahCounter to 0
-    sumSpeechRates = 0 # instantiate a variable to hold the summation of all the speech rates we have collected
-    for x in speechRateSamples: # loop through speechRateSamples vector
-        sumSpeechRates = x + sumSpeechRates # sum all the speech rate samples we have collected
-    if len(speechRateSamples) != 0: # if we have data in speech rate samples vector
-        totalAvgSpeechRate = sumSpeechRates / len(speechRateSamples) # calculate overall average of the vector of speech rate samples
-    elif len(speechRateSamples) == 0: # if no data in speech rate samples vector
-        totalAvgSpeechRate = 0 # set total average speech rate to 0
-
-    mins, secs = divmod(t, 60) # convert t to minutes and seconds
-    
-    topEmotion = emotionsList[emotionNum.index(max(emotionNum))] # Find index emotion that was used MOST from emotionNum list, and use that index to find most used emotion
-    leastEmotion = emotionsList[emotionNum.index(min(emotionNum))] # Find index emotion that was used LEAST from emotionNum list, and use that index to find most used emotion
-
-    # the follow code creates a long string of the report and its data that will then be passed to the GUI
-    outputText = "===========TOASTMASTERS' TOOLBOX REPORT===========\n"
-    outputText = outputText + "   Average Words per Minute: " + str(totalAvgSpeechRate) + "\n"
-    outputText = outputText + "   Your Top Used Emotion is: " + str(topEmotion) + "\n"
-    outputText = outputText + " Your Least Used Emotion is: " + str(leastEmotion) + "\n"
-    outputText = outputText + "Number of Filler Words Used: " + ahCounter + "\n"
-    outputText = outputText + "              You Spoke for: " + str(mins) + " minutes, " + str(secs) + " seconds\n"
-
-    UI.reportOutputLabel.setText(outputText) # output Report to reportOutputLabel
-    UI.saveReportBtn.clicked.connect(lambda: saveReport(totalAvgSpeechRate,topEmotion,leastEmotion, mins, secs)) # connect saveReportBtn to saveReport function, and pass appropriate arguments
+    global lastSummary # access global lastSummary variable
+    lastSummary = session.summary() # how long the speaker talked, and how the audience reacted when there is an audience camera
+    UI.reportOutputLabel.setText(reportText(lastSummary)) # output Report to reportOutputLabel
 
 # go to the report page on GUI and generate the report
 def goReportPage():
     UI.stackedWidget.setCurrentIndex(UI.stackedWidget.currentIndex() + 1) # change GUI to report page
     terminateThreads() # terminate current threads
+    closeSessionLog() # finish the recording of the speech
     generateReport() # call the generateReport function to generate the report
 
 # cancel the current report and go back to speaking page on GUI
 def cancelReport():
-    global speechRateSamples # access global speechRateSamples vector
-    speechRateSamples = [] # empty the vector
     UI.stackedWidget.setCurrentIndex(UI.stackedWidget.currentIndex() - 1) # go back to speaking page on GUI
     webServerThread.start() # Begin web server thread
-    FER_Thread.start() # Begin facial expression recognition thread
-    SR_Thread.start()  # Begin speech recognition thread
+    openDevices() # Begin facial expression recognition, speech recognition and the audience camera again
 #--------------------------------END REPORTING METHODS-----------------------------------------------
 
 #==============================GENERIC APPLICATION METHODS======================================
+# Runs on the GUI thread uiRefreshRate times a second and applies everything the worker threads published since the
+# last time, in one batch
+def Apply_UI_Updates():
+    with metrics.stage("ui_apply", gui=True):
+        uiBus.apply(UI)
+
 def startSpeech():
-    Timer_Thread.start() # Begin timing, now that the speech has started
-    global isSpeaking # access global isSpeaking variable
-    isSpeaking = True # the speaker is now speaking
+    if traceSpeeches:
+        metrics.tracer.start() # trace every timed stage until the speech stops
+    Read_Settings() # get the flag thresholds and time limit from the settings page
+    session.start(time.strftime("Speech %Y-%m-%d %H-%M-%S.tmlog")) # the speech starts now: clock, recording and timer
+    liveStats.publish(speaking=True)
     UI.stackedWidget_2.setCurrentIndex(UI.stackedWidget_2.currentIndex() + 1) # change start button to stop button on GUI
 
 def stopSpeech():
-    global isSpeaking #access global isSpeaking variable
-    isSpeaking = False # the speaker is no longer speaking
+    liveStats.publish(speaking=False)
     UI.stackedWidget_2.setCurrentIndex(UI.stackedWidget_2.currentIndex() - 1) # change stop button to start button on GUI
     terminateThreads() # terminate all the running threads
+    closeSessionLog() # finish the recording of the speech
+
+# Hold the timer, e.g. while the speech is interrupted. The flags and time limit wait for the clock to resume
+def pauseSpeech():
+    if session.pause():
+        uiBus.publish("statusbar", "message", "Speech paused, say 'resume speech' to carry on")
+
+def resumeSpeech():
+    if session.resume():
+        uiBus.publish("statusbar", "message", "Speech resumed")
+
+# Start the camera, microphone and audience camera. They run before the speech starts, for the preview and so the
+# speaker can say 'start speech'
+def openDevices():
+    # through the bus like the recognised text, so the bus always knows what the label shows
+    uiBus.setText("speechOutputLabel", "Start speech once your voice is recognized. OR Simply say 'Start Speech'!")
+    session.open()
+
+# Runs on the GUI thread once the window is on screen. Everything that takes a while starts from here, so the window
+# never waits for it, and each part starts as soon as what it needs is ready rather than after a fixed delay
+def Window_Shown():
+    startupTimeline.mark("window")
+    ferWarmup.start() # import the libraries, then load and warm up the emotion model, in the background
+
+# Runs on the GUI thread once the warm-up thread has imported startupModules, so nothing here waits on an import
+def Start_Services():
+    Build_Session() # set up the speech
+    FlaskServer.app = Build_Web_App()
+    webServerThread.start() # Begin web server thread
+    if liveStatsPort is not None and not liveStats.start(): # Begin streaming the live stats to observers
+        uiBus.publish("statusbar", "message", "Live stats are off, port " + str(liveStatsPort) + " could not be opened")
+    sessionManager.startReaper() # close and save sessions nobody uses any more
+    openDevices() # the preview starts with the camera, the FER workers start scoring once the model is ready
+    UI.startBtn.setEnabled(True) # there is a session to start now
+    UI.generateReportBtn.setEnabled(True)
+
+# Log and show how long startup took, and make it available on /metrics
+def Report_Startup():
+    startupSeconds = metrics.registry.gauge("toastmaster_startup_seconds", "Seconds from launch to each startup milestone")
+    for milestone, seconds in startupTimeline.marks():
+        startupSeconds.set(seconds, milestone=milestone)
+    logger.info(startupTimeline.report())
+    uiBus.publish("statusbar", "message", startupTimeline.report())
 
 def setSpeechSettings():
-    # The time threshold and limit settings will be set once the Timer_Thread Begins running
+    # The time threshold and limit settings are read when the speech starts
     UI.stackedWidget.setCurrentIndex(UI.stackedWidget.currentIndex() + 1)
 
 # This will quit the application when called
 def Quit():
     terminateThreads() # terminate all the running threads
+    closeSessionLog() # finish the recording of the speech, if there is one
+    liveStats.stop() # close the observers' streams
+    if sessionManager is not None:
+        sessionManager.closeAll() # save the speeches running in other rooms
+    cueEngine.close() # close the audio output
     App.quit()
 
-def terminateThreads():
-    if (FER_Thread.isRunning()): # check if Facial Expression Recognition thread is running
-        print("FER was running")
-        FER_Thread.requestInterruption() # if running, kill it
-        FER_Thread.wait()
+# End the speech, which flushes its recording to disk and stops recording
+def closeSessionLog():
+    if session is None: # the window closed before the session was built
+        return
+    running = session.running
+    session.stop() # the elapsed time stays where it is for the report
+    if metrics.tracer.recording and running: # save the speech's trace next to its log
+        metrics.tracer.stop()
+        metrics.tracer.dump(os.path.splitext(session.logPath)[0] + ".trace.json")
 
+def terminateThreads():
     if (webServerThread.isRunning()): # check if Flask Server thread is running
-        print("Web Server Thread was running")
-        webServerThread.terminate() # if running, kill it
-        webServerThread.wait()
-
-    if(SR_Thread.isRunning()): # check if Speech Recognition thread is running
-        print("Speech Recogntion Thread was running")
-        SR_Thread.requestInterruption()
-        SR_Thread.terminate() # if running, kill it
-        SR_Thread.wait()
-    
-    if(Timer_Thread.isRunning()): # check is Timer Thread is running
-        print("Timer Thread was running")
-        Timer_Thread.requestInterruption()
-        Timer_Thread.terminate() # if running, kill it
-        Timer_Thread.wait()
+        webServerThread.Stop_Server() # stop serving and close the clients' connections
+        webServerThread.wait(2000) # never hold up the window for long, the connections have been closed already
+
+    if session is not None and session.devicesOpen: # check if the video, speech recognition and audience threads are running
+        session.closeDevices() # the capture loops check this between frames and audio chunks
 #--------------------------------END APPLICATION METHODS-----------------------------------------------
 
 
@@ -358,23 +468,63 @@ UI.actionQuit.triggered.connect(Quit) # Connect Quit() method to actionQuit, and
 UI.generateReportBtn.clicked.connect(goReportPage) # connect Generate Report button click to goReportPage() function
 UI.cancelBtn.clicked.connect(cancelReport) # connect Cancel button to cancelReport() function
 UI.importReportBtn.clicked.connect(importReport) # connect Import Report button to importReport() function
+UI.saveReportBtn.clicked.connect(saveReport) # connect Save Report button to saveReport() function
 UI.startBtn.clicked.connect(startSpeech) # connect Start button to startSpeech() function
 UI.stopBtn.clicked.connect(stopSpeech) # coneect Stop button to stopSpeech() function
 UI.enterBtn.clicked.connect(setSpeechSettings) # connect Enter button to setSpeechSettings()
 
 UI.show() # Display the GUI
 
-FER_Thread = VideoThread() # instantiate a new VideoThread
-FER_Thread.new_frame_signal.connect(Update_Image) # When a new frame arrives, run Update_Image() method
+uiTimer = QtCore.QTimer() # applies the widget changes published by the worker threads
+uiTimer.timeout.connect(Apply_UI_Updates)
+uiTimer.start(int(1000 / uiRefreshRate))
+
+videoPreview = VideoPreview() # turns captured frames into images for lblOutput
+videoPreview.new_frame_signal.connect(Update_Image) # When a new frame arrives, run Update_Image() method
+cueEngine = openCueEngine() # one audio output for every cue, open for the whole session
+cueEngine.load("ding", "ring.wav") # decoded once, played from memory
+for cue, frequency in timerCueTones.items():
+    cueEngine.add(cue, toneCue(frequency, seconds=0.6 if cue == "limit" else 0.25))
 UI.ahCountLabel.setText("Ah Counter Disconnected") # Set the initial text in lblOutput to indicate no client is connected
+UI.emotionTypeLabel.setText("  Current Emotion: loading model...") # until the emotion model is ready
+UI.startBtn.setEnabled(False) # until Start_Services() has built the session
+UI.generateReportBtn.setEnabled(False)
+startupModules = ("cv2", "speech_recognition", "flask", "speech_core", "speech_pipeline", "frame_renderer", "web_server",
+                  "session_server") # imported on the warm-up thread before the model is built, see Start_Services
+ferWarmup = ModelWarmup(buildFer, onStatus=Show_Model_Status, preload=startupModules) # builds and warms up the FER model off the GUI thread
 webServerThread = FlaskServer() # instantiate a thread of FlaskServer
-SR_Thread = SpeechRecognitionThread() # instantiate a thread of SpeechRecognitionThread
-Timer_Thread = TimerThread() # instantiate a thread of TimerThread
-
-webServerThread.start() # Begin web server thread
-time.sleep(2) # wait 2 seconds
-FER_Thread.start() # Begin facial expression recognition thread
-time.sleep(3) # wait 3 seconds
-SR_Thread.start() # Begin speech recognition thread
 
-sys.exit(App.exec_()) # Exit 
\ No newline at end of file
+# The speech this window coaches. Its events arrive on the session's worker threads, and every handler only
+# publishes to the UI bus, the live stats stream or the audio cues. Built by Start_Services(), once OpenCV and
+# SpeechRecognition have been imported on the warm-up thread
+def Build_Session():
+    global session, renderer, speechBackendName # access global session, renderer and speechBackendName variables
+    from speech_core import SpeechSession
+    from speech_pipeline import BACKENDS
+    from frame_renderer import FrameRenderer
+    speechBackendName = BACKENDS[speechBackend].name
+    renderer = FrameRenderer(maxFps=App.primaryScreen().refreshRate()) # prepares preview frames on the video thread
+    renderer.setTargetSize(UI.lblOutput.width(), UI.lblOutput.height())
+    UI.mirrorToggle.toggled.connect(Set_Mirror) # mirror the preview when the Mirror Video button is toggled
+    session = SpeechSession("local", folder=sessionLogFolder, video=videoSource, audio=audioSource, audience=audienceSource,
+                            backend=speechBackend, rateSource=speechRateSource, detectorFactory=Make_Detector,
+                            audienceDetectorFactory=Make_Audience_Detector, ferWorkers=ferWorkers, speechWorkers=speechWorkers,
+                            fillerLexicon=fillerLexicon, ahMergePolicy=ahMergePolicy, audienceMaxFaces=audienceMaxFaces,
+                            loopVideo=True, metrics=metrics)
+    session.on("frame", videoPreview.Render_Frame) # every camera frame to the preview
+    session.on("videoStats", Show_Video_Stats)
+    session.on("emotion", Update_Emotion)
+    session.on("audience", Update_Audience)
+    session.on("speech", Update_Speech)
+    session.on("localRate", Update_Local_Rate)
+    session.on("command", Voice_Command)
+    session.on("ahCount", Show_Ah_Count)
+    session.on("status", Show_Status)
+    session.on("color", Show_Color)
+    session.on("tick", Show_Time)
+    session.on("flag", Show_Flag)
+    session.on("limit", Limit_Reached)
+
+QtCore.QTimer.singleShot(0, Window_Shown) # start everything else once the event loop is running and the window is up
+
+sys.exit(App.exec_()) # Exit
@@ -0,0 +1,225 @@
+import threading
+
+import numpy
+
+from emotion_batch import classifyFaces
+from emotion_store import EMOTIONS
+
+#================================ AUDIENCE ANALYSIS =========================================================
+# Audience-reaction mode: every face in a frame of the audience camera is found, the largest maxFaces are kept, and
+# their crops are classified in one forward pass of FER's emotion CNN. Plugs into FramePipeline as its analyse() step.
+
+# One analysed audience frame. scores is the mean of every face's scores, so FramePipeline's EmotionResult reports the
+# audience's overall emotion; faces is [(box, scores array)] for every face kept, largest first
+class AudienceFrame:
+    __slots__ = ("scores", "faces")
+
+    def __init__(self, scores, faces):
+        self.scores = scores
+        self.faces = faces
+
+
+class AudienceAnalyzer:
+    # maxFaces: most faces classified per frame, the largest (nearest) ones are kept
+    # minFaceSize: faces narrower or shorter than this many pixels are too small to classify reliably and are skipped
+    def __init__(self, maxFaces=16, minFaceSize=24):
+        self.maxFaces = max(1, int(maxFaces))
+        self.minFaceSize = minFaceSize
+
+    # FramePipeline analyse step: returns an AudienceFrame, or None when nobody is in the frame
+    def analyse(self, detector, frame):
+        boxes = [tuple(int(v) for v in box) for box in detector.find_faces(frame, bgr=True)]
+        boxes = [box for box in boxes if box[2] >= self.minFaceSize and box[3] >= self.minFaceSize]
+        if not boxes:
+            return None
+        boxes = sorted(boxes, key=lambda box: box[2] * box[3], reverse=True)[:self.maxFaces]
+        scores = classifyFaces(detector, [frame], [boxes]) # every face in one forward pass
+        mean = scores.mean(axis=0)
+        return AudienceFrame({emotion: round(float(score), 2) for emotion, score in zip(EMOTIONS, mean)},
+                             list(zip(boxes, scores)))
+#--------------------------------END AUDIENCE ANALYSIS-----------------------------------------------
+
+
+#================================ FACE IDS ==================================================================
+# Gives every audience member a stable id from frame to frame. Each new box is matched to the track whose last box it
+# overlaps most (intersection over union), best matches first; a box that overlaps nothing starts a new track, and a
+# track that has not been seen for maxMissed analysed frames is forgotten.
+
+def overlap(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    width = min(ax + aw, bx + bw) - max(ax, bx)
+    height = min(ay + ah, by + bh) - max(ay, by)
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = float(width * height)
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+class FaceIdTracker:
+    def __init__(self, minOverlap=0.3, maxMissed=15):
+        self.minOverlap = minOverlap
+        self.maxMissed = maxMissed
+        self.tracks = {} # id -> [last box, analysed frames since it was last seen]
+        self.nextId = 0
+
+    # Ids for boxes, in the same order
+    def assign(self, boxes):
+        pairs = sorted(((overlap(track[0], box), faceId, index) for faceId, track in self.tracks.items()
+                        for index, box in enumerate(boxes)), reverse=True)
+        ids = [None] * len(boxes)
+        taken = set()
+        for score, faceId, index in pairs:
+            if score < self.minOverlap:
+                break
+            if faceId in taken or ids[index] is not None:
+                continue
+            ids[index] = faceId
+            taken.add(faceId)
+        for index, box in enumerate(boxes):
+            if ids[index] is None:
+                ids[index] = self.nextId
+                self.nextId += 1
+            self.tracks[ids[index]] = [box, 0]
+        for faceId in list(self.tracks):
+            if faceId not in ids:
+                self.tracks[faceId][1] += 1
+                if self.tracks[faceId][1] > self.maxMissed:
+                    del self.tracks[faceId]
+        return ids
+
+    def reset(self):
+        self.tracks = {}
+        self.nextId = 0
+#--------------------------------END FACE IDS-----------------------------------------------
+
+
+#================================ AUDIENCE STATISTICS =======================================================
+# Running audience totals for the report: how every face's emotion was distributed, how many people were watching
+# (at most and on average, per frame) and the top emotion of each face still in view. Fed from FramePipeline's
+# onEmotion callback, which hands results on in frame order, so the face ids are assigned in order too.
+
+class AudienceStats:
+    def __init__(self, maxFaces=16):
+        self.lock = threading.Lock()
+        self.tracker = FaceIdTracker()
+        self.maxFaces = maxFaces
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.tracker.reset()
+            self.frames = 0 # analysed audience frames
+            self.faceObservations = 0 # faces classified, summed over every frame
+            self.peakFaces = 0
+            self.topCounts = numpy.zeros(len(EMOTIONS), dtype=numpy.int64) # face observations each emotion topped
+            self.scoreSums = numpy.zeros(len(EMOTIONS), dtype=numpy.float64)
+            self.perFace = {} # face id -> top emotion counts of that audience member, only for the faces still tracked
+            self.latestFaces = [] # (id, box, top emotion) of the last frame, for drawing or streaming
+
+    # Add one FramePipeline result (an EmotionResult whose faces came from AudienceAnalyzer). Returns the face ids
+    def update(self, result):
+        faces = result.faces or []
+        with self.lock:
+            ids = self.tracker.assign([box for box, scores in faces])
+            self.frames += 1
+            self.faceObservations += len(faces)
+            self.peakFaces = max(self.peakFaces, len(faces))
+            latest = []
+            for faceId, (box, scores) in zip(ids, faces):
+                top = int(numpy.argmax(scores))
+                self.topCounts[top] += 1
+                self.scoreSums += scores
+                counts = self.perFace.get(faceId)
+                if counts is None:
+                    counts = self.perFace[faceId] = numpy.zeros(len(EMOTIONS), dtype=numpy.int64)
+                counts[top] += 1
+                latest.append((faceId, box, EMOTIONS[top]))
+            self.latestFaces = latest
+            for faceId in [faceId for faceId in self.perFace if faceId not in self.tracker.tracks]:
+                del self.perFace[faceId] # the face has left (or was a false detection), so this never grows with time
+        return ids
+
+    # Share of face observations per top emotion, 0 to 1
+    def distribution(self):
+        with self.lock:
+            total = max(1, int(self.topCounts.sum()))
+            return {emotion: round(int(count) / float(total), 3) for emotion, count in zip(EMOTIONS, self.topCounts)}
+
+    def summary(self):
+        distribution = self.distribution()
+        with self.lock:
+            observations = max(1, self.faceObservations)
+            return {
+                "frames": self.frames,
+                "averageFaces": round(self.faceObservations / float(max(1, self.frames)), 2),
+                "peakFaces": self.peakFaces,
+                "maxFacesPerFrame": self.maxFaces,
+                "emotionDistribution": distribution,
+                "meanEmotionScores": {emotion: round(float(total) / observations, 4)
+                                      for emotion, total in zip(EMOTIONS, self.scoreSums)},
+                "topEmotion": EMOTIONS[int(self.topCounts.argmax())] if self.faceObservations else "N/A",
+                "faceTopEmotions": {str(faceId): EMOTIONS[int(counts.argmax())] for faceId, counts in self.perFace.items()},
+            }
+#--------------------------------END AUDIENCE STATISTICS-----------------------------------------------
+
+
+# Frame with `count` faces laid out on a grid like rows of seats. Each face is a bright block whose brightness picks the
+# stub detector's emotion
+def makeAudienceFrame(count, width=1280, height=720, faceSize=48, shift=0):
+    frame = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+    columns = max(1, int(numpy.ceil(numpy.sqrt(count * width / float(height)))))
+    cellWidth = width // columns
+    cellHeight = height // max(1, int(numpy.ceil(count / float(columns))))
+    for i in range(count):
+        x = (i % columns) * cellWidth + (cellWidth - faceSize) // 2 + shift
+        y = (i // columns) * cellHeight + (cellHeight - faceSize) // 2
+        frame[y:y + faceSize, x:x + faceSize] = 60 + (i * 37) % 190
+    return frame
+
+
+# Throughput against audience size, on the CPU, with every face classified in one forward pass and, for comparison,
+# one forward pass per face. Uses the real FER model with --fer, otherwise the stub detector.
+# python audience.py [--faces 1 2 4 8 16 32] [--seconds 2] [--fer]
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Audience analysis throughput against the number of faces")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="faces per frame to try")
+    parser.add_argument("--seconds", type=float, default=2.0, help="how long to run each size")
+    parser.add_argument("--fer", action="store_true", help="use the real FER model instead of the stub detector")
+    args = parser.parse_args()
+
+    if args.fer:
+        from startup import buildFer
+        detector = buildFer()
+    else:
+        from batch_analyzer import StubDetector
+        detector = StubDetector()
+
+    def oneAtATime(detector, frame, boxes):
+        return numpy.concatenate([classifyFaces(detector, [frame], [[box]]) for box in boxes])
+
+    print("faces   batched frames/s   faces/s   one-by-one frames/s   faces/s   speed-up")
+    for count in args.faces:
+        frame = makeAudienceFrame(count)
+        boxes = detector.find_faces(frame, bgr=True)
+        assert len(boxes) == count, (count, len(boxes))
+        def batched():
+            classifyFaces(detector, [frame], [detector.find_faces(frame, bgr=True)])
+
+        def separate():
+            oneAtATime(detector, frame, detector.find_faces(frame, bgr=True))
+
+        rates = []
+        for run in (batched, separate):
+            run() # first call outside the timing
+            frames = 0
+            startTime = time.perf_counter()
+            while time.perf_counter() - startTime < args.seconds:
+                run()
+                frames += 1
+            rates.append(frames / (time.perf_counter() - startTime))
+        print(str(count).rjust(5) + ("%.1f" % rates[0]).rjust(19) + ("%.0f" % (rates[0] * count)).rjust(10) +
+              ("%.1f" % rates[1]).rjust(22) + ("%.0f" % (rates[1] * count)).rjust(10) + ("%.2fx" % (rates[0] / rates[1])).rjust(11))
@@ -0,0 +1,272 @@
+import logging
+import threading
+import time
+import wave
+
+import numpy
+
+#================================ AUDIO CUES ===============================================================
+# Sound cues (the ah-counter ding, the timer's flag changes) are decoded once and mixed into one output stream that
+# stays open for the whole session, so cues overlap and start within one block. play() never blocks.
+# Sinks: PyAudioSink for the sound card, NullSink to throw the output away (or keep it), WaveFileSink to write a WAV.
+
+logger = logging.getLogger(__name__)
+
+# Read a 16-bit WAV file into a float32 array of shape (frames, channels) in [-1, 1], at sampleRate with channels
+def loadWav(path, sampleRate=48000, channels=2):
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(path + " is not a 16-bit WAV file")
+        fileRate = wav.getframerate()
+        fileChannels = wav.getnchannels()
+        data = numpy.frombuffer(wav.readframes(wav.getnframes()), dtype=numpy.int16)
+    samples = data.reshape(-1, fileChannels).astype(numpy.float32) / 32768.0
+    return conform(samples, fileRate, sampleRate, channels)
+
+
+# Resample (linear interpolation is plenty for short cues) and up/down-mix to the engine's format
+def conform(samples, fromRate, sampleRate, channels):
+    if fromRate != sampleRate and len(samples):
+        length = int(round(len(samples) * sampleRate / float(fromRate)))
+        positions = numpy.linspace(0, len(samples) - 1, length)
+        samples = numpy.stack([numpy.interp(positions, numpy.arange(len(samples)), samples[:, channel])
+                               for channel in range(samples.shape[1])], axis=1).astype(numpy.float32)
+    if samples.shape[1] != channels:
+        mono = samples.mean(axis=1, keepdims=True)
+        samples = numpy.repeat(mono, channels, axis=1)
+    return numpy.ascontiguousarray(samples, dtype=numpy.float32)
+
+
+# A short sine beep with a soft attack and release, for cues that have no sound file
+def toneCue(frequency, seconds=0.25, sampleRate=48000, channels=2, volume=0.4):
+    t = numpy.arange(int(seconds * sampleRate)) / float(sampleRate)
+    envelope = numpy.minimum(1.0, numpy.minimum(t, t[::-1]) / 0.01) # 10 ms fade in and out, no clicks
+    tone = (numpy.sin(2 * numpy.pi * frequency * t) * envelope * volume).astype(numpy.float32)
+    return numpy.repeat(tone[:, numpy.newaxis], channels, axis=1)
+
+
+# One cue that is playing
+class Voice:
+    __slots__ = ("samples", "position", "gain", "triggerTime")
+
+    def __init__(self, samples, gain):
+        self.samples = samples
+        self.position = 0 # next frame to mix
+        self.gain = gain
+        self.triggerTime = time.perf_counter()
+
+
+class CueMixer:
+    def __init__(self, channels=2, maxVoices=16):
+        self.channels = channels
+        self.maxVoices = maxVoices
+        self.lock = threading.Lock()
+        self.voices = [] # one Voice for every cue playing
+        self.startLatencies = [] # seconds from play() to the block its first sample was mixed into, most recent last
+        self.droppedCount = 0 # cues not played because maxVoices were already playing
+        self.peakVoices = 0
+
+    def add(self, samples, gain=1.0):
+        with self.lock:
+            if len(self.voices) >= self.maxVoices:
+                self.droppedCount += 1
+                return False
+            self.voices.append(Voice(samples, gain))
+            self.peakVoices = max(self.peakVoices, len(self.voices))
+            return True
+
+    # Mix the next `frames` frames of every playing cue. Returns int16 samples of shape (frames, channels)
+    def render(self, frames):
+        block = numpy.zeros((frames, self.channels), dtype=numpy.float32)
+        now = time.perf_counter()
+        with self.lock:
+            voices = list(self.voices)
+        finished = False
+        for voice in voices:
+            if voice.position == 0:
+                self.startLatencies = self.startLatencies[-255:] + [now - voice.triggerTime]
+            part = voice.samples[voice.position:voice.position + frames]
+            block[:len(part)] += part * voice.gain
+            voice.position += len(part)
+            finished = finished or voice.position >= len(voice.samples)
+        if finished:
+            with self.lock:
+                self.voices = [voice for voice in self.voices if voice.position < len(voice.samples)]
+        numpy.clip(block, -1.0, 1.0, out=block) # overlapping cues may add up past full scale
+        return (block * 32767.0).astype(numpy.int16)
+
+    def playing(self):
+        with self.lock:
+            return len(self.voices)
+
+
+# The sound card. The stream is opened once and PyAudio pulls a block from the mixer whenever it needs one
+class PyAudioSink:
+    def __init__(self, deviceIndex=None):
+        self.deviceIndex = deviceIndex
+        self.audio = None
+        self.stream = None
+
+    def start(self, render, sampleRate, channels, blockFrames):
+        import pyaudio # imported here so the other sinks work without it
+        self.audio = pyaudio.PyAudio()
+
+        def callback(inData, frameCount, timeInfo, status):
+            return render(frameCount).tobytes(), pyaudio.paContinue
+
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=channels, rate=sampleRate, output=True,
+                                      output_device_index=self.deviceIndex, frames_per_buffer=blockFrames,
+                                      stream_callback=callback)
+        self.stream.start_stream()
+
+    # Seconds between a block being handed over and it being heard
+    def outputLatency(self):
+        return self.stream.get_output_latency() if self.stream is not None else 0.0
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+
+
+# Pulls blocks like a sound card would, from its own thread and at the same pace (realtime=True), or only when
+# advance() is called (realtime=False, for exact tests). With keep=True every block is kept in self.blocks
+class NullSink:
+    def __init__(self, realtime=True, keep=False):
+        self.realtime = realtime
+        self.keep = keep
+        self.blocks = []
+        self.render = None
+        self.running = False
+        self.thread = None
+
+    def start(self, render, sampleRate, channels, blockFrames):
+        self.render = render
+        self.sampleRate = sampleRate
+        self.blockFrames = blockFrames
+        self.running = True
+        if self.realtime:
+            self.thread = threading.Thread(target=self.run, name="Cue-Sink", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        blockSeconds = self.blockFrames / float(self.sampleRate)
+        nextBlock = time.perf_counter()
+        while self.running:
+            self.advance(1)
+            nextBlock += blockSeconds
+            delay = nextBlock - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    # Render `blocks` blocks right now
+    def advance(self, blocks=1):
+        for i in range(blocks):
+            block = self.render(self.blockFrames)
+            self.write(block)
+
+    def write(self, block):
+        if self.keep:
+            self.blocks.append(block)
+
+    def outputLatency(self):
+        return 0.0
+
+    def output(self):
+        if not self.blocks:
+            return numpy.zeros((0, 0), dtype=numpy.int16)
+        return numpy.concatenate(self.blocks)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(1.0)
+
+
+# Writes everything the mixer produces to a WAV file, paced like a sound card unless realtime=False
+class WaveFileSink(NullSink):
+    def __init__(self, path, realtime=True):
+        NullSink.__init__(self, realtime)
+        self.path = path
+        self.wav = None
+
+    def start(self, render, sampleRate, channels, blockFrames):
+        self.wav = wave.open(self.path, "wb")
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sampleRate)
+        NullSink.start(self, render, sampleRate, channels, blockFrames)
+
+    def write(self, block):
+        self.wav.writeframes(block.tobytes())
+
+    def stop(self):
+        NullSink.stop(self)
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+
+
+class CueEngine:
+    # sink: where the sound goes, PyAudioSink() for the sound card
+    # blockFrames: frames per block, the longest a new cue waits to start is one block (256 frames = 5.3 ms at 48 kHz)
+    def __init__(self, sink, sampleRate=48000, channels=2, blockFrames=256, maxVoices=16):
+        self.sink = sink
+        self.sampleRate = sampleRate
+        self.channels = channels
+        self.blockFrames = blockFrames
+        self.mixer = CueMixer(channels, maxVoices)
+        self.cues = {} # name -> decoded samples
+        self.triggeredCount = 0
+        self.started = False
+
+    def start(self):
+        self.sink.start(self.mixer.render, self.sampleRate, self.channels, self.blockFrames)
+        self.started = True
+
+    # Decode a WAV file once, play it later by name
+    def load(self, name, path):
+        self.cues[name] = loadWav(path, self.sampleRate, self.channels)
+
+    # Register samples that are already decoded (e.g. a toneCue)
+    def add(self, name, samples):
+        self.cues[name] = conform(samples, self.sampleRate, self.sampleRate, self.channels)
+
+    # Start a cue, mixed over whatever is already playing. Never blocks. Unknown names are ignored
+    def play(self, name, gain=1.0):
+        samples = self.cues.get(name)
+        if samples is None or not self.started:
+            return False
+        self.triggeredCount += 1
+        return self.mixer.add(samples, gain)
+
+    def stats(self):
+        latencies = numpy.array(self.mixer.startLatencies) * 1000.0
+        return {
+            "triggered": self.triggeredCount,
+            "dropped": self.mixer.droppedCount,
+            "playing": self.mixer.playing(),
+            "peakVoices": self.mixer.peakVoices,
+            "startLatencyMsP50": round(float(numpy.percentile(latencies, 50)), 2) if len(latencies) else None,
+            "startLatencyMsMax": round(float(latencies.max()), 2) if len(latencies) else None,
+            "outputLatencyMs": round(self.sink.outputLatency() * 1000.0, 2),
+        }
+
+    def close(self):
+        self.sink.stop()
+        self.started = False
+
+
+# Sound card when there is one, otherwise a NullSink so the rest of the program runs the same (just silently)
+def openCueEngine(sampleRate=48000, channels=2, blockFrames=256):
+    engine = CueEngine(PyAudioSink(), sampleRate, channels, blockFrames)
+    try:
+        engine.start()
+    except Exception as error: # no PyAudio or no output device
+        logger.warning("no sound output, audio cues are muted: %s", error)
+        engine = CueEngine(NullSink(), sampleRate, channels, blockFrames)
+        engine.start()
+    return engine
+#--------------------------------END AUDIO CUES-----------------------------------------------
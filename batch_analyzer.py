@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy
+
+from emotion_batch import EMOTIONS, classifyFaces
+from report_engine import reportText
+
+#================================ BATCH VIDEO ANALYZER ======================================================
+# Scores recorded speeches offline, with no Qt window. Every video is split into time chunks, the chunks are spread
+# over a pool of processes (each process builds its own FER model once), and every process scores its frames in
+# batches: faces are found frame by frame, then all the face crops of a batch are classified in one forward pass.
+# The per-chunk tallies are merged into the same per-emotion statistics the live report shows.
+#
+# Usage:
+#   python batch_analyzer.py speech1.mp4 speech2.mp4 --workers 4 --stride 3
+#   python batch_analyzer.py --synthetic test.avi --stub   (make a small synthetic clip and score it without FER)
+#   python batch_analyzer.py --synthetic test.avi --stub --scaling --stride 1 --chunk-seconds 2   (speedup per core)
+
+detector = None # detector for this worker process, built once by initWorker()
+
+
+# Stand-in for FER on machines without TensorFlow. Every separate patch of bright pixels in the frame is a "face" and
+# its "emotion" is picked from how bright it is, so the synthetic clips always give the same answers.
+class StubDetector:
+    class StubClassifier:
+        input_shape = (None, 64, 64, 1)
+
+        def predict(self, batch, verbose=0):
+            brightness = (batch.reshape(len(batch), -1).mean(axis=1) + 1.0) / 2.0 # back to 0..1
+            index = numpy.clip((brightness * len(EMOTIONS)).astype(int), 0, len(EMOTIONS) - 1)
+            scores = numpy.full((len(batch), len(EMOTIONS)), 0.05, dtype=numpy.float32)
+            scores[numpy.arange(len(batch)), index] = 0.7
+            return scores
+
+    def __init__(self):
+        self._emotion_classifier = self.StubClassifier()
+
+    def find_faces(self, img, bgr=True):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        count, labels, boxes, centroids = cv2.connectedComponentsWithStats((gray > 40).astype(numpy.uint8))
+        return [(int(x), int(y), int(w), int(h)) for x, y, w, h, area in boxes[1:]] # label 0 is the background
+
+    # Same output as FER.detect_emotions, so the stub can also drive the live FramePipeline
+    def detect_emotions(self, img, face_rectangles=None):
+        boxes = face_rectangles if face_rectangles is not None else self.find_faces(img)
+        scores = classifyFaces(self, [img], [boxes])
+        return [{"box": list(box), "emotions": {emotion: round(float(score), 2) for emotion, score in zip(EMOTIONS, row)}}
+                for box, row in zip(boxes, scores)]
+
+
+# Runs once in every worker process
+def initWorker(useStub):
+    global detector
+    if useStub:
+        detector = StubDetector()
+    else:
+        from fer import FER # imported here so the parent process never loads TensorFlow
+        detector = FER()
+
+
+# Per-chunk (and merged) tallies
+def emptyTally():
+    return {
+        "counts": [0] * len(EMOTIONS), # frames where each emotion was the top emotion
+        "scoreSums": [0.0] * len(EMOTIONS), # summed scores of each emotion over frames with a face
+        "framesAnalysed": 0, # frames that were run through FER
+        "framesWithFace": 0, # frames where a face was found
+    }
+
+
+def mergeTally(total, part):
+    for i in range(len(EMOTIONS)):
+        total["counts"][i] += part["counts"][i]
+        total["scoreSums"][i] += part["scoreSums"][i]
+    total["framesAnalysed"] += part["framesAnalysed"]
+    total["framesWithFace"] += part["framesWithFace"]
+    return total
+
+
+# Classify a batch of frames, keeping only the largest face (the speaker) in each frame
+def scoreBatch(frames, tally):
+    boxesPerFrame = []
+    for frame in frames:
+        faces = detector.find_faces(frame, bgr=True)
+        if len(faces):
+            faces = [max(faces, key=lambda box: box[2] * box[3])]
+        boxesPerFrame.append(faces)
+    scores = classifyFaces(detector, frames, boxesPerFrame)
+    tally["framesAnalysed"] += len(frames)
+    if len(scores):
+        tally["framesWithFace"] += len(scores)
+        counts = numpy.bincount(scores.argmax(axis=1), minlength=len(EMOTIONS))
+        sums = scores.sum(axis=0)
+        for i in range(len(EMOTIONS)):
+            tally["counts"][i] += int(counts[i])
+            tally["scoreSums"][i] += float(sums[i])
+
+
+# Work done by one worker process: score every stride-th frame in [startFrame, endFrame) of one video
+def analyseChunk(path, startFrame, endFrame, stride, batchSize):
+    tally = emptyTally()
+    capture = cv2.VideoCapture(path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+    batch = []
+    for frameNumber in range(startFrame, endFrame):
+        if (frameNumber - startFrame) % stride: # skipped frame, grab() moves on without decoding the image
+            if not capture.grab():
+                break
+            continue
+        ret, frame = capture.read()
+        if not ret:
+            break
+        batch.append(frame)
+        if len(batch) >= batchSize:
+            scoreBatch(batch, tally)
+            batch = []
+    if batch:
+        scoreBatch(batch, tally)
+    capture.release()
+    return tally
+
+
+# Split a video into (startFrame, endFrame) chunks. Chunk lengths are a multiple of stride so every chunk samples the
+# same frames a single pass over the whole video would
+def splitVideo(path, chunkSeconds, stride):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened(): # missing file or a format OpenCV cannot decode, rather than an empty report
+        raise IOError("cannot open video: " + path)
+    frameCount = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    capture.release()
+    chunkFrames = max(stride, int(chunkSeconds * fps) // stride * stride)
+    chunks = [(start, min(frameCount, start + chunkFrames)) for start in range(0, frameCount, chunkFrames)]
+    return chunks, frameCount, fps
+
+
+# Turn a merged tally into the statistics generateReport shows for the video side of a speech, with the keys
+# report_engine.reportText reads
+def summarise(tally, frameCount, fps):
+    seen = [i for i in range(len(EMOTIONS)) if tally["counts"][i] > 0]
+    topEmotion = EMOTIONS[max(seen, key=lambda i: tally["counts"][i])] if seen else "N/A"
+    leastEmotion = EMOTIONS[min(seen, key=lambda i: tally["counts"][i])] if seen else "N/A"
+    withFace = max(1, tally["framesWithFace"])
+    durationSeconds = int(round(frameCount / fps))
+    mins, secs = divmod(durationSeconds, 60)
+    return {
+        "emotionCounts": dict(zip(EMOTIONS, tally["counts"])),
+        "meanScores": {EMOTIONS[i]: round(tally["scoreSums"][i] / withFace, 4) for i in range(len(EMOTIONS))},
+        "topEmotion": topEmotion,
+        "leastEmotion": leastEmotion,
+        "framesAnalysed": tally["framesAnalysed"],
+        "framesWithFace": tally["framesWithFace"],
+        "durationSeconds": durationSeconds,
+        "minutes": mins,
+        "seconds": secs,
+    }
+
+
+# Library entry point: score a list of videos and return {path: summary}
+def analyseVideos(paths, workers=None, chunkSeconds=10.0, stride=3, batchSize=16, useStub=False):
+    jobs = [] # (path, future)
+    videos = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=initWorker, initargs=(useStub,)) as pool:
+        for path in paths:
+            chunks, frameCount, fps = splitVideo(path, chunkSeconds, stride)
+            videos[path] = (frameCount, fps)
+            for startFrame, endFrame in chunks:
+                jobs.append((path, pool.submit(analyseChunk, path, startFrame, endFrame, stride, batchSize)))
+
+        tallies = {path: emptyTally() for path in paths}
+        for path, future in jobs:
+            mergeTally(tallies[path], future.result())
+    return {path: summarise(tallies[path], *videos[path]) for path in paths}
+
+
+# Throughput of analyseVideos on the same videos at each worker count (1, 2 and every core by default). Returns
+# [{"workers", "seconds", "framesPerSecond", "speedup"}], the speedup is against the first worker count
+def measureScaling(paths, workerCounts=None, chunkSeconds=2.0, stride=1, batchSize=16, useStub=False):
+    if workerCounts is None:
+        workerCounts = sorted({1, 2, os.cpu_count() or 1})
+    rows = []
+    for workers in workerCounts:
+        startTime = time.perf_counter()
+        results = analyseVideos(paths, workers, chunkSeconds, stride, batchSize, useStub)
+        seconds = time.perf_counter() - startTime
+        frames = sum(summary["framesAnalysed"] for summary in results.values())
+        rows.append({"workers": workers, "seconds": round(seconds, 3), "framesPerSecond": round(frames / seconds, 1),
+                     "speedup": round(rows[0]["seconds"] / seconds, 2) if rows else 1.0})
+    return rows
+#----------------------------------END BATCH VIDEO ANALYZER----------------------------------------------------
+
+
+# Write a small synthetic "speech" for testing on a CPU-only box: a bright square that drifts around and changes
+# brightness every second, so the stub detector sees a face whose emotion changes over time
+def makeSyntheticVideo(path, seconds=20, fps=15, width=400, height=300):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for frameNumber in range(int(seconds * fps)):
+        frame = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+        second = frameNumber // fps
+        brightness = 60 + (second * 37) % 190
+        x = 150 + int(20 * numpy.sin(frameNumber / 10.0))
+        y = 100 + int(10 * numpy.cos(frameNumber / 15.0))
+        frame[y:y + 100, x:x + 80] = brightness
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score recorded speech videos with FER, without the GUI")
+    parser.add_argument("videos", nargs="*", help="video files to analyse")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--chunk-seconds", type=float, default=10.0, help="length of the chunk each process scores")
+    parser.add_argument("--stride", type=int, default=3, help="score every Nth frame")
+    parser.add_argument("--batch-size", type=int, default=16, help="frames classified per forward pass")
+    parser.add_argument("--stub", action="store_true", help="use the deterministic stub detector instead of FER")
+    parser.add_argument("--synthetic", metavar="PATH", help="write a synthetic test clip to PATH and analyse it")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--scaling", action="store_true", help="time the analysis at 1, 2 and all cores instead")
+    args = parser.parse_args(argv)
+
+    videos = list(args.videos)
+    if args.synthetic:
+        videos.append(makeSyntheticVideo(args.synthetic))
+    if not videos:
+        parser.error("no videos given")
+
+    if args.scaling:
+        try:
+            rows = measureScaling(videos, None, args.chunk_seconds, max(1, args.stride), max(1, args.batch_size), args.stub)
+        except IOError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print("workers   seconds   frames/s   speed-up")
+        for row in rows:
+            print(str(row["workers"]).rjust(7) + ("%.2f" % row["seconds"]).rjust(10) + ("%.1f" % row["framesPerSecond"]).rjust(11) +
+                  ("%.2fx" % row["speedup"]).rjust(11))
+        return 0
+
+    startTime = time.perf_counter()
+    try:
+        results = analyseVideos(videos, args.workers, args.chunk_seconds, max(1, args.stride), max(1, args.batch_size), args.stub)
+    except IOError as error:
+        print(error, file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - startTime
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for path, summary in results.items():
+            print(path)
+            print(reportText(summary))
+        print("Analysed " + str(len(videos)) + " video(s) in " + str(round(elapsed, 2)) + " seconds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
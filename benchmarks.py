@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy
+
+#================================ BENCHMARK SUITE ===========================================================
+# Repeatable measurements of the parts that decide how the app feels, on any machine: no webcam, microphone,
+# network recognizer or GUI needed. A synthetic camera, a WAV file played back in real time and a stub recognizer
+# stand in for the real devices, so two runs on the same machine measure the code and not the room.
+#
+#   capture      frames per second the capture stage keeps up while inference runs
+#   fer          time to score one frame (the stub detector, or the real FER model with --fer)
+#   frameToLabel camera frame read -> emotion label applied by the GUI-thread timer (through the UI update bus)
+#   speech       end of a spoken phrase -> its transcript delivered, with a recognizer that takes a fixed time
+#   http         requests per second and p50/p99 latency of a session's set_text/set_color endpoints
+#   batch        frames per second the batch analyzer scores at 1, 2 and every core, and the speedup over 1
+#
+# Results are written as JSON with the machine and git commit they came from, and --compare prints how a run differs
+# from an earlier one, flagging metrics that got worse by more than the tolerance.
+#
+# Usage:
+#   python benchmarks.py --output before.json
+#   python benchmarks.py --output after.json --compare before.json
+#   python benchmarks.py --only fer speech --seconds 5
+
+# Whether a bigger value of a metric is better, for --compare. Metrics not listed here are shown but never flagged
+HIGHER_IS_BETTER = {
+    "capture.captureFps": True,
+    "capture.inferenceFps": True,
+    "fer.framesPerSecond": True,
+    "fer.p50ms": False,
+    "fer.p99ms": False,
+    "frameToLabel.p50ms": False,
+    "frameToLabel.p99ms": False,
+    "speech.p50ms": False,
+    "speech.p99ms": False,
+    "http.requestsPerSecond": True,
+    "http.p50ms": False,
+    "http.p99ms": False,
+    "batch.framesPerSecond1": True,
+    "batch.speedupAll": True,
+}
+
+
+def percentiles(seconds):
+    values = numpy.array(seconds) * 1000.0
+    if not len(values):
+        return {"samples": 0, "p50ms": None, "p99ms": None}
+    return {"samples": len(values), "p50ms": round(float(numpy.percentile(values, 50)), 2),
+            "p99ms": round(float(numpy.percentile(values, 99)), 2)}
+
+
+def detectorFactory(useFer):
+    if useFer:
+        from startup import buildFer
+        return buildFer
+    from batch_analyzer import StubDetector
+    return StubDetector
+
+
+# Capture rate of a 30 fps camera with FER running behind it
+def benchCapture(seconds, useFer, workers):
+    from video_pipeline import FramePipeline, SyntheticCamera
+    camera = SyntheticCamera(fps=30.0)
+    pipeline = FramePipeline(detectorFactory(useFer), numWorkers=workers)
+    pipeline.start()
+    pipeline.stats() # restart the rate windows
+    stopAt = time.perf_counter() + seconds
+    pipeline.runCapture(camera.read, lambda: time.perf_counter() >= stopAt)
+    stats = pipeline.stats()
+    pipeline.stop()
+    return {"cameraFps": camera.fps, "captureFps": stats["captureFps"], "inferenceFps": stats["inferenceFps"],
+            "dropped": stats["dropped"]}
+
+
+# Inference latency of one frame, frames scored back to back on one thread
+def benchFer(seconds, useFer):
+    from video_pipeline import SyntheticCamera, detectEmotions
+    camera = SyntheticCamera(realtime=False)
+    detector = detectorFactory(useFer)()
+    detectEmotions(detector, camera.read()[1]) # the first call builds the model's graph, leave it out
+    latencies = []
+    stopAt = time.perf_counter() + seconds
+    while time.perf_counter() < stopAt:
+        frame = camera.read()[1]
+        startTime = time.perf_counter()
+        detectEmotions(detector, frame)
+        latencies.append(time.perf_counter() - startTime)
+    results = percentiles(latencies)
+    results["framesPerSecond"] = round(len(latencies) / max(1e-9, sum(latencies)), 1)
+    return results
+
+
+# Camera frame -> label on screen: the pipeline publishes the emotion to a UiUpdateBus as the app does, and a thread
+# standing in for the GUI timer applies the bus 30 times a second and notes when each frame's label got applied
+def benchFrameToLabel(seconds, useFer, workers):
+    from ui_bus import UiUpdateBus
+    from video_pipeline import FramePipeline, SyntheticCamera
+    bus = UiUpdateBus()
+    captureTimes = {} # frame index -> time.monotonic() it was read
+    latencies = []
+
+    class Label:
+        def setText(self, text):
+            frameIndex = int(text.split()[0])
+            latencies.append(time.monotonic() - captureTimes.pop(frameIndex))
+
+    class Window:
+        Emotion_Label = Label()
+
+    def onEmotion(result):
+        captureTimes[result.frameIndex] = result.captureTime
+        bus.setText("Emotion_Label", str(result.frameIndex) + " " + str(result.emotion))
+
+    stopEvent = threading.Event()
+
+    def guiTimer():
+        window = Window()
+        while not stopEvent.wait(1.0 / 30):
+            bus.apply(window)
+
+    gui = threading.Thread(target=guiTimer, name="Bench-GUI", daemon=True)
+    gui.start()
+    camera = SyntheticCamera(fps=30.0)
+    pipeline = FramePipeline(detectorFactory(useFer), onEmotion=onEmotion, numWorkers=workers)
+    pipeline.start()
+    stopAt = time.perf_counter() + seconds
+    pipeline.runCapture(camera.read, lambda: time.perf_counter() >= stopAt)
+    pipeline.stop()
+    time.sleep(0.1) # let the last label be applied
+    stopEvent.set()
+    gui.join()
+    results = percentiles(latencies)
+    results["coalesced"] = bus.stats()["coalesced"]
+    return results
+
+
+# End of a phrase in the audio -> transcript delivered, with a WAV file played back like a microphone and a recognizer
+# that takes recognizerSeconds per phrase
+def benchSpeech(seconds, recognizerSeconds, workers, folder):
+    from speech_pipeline import ContinuousSpeechCapture, StubBackend, WavFileSource
+    from speech_rate import makeSyntheticSpeech
+    path = os.path.join(folder, "speech.wav")
+    makeSyntheticSpeech(path, seconds=seconds)
+    source = WavFileSource(path, realtime=True)
+    latencies = []
+
+    def onResult(result):
+        latencies.append(time.monotonic() - (source.startTime + result.end))
+
+    # the synthetic speaker pauses for 0.6 s every 2.5 s, a shorter pause limit makes every pause end a phrase
+    capture = ContinuousSpeechCapture(source, StubBackend(latency=recognizerSeconds), onResult, pauseSeconds=0.5,
+                                      workers=workers)
+    capture.run(lambda: False)
+    results = percentiles(latencies)
+    results["recognizerMs"] = round(recognizerSeconds * 1000.0, 1)
+    return results
+
+
+# Throughput of a session's endpoints on the production server backend, many clients with keep-alive connections
+def benchHttp(seconds, clients, folder):
+    import flask
+    from load_test import run
+    from session_server import SessionManager, registerSessionRoutes
+    from web_server import ServerRunner
+    app = flask.Flask("benchmarks")
+    manager = SessionManager(os.path.join(folder, "Sessions"))
+    registerSessionRoutes(app, manager)
+    sessionId = manager.create(speaker="Benchmark", video=None, audio=None).id
+    runner = ServerRunner(app, host="127.0.0.1", port=0, threads=8)
+    threading.Thread(target=runner.serve, daemon=True).start()
+    runner.ready.wait()
+    loaded = run("http://127.0.0.1:" + str(runner.boundPort()), clients, seconds, "/sessions/" + sessionId)
+    runner.stop()
+    manager.closeAll()
+    results = {"backend": runner.backend(), "clients": clients, "errors": loaded["errors"]}
+    requests = sum(loaded[path]["requests"] for path in ("/set_text", "/set_color"))
+    results["requestsPerSecond"] = round(requests / loaded["seconds"], 1)
+    results["p50ms"] = loaded["/set_text"]["p50ms"]
+    results["p99ms"] = loaded["/set_text"]["p99ms"]
+    return results
+
+
+# Scaling of the batch analyzer over worker processes, on a synthetic clip cut into enough chunks to share out
+def benchBatch(seconds, useFer, folder):
+    from batch_analyzer import makeSyntheticVideo, measureScaling
+    path = makeSyntheticVideo(os.path.join(folder, "batch.avi"), seconds=int(seconds * 12))
+    rows = measureScaling([path], chunkSeconds=2.0, stride=1, useStub=not useFer)
+    results = {"cpus": os.cpu_count()}
+    for row, name in zip(rows, ["1", "2", "All"] if len(rows) == 3 else ["1", "All"]):
+        results["framesPerSecond" + name] = row["framesPerSecond"]
+        results["speedup" + name] = row["speedup"]
+    return results
+
+
+BENCHMARKS = ("capture", "fer", "frameToLabel", "speech", "http", "batch")
+
+
+def runBenchmarks(names=BENCHMARKS, seconds=5.0, useFer=False, ferWorkers=1, recognizerSeconds=0.5, speechWorkers=2,
+                  clients=16):
+    folder = tempfile.mkdtemp()
+    benchmarks = {
+        "capture": lambda: benchCapture(seconds, useFer, ferWorkers),
+        "fer": lambda: benchFer(seconds, useFer),
+        "frameToLabel": lambda: benchFrameToLabel(seconds, useFer, ferWorkers),
+        "speech": lambda: benchSpeech(max(seconds, 10.0), recognizerSeconds, speechWorkers, folder),
+        "http": lambda: benchHttp(seconds, clients, folder),
+        "batch": lambda: benchBatch(seconds, useFer, folder),
+    }
+    results = {}
+    for name in names:
+        print("running " + name + " ...", file=sys.stderr)
+        results[name] = benchmarks[name]()
+    return results
+
+
+# Where and what was measured, so results from different machines or versions are not mixed up by accident
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "detector": "fer" if args.fer else "stub",
+        "seconds": args.seconds,
+    }
+
+
+# [(metric, before, after, change in %, worse by more than tolerance)] for every numeric metric in both runs
+def compare(before, after, tolerance=0.1):
+    rows = []
+    for name, metrics in after.items():
+        for key, value in metrics.items():
+            metric = name + "." + key
+            old = before.get(name, {}).get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or isinstance(value, bool):
+                continue
+            change = (value - old) / float(old) if old else 0.0
+            higherIsBetter = HIGHER_IS_BETTER.get(metric)
+            worse = higherIsBetter is not None and (-change if higherIsBetter else change) > tolerance
+            rows.append((metric, old, value, round(change * 100, 1), worse))
+    return rows
+#--------------------------------END BENCHMARK SUITE-----------------------------------------------
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark capture, FER, labels, speech and HTTP without devices")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long each benchmark runs")
+    parser.add_argument("--fer", action="store_true", help="use the real FER model instead of the stub detector")
+    parser.add_argument("--fer-workers", type=int, default=1, help="FER worker threads in the frame pipeline")
+    parser.add_argument("--recognizer-seconds", type=float, default=0.5, help="time the stub recognizer takes per phrase")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent HTTP clients")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = runBenchmarks(args.only, args.seconds, args.fer, args.fer_workers, args.recognizer_seconds,
+                            clients=args.clients)
+    document = {"metadata": metadata(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(document, outputFile, indent=2)
+    print(json.dumps(document, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+        print("\ncompared with " + args.compare + " (commit " + str(baseline["metadata"].get("commit")) + ")")
+        regressions = 0
+        for metric, old, new, change, worse in compare(baseline["results"], results, args.tolerance):
+            regressions += worse
+            print(metric.ljust(30) + str(old).rjust(12) + str(new).rjust(12) + (("%+.1f %%" % change).rjust(10)) +
+                  ("   WORSE" if worse else ""))
+        print(str(regressions) + " regression(s) beyond " + str(round(args.tolerance * 100)) + " %")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import cv2
+import numpy
+
+from emotion_store import EMOTIONS # FER's output order
+
+#================================ BATCHED EMOTION CLASSIFICATION ============================================
+# FER classifies faces one call at a time. These helpers crop every face from one or more frames and push all of the
+# crops through FER's emotion CNN in a single forward pass, which is much cheaper than one predict() per face.
+
+FACE_OFFSET = 10 # FER widens every face box by this many pixels on each side before classifying it
+
+
+# Size (width, height) of the faces FER's emotion CNN expects
+def targetSize(detector):
+    height, width = detector._emotion_classifier.input_shape[1:3]
+    return width, height
+
+
+# Cut one face out of a grayscale frame and prepare it the way FER does: widen the box, resize, scale to [-1, 1]
+def cropFace(gray, box, size):
+    x, y, w, h = [int(v) for v in box]
+    frameHeight, frameWidth = gray.shape[:2]
+    x1 = max(0, x - FACE_OFFSET)
+    y1 = max(0, y - FACE_OFFSET)
+    x2 = min(frameWidth, x + w + FACE_OFFSET)
+    y2 = min(frameHeight, y + h + FACE_OFFSET)
+    face = cv2.resize(gray[y1:y2, x1:x2], size)
+    return (face.astype(numpy.float32) / 255.0 - 0.5) * 2.0
+
+
+# Classify every face in every frame with one forward pass.
+# frames: list of BGR frames, boxesPerFrame: list (one entry per frame) of lists of (x, y, w, h) boxes.
+# Returns an array of shape (number of faces, 7) of emotion scores, in the same order as the boxes were given.
+def classifyFaces(detector, frames, boxesPerFrame):
+    size = targetSize(detector)
+    crops = []
+    for frame, boxes in zip(frames, boxesPerFrame):
+        if not len(boxes):
+            continue
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        for box in boxes:
+            crops.append(cropFace(gray, box, size))
+    if not crops:
+        return numpy.zeros((0, len(EMOTIONS)), dtype=numpy.float32)
+    batch = numpy.stack(crops)[..., numpy.newaxis] # shape (faces, height, width, 1)
+    return numpy.asarray(detector._emotion_classifier.predict(batch, verbose=0), dtype=numpy.float32)
+#----------------------------------END BATCHED EMOTION CLASSIFICATION-----------------------------------------
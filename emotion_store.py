@@ -0,0 +1,120 @@
+import threading
+import numpy
+
+#================================ EMOTION STORE ============================================================
+# Every emotion sample of a speech (timestamp, the 7 FER scores, face present) in preallocated NumPy arrays used as a
+# ring. Whole-session counts and score sums are kept as running totals, so they stay exact after the ring wraps.
+
+EMOTIONS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral") # same order as FER's classifier
+
+
+class EmotionStore:
+    # capacity: number of rows kept, the default is about 2 hours at 30 frames per second (about 9 MB)
+    def __init__(self, capacity=216000):
+        self.capacity = capacity
+        self.times = numpy.zeros(capacity, dtype=numpy.float64)
+        self.scores = numpy.zeros((capacity, len(EMOTIONS)), dtype=numpy.float32)
+        self.facePresent = numpy.zeros(capacity, dtype=numpy.bool_)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.written = 0 # rows appended since the start, the next row goes to written % capacity
+            self.topCounts = numpy.zeros(len(EMOTIONS), dtype=numpy.int64) # frames where each emotion was on top
+            self.scoreSums = numpy.zeros(len(EMOTIONS), dtype=numpy.float64) # summed scores over frames with a face
+            self.faceFrames = 0 # frames where a face was found
+            self.totalFrames = 0
+
+    # Add one sample. scores is FER's emotions dict ({"happy": 0.9, ...}), a sequence of 7 scores, or None for no face
+    def append(self, timestamp, scores):
+        row = numpy.zeros(len(EMOTIONS), dtype=numpy.float32)
+        if scores is not None:
+            if isinstance(scores, dict):
+                row[:] = [scores.get(emotion, 0.0) for emotion in EMOTIONS]
+            else:
+                row[:] = scores
+        with self.lock:
+            index = self.written % self.capacity
+            self.times[index] = timestamp
+            self.scores[index] = row
+            self.facePresent[index] = scores is not None
+            self.written += 1
+            self.totalFrames += 1
+            if scores is not None:
+                self.faceFrames += 1
+                self.topCounts[int(row.argmax())] += 1
+                self.scoreSums += row
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    # Copy of the rows still held, oldest first: (times, scores, facePresent)
+    def snapshot(self):
+        with self.lock:
+            count = min(self.written, self.capacity)
+            start = self.written % self.capacity if self.written > self.capacity else 0
+            order = (numpy.arange(count) + start) % self.capacity
+            return self.times[order], self.scores[order], self.facePresent[order]
+
+    # Rows between two timestamps (either may be None), only the ones where a face was found
+    def window(self, start=None, end=None):
+        times, scores, face = self.snapshot()
+        keep = face.copy()
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times < end
+        return times[keep], scores[keep]
+
+    # Number of frames each emotion was the top emotion, over the whole session ({"happy": 120, ...})
+    def counts(self):
+        with self.lock:
+            return dict(zip(EMOTIONS, self.topCounts.tolist()))
+
+    # Mean score of every emotion, over the whole session or between two timestamps
+    def meanScores(self, start=None, end=None):
+        if start is None and end is None:
+            with self.lock:
+                means = self.scoreSums / self.faceFrames if self.faceFrames else numpy.zeros(len(EMOTIONS))
+        else:
+            times, scores = self.window(start, end)
+            means = scores.mean(axis=0) if len(scores) else numpy.zeros(len(EMOTIONS))
+        return dict(zip(EMOTIONS, [round(float(value), 4) for value in means]))
+
+    # Most used emotion over the whole session, "N/A" when no face was ever found
+    def topEmotion(self):
+        with self.lock:
+            if not self.topCounts.any():
+                return "N/A"
+            return EMOTIONS[int(self.topCounts.argmax())]
+
+    # Least used emotion among the ones that showed up at least once, "N/A" when no face was ever found
+    def leastEmotion(self):
+        with self.lock:
+            seen = numpy.flatnonzero(self.topCounts)
+            if not len(seen):
+                return "N/A"
+            return EMOTIONS[int(seen[self.topCounts[seen].argmin()])]
+
+    # The dominant emotion in every windowSeconds-long slice of the rows still held.
+    # Returns (windowStartTimes, emotionIndices); slices without a face are left out
+    def dominantPerWindow(self, windowSeconds):
+        times, scores = self.window()
+        if not len(times):
+            return numpy.zeros(0), numpy.zeros(0, dtype=numpy.int64)
+        slot = ((times - times[0]) // windowSeconds).astype(numpy.int64)
+        votes = numpy.bincount(slot * len(EMOTIONS) + scores.argmax(axis=1), minlength=(slot[-1] + 1) * len(EMOTIONS))
+        votes = votes.reshape(-1, len(EMOTIONS))
+        used = votes.sum(axis=1) > 0
+        return times[0] + numpy.flatnonzero(used) * windowSeconds, votes[used].argmax(axis=1)
+
+    # Rolling mean of each emotion score over the last `samples` rows with a face, for trend lines.
+    # Returns (times, means) where means has one column per emotion
+    def rollingMean(self, samples):
+        times, scores = self.window()
+        if len(times) < samples or samples < 1:
+            return numpy.zeros(0), numpy.zeros((0, len(EMOTIONS)))
+        totals = numpy.cumsum(numpy.vstack((numpy.zeros((1, len(EMOTIONS))), scores)), axis=0)
+        return times[samples - 1:], (totals[samples:] - totals[:-samples]) / samples
+#--------------------------------END EMOTION STORE-----------------------------------------------
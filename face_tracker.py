@@ -0,0 +1,142 @@
+import sys
+import time
+import cv2
+
+#================================ FACE TRACKING ============================================================
+# Runs FER's full-frame face detector only every few frames (or when tracking gets unsure) and follows the face with a
+# template match in between, so FER only has to classify the face crop.
+
+# Wraps a FER detector and exposes the same top_emotion() call, so it can be dropped into FramePipeline
+class TrackingDetector:
+    # detector: a FER instance
+    # redetectEvery: run full face detection at least once every this many frames
+    # minConfidence: if the template match score drops below this (0 to 1) the face is detected again
+    # searchMargin: how far, as a fraction of the face size, to look around the last box for the face
+    def __init__(self, detector, redetectEvery=10, minConfidence=0.6, searchMargin=0.5):
+        self.detector = detector
+        self.redetectEvery = max(1, int(redetectEvery))
+        self.minConfidence = minConfidence
+        self.searchMargin = searchMargin
+        self.box = None # last known face box (x, y, w, h), None when no face is being tracked
+        self.template = None # grayscale image of the face at the last full detection
+        self.framesSinceDetect = 0 # frames tracked since the last full detection
+        self.detectCount = 0 # number of full-frame detections run
+        self.trackCount = 0 # number of frames handled by the tracker alone
+
+    # Same return value as FER.top_emotion(): (emotion, score), raises IndexError when no face is found
+    def top_emotion(self, frame):
+        faces = self.detect_emotions(frame)
+        if not faces:
+            raise IndexError("no face detected")
+        emotions = faces[0]["emotions"]
+        emotion = max(emotions, key=emotions.get)
+        return emotion, emotions[emotion]
+
+    def detect_emotions(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        box = None
+        if self.box is not None and self.framesSinceDetect < self.redetectEvery:
+            box = self.track(gray) # try to follow the face we already have
+
+        if box is None: # nothing tracked, time to re-detect, or tracking lost the face
+            faces = self.detector.detect_emotions(frame) # full-frame detection and classification
+            self.detectCount += 1
+            self.framesSinceDetect = 0
+            if not faces:
+                self.box = None
+                self.template = None
+                return faces
+            faces = [max(faces, key=lambda face: face["box"][2] * face["box"][3])] # keep the largest face, the speaker
+            self.remember(gray, faces[0]["box"])
+            return faces
+
+        # classify only the tracked face, FER skips its face detector when it is given the face rectangles. The
+        # template stays the one from the last full detection, re-cutting it from tracked boxes lets it drift off the face
+        self.trackCount += 1
+        self.framesSinceDetect += 1
+        self.box = box
+        return self.detector.detect_emotions(frame, face_rectangles=[box])
+
+    # Find the face near its last position with a normalised template match, returns None when unsure
+    def track(self, gray):
+        x, y, w, h = self.box
+        marginX = int(w * self.searchMargin)
+        marginY = int(h * self.searchMargin)
+        frameHeight, frameWidth = gray.shape[:2]
+        left = max(0, x - marginX)
+        top = max(0, y - marginY)
+        right = min(frameWidth, x + w + marginX)
+        bottom = min(frameHeight, y + h + marginY)
+        searchArea = gray[top:bottom, left:right]
+        if searchArea.shape[0] < h or searchArea.shape[1] < w:
+            return None
+
+        match = cv2.matchTemplate(searchArea, self.template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, location = cv2.minMaxLoc(match)
+        if confidence < self.minConfidence:
+            return None
+        return (left + location[0], top + location[1], w, h)
+
+    # Start tracking from a fully detected face box
+    def remember(self, gray, box):
+        x, y, w, h = [int(v) for v in box]
+        x = max(0, x)
+        y = max(0, y)
+        self.box = (x, y, w, h)
+        self.template = gray[y:y + h, x:x + w].copy()
+        if self.template.shape[0] != h or self.template.shape[1] != w: # face runs off the edge of the frame
+            self.box = None
+            self.template = None
+#----------------------------------END FACE TRACKING----------------------------------------------------------
+
+
+# Run full detection and tracked detection over the same clip and report how often they agree and how long each took.
+# Returns (agreement, fullTimePerFrame, trackedTimePerFrame). Frames where neither finds a face count as agreeing.
+def compareWithFullDetection(detectorFactory, frames, redetectEvery=10, minConfidence=0.6):
+    full = detectorFactory()
+    tracked = TrackingDetector(detectorFactory(), redetectEvery, minConfidence)
+    agree = 0
+    fullTime = 0.0
+    trackedTime = 0.0
+    for frame in frames:
+        startTime = time.perf_counter()
+        fullFaces = full.detect_emotions(frame)
+        fullTime += time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        trackedFaces = tracked.detect_emotions(frame)
+        trackedTime += time.perf_counter() - startTime
+
+        fullTop = None
+        if fullFaces:
+            emotions = max(fullFaces, key=lambda face: face["box"][2] * face["box"][3])["emotions"]
+            fullTop = max(emotions, key=emotions.get)
+        trackedTop = None
+        if trackedFaces:
+            emotions = trackedFaces[0]["emotions"]
+            trackedTop = max(emotions, key=emotions.get)
+        if fullTop == trackedTop:
+            agree += 1
+    count = max(1, len(frames))
+    return agree / count, fullTime / count, trackedTime / count
+
+
+# Compares tracking with full FER detection on a real recording: python face_tracker.py recording.mp4 [redetectEvery]
+if __name__ == "__main__":
+    from fer import FER
+
+    clip = cv2.VideoCapture(sys.argv[1])
+    redetectEvery = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    frames = []
+    while True:
+        ret, frame = clip.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (400, 300)))
+    clip.release()
+
+    agreement, fullTime, trackedTime = compareWithFullDetection(FER, frames, redetectEvery)
+    print("frames: " + str(len(frames)))
+    print("top emotion agreement: " + str(round(agreement * 100, 1)) + "% (tolerance: 95%)")
+    print("full detection: " + str(round(fullTime * 1000, 1)) + " ms/frame")
+    print("tracked:        " + str(round(trackedTime * 1000, 1)) + " ms/frame")
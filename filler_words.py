@@ -0,0 +1,201 @@
+import re
+import threading
+
+#================================ FILLER WORD DETECTOR ======================================================
+# Counts filler words in the transcript as it is recognised. The lexicon is compiled into one regular expression,
+# longest phrases first, and partial results (partial=True) are corrected by the final result of the phrase.
+
+DEFAULT_LEXICON = ("um", "uh", "er", "ah", "hmm", "like", "you know", "so", "i mean", "basically", "actually",
+                   "literally", "kind of", "sort of", "you see", "okay so")
+
+
+# Pattern for one lexicon entry: words may be separated by any whitespace, single words may have stretched letters
+def entryPattern(entry):
+    words = entry.lower().split()
+    if len(words) == 1 and words[0].isalpha():
+        return "".join(re.escape(letter) + "+" for letter in words[0])
+    return r"\s+".join(re.escape(word) for word in words)
+
+
+def compileLexicon(lexicon):
+    entries = sorted(set(entry.lower() for entry in lexicon), key=len, reverse=True)
+    pattern = "|".join("(?P<f" + str(i) + ">" + entryPattern(entry) + ")" for i, entry in enumerate(entries))
+    return re.compile(r"\b(?:" + pattern + r")\b", re.IGNORECASE), entries
+
+
+class FillerDetector:
+    # lexicon: filler words and phrases to count
+    # onFiller(word, time): optional, called for every newly counted filler
+    def __init__(self, lexicon=DEFAULT_LEXICON, onFiller=None):
+        self.matcher, self.entries = compileLexicon(lexicon)
+        self.onFiller = onFiller
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {entry: 0 for entry in self.entries}
+            self.total = 0
+            self.events = [] # (time, word) of every filler counted, time in seconds from the start of the audio
+            self.partialCounts = {} # fillers already counted from partial results of the phrase being spoken
+
+    # Every filler in text: [(word, position in text from 0 to 1)]
+    def scan(self, text):
+        length = float(max(1, len(text)))
+        return [(self.entries[int(match.lastgroup[1:])], match.start() / length) for match in self.matcher.finditer(text)]
+
+    # Count the fillers of one transcript chunk. start and end are the chunk's times in the audio, when known, and are
+    # used to estimate when each filler was said. Returns the number of fillers newly counted (negative when a final
+    # result takes back fillers a partial result had counted)
+    def process(self, text, start=None, end=None, partial=False):
+        found = self.scan(text)
+        phraseCounts = {}
+        for word, position in found:
+            phraseCounts[word] = phraseCounts.get(word, 0) + 1
+        newEvents = []
+        with self.lock:
+            change = 0
+            for word in set(phraseCounts) | set(self.partialCounts):
+                difference = phraseCounts.get(word, 0) - self.partialCounts.get(word, 0)
+                if partial and difference < 0: # a guess dropped a filler, wait for the final result to decide
+                    continue
+                self.counts[word] += difference
+                change += difference
+                if difference > 0:
+                    positions = [position for foundWord, position in found if foundWord == word][-difference:]
+                    for position in positions:
+                        when = None if start is None else start + position * ((end or start) - start)
+                        newEvents.append((when, word))
+            if partial:
+                for word, count in phraseCounts.items():
+                    self.partialCounts[word] = max(count, self.partialCounts.get(word, 0))
+            else:
+                self.partialCounts = {}
+            newEvents.sort(key=lambda event: -1 if event[0] is None else event[0])
+            self.events.extend(newEvents)
+            self.total += change
+        if self.onFiller is not None:
+            for when, word in newEvents:
+                self.onFiller(word, when)
+        return change
+
+    # {word: count} of the words that were used at least once, most used first
+    def usedCounts(self):
+        with self.lock:
+            return dict(sorted(((word, count) for word, count in self.counts.items() if count > 0), key=lambda item: -item[1]))
+#--------------------------------END FILLER WORD DETECTOR-----------------------------------------------
+
+
+#================================ AH COUNT MERGER ===========================================================
+# The ah-counter (a person with the client app) and the detector both count fillers. The policy decides what the Ah
+# Count shows:
+#   "max"     the higher of the two, they count the same thing and whichever noticed more is right (default)
+#   "sum"     both added together, for when the ah-counter only counts what the detector cannot hear (e.g. "so" is
+#             left out of the lexicon and counted by hand)
+#   "manual"  only the ah-counter's count, the detector just keeps statistics
+#   "auto"    only the detector's count
+
+MERGE_POLICIES = ("max", "sum", "manual", "auto")
+
+
+class AhCountMerger:
+    def __init__(self, policy="max"):
+        if policy not in MERGE_POLICIES:
+            raise ValueError("unknown merge policy: " + str(policy))
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.manual = 0
+        self.auto = 0
+
+    def total(self):
+        if self.policy == "max":
+            return max(self.manual, self.auto)
+        if self.policy == "sum":
+            return self.manual + self.auto
+        if self.policy == "manual":
+            return self.manual
+        return self.auto
+
+    # The ah-counter's latest count. Returns (new total, True when the total went up)
+    def setManual(self, count):
+        with self.lock:
+            before = self.total()
+            self.manual = int(count)
+            after = self.total()
+        return after, after > before
+
+    # Fillers the detector just counted (may be negative). Returns (new total, True when the total went up)
+    def addAuto(self, count):
+        with self.lock:
+            before = self.total()
+            self.auto = max(0, self.auto + int(count))
+            after = self.total()
+        return after, after > before
+
+    # Start counting a new speech. The ah-counter client keeps its own count, so its number is kept
+    def resetAuto(self):
+        with self.lock:
+            self.auto = 0
+#--------------------------------END AH COUNT MERGER-----------------------------------------------
+
+
+# Benchmark on a synthetic corpus (or a real one, one transcript per line): counts must match the fillers that were
+# put in, and the single compiled pattern is compared with scanning the text once per lexicon entry.
+# python filler_words.py [--phrases 200000] [--corpus transcripts.txt]
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Filler word detector benchmark")
+    parser.add_argument("--phrases", type=int, default=200000, help="phrases in the synthetic corpus")
+    parser.add_argument("--corpus", help="text file with one transcript per line, used instead of the synthetic corpus")
+    args = parser.parse_args()
+
+    random.seed(0)
+    vocabulary = ("the", "speech", "today", "about", "our", "club", "members", "really", "want", "to", "share", "story",
+                  "when", "was", "young", "learned", "that", "people", "listen", "best", "if", "you", "known", "them",
+                  "liked", "also", "sold", "mean", "kind", "umbrella", "sort", "uhuru")  # near misses: liked, sold, umbrella
+    fillers = ("um", "uh", "like", "you know", "so", "i mean", "basically", "kind of", "ummm", "uhh")
+    expected = 0
+    if args.corpus:
+        with open(args.corpus) as corpusFile:
+            phrases = [line.strip() for line in corpusFile if line.strip()]
+    else:
+        phrases = []
+        for i in range(args.phrases):
+            words = [random.choice(vocabulary) for j in range(random.randint(6, 14))]
+            for j in range(random.randint(0, 2)):
+                words.insert(random.randint(0, len(words)), random.choice(fillers))
+                expected += 1
+            phrases.append(" ".join(words))
+    wordCount = sum(len(phrase.split()) for phrase in phrases)
+
+    detector = FillerDetector()
+    startTime = time.perf_counter()
+    for phrase in phrases:
+        detector.scan(phrase)
+    compiledSeconds = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    for i, phrase in enumerate(phrases):
+        detector.process(phrase, i * 3.0, i * 3.0 + 3.0)
+    processSeconds = time.perf_counter() - startTime
+
+    separate = [re.compile(r"\b" + entryPattern(entry) + r"\b", re.IGNORECASE) for entry in detector.entries]
+    startTime = time.perf_counter()
+    naiveTotal = 0
+    for phrase in phrases:
+        for pattern in separate:
+            naiveTotal += len(pattern.findall(phrase))
+    naiveSeconds = time.perf_counter() - startTime
+
+    print(str(len(phrases)) + " phrases, " + str(wordCount) + " words")
+    print("scan, one compiled pattern:  " + str(round(wordCount / compiledSeconds / 1e6, 2)) + " M words/s")
+    print("scan, one pattern per entry: " + str(round(wordCount / naiveSeconds / 1e6, 2)) + " M words/s (" +
+          str(naiveTotal) + " matches, words inside filler phrases counted again)")
+    print("process() with counting:     " + str(round(wordCount / processSeconds / 1e6, 2)) + " M words/s, " +
+          str(round(processSeconds / len(phrases) * 1e6, 1)) + " us per phrase, " + str(detector.total) + " fillers")
+    if not args.corpus:
+        print("expected " + str(expected) + " fillers, counted " + str(detector.total))
+        assert detector.total == expected
+    print("most used:", dict(list(detector.usedCounts().items())[:5]))
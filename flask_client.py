@@ -1,22 +1,29 @@
 import sys
 import random
-from PyQt5 import QtWidgets,uic
-from PyQt5.QtCore import QThread
-import requests
+from PyQt5 import QtWidgets,QtCore,uic
+from update_sender import CoalescingSender
 
 ah_Count = 0 # Number of ahs
+serverUrl = 'http://10.0.2.5:5000' # address of the ToastMaster's Toolbox web server
 
-class FlaskClient(QThread):
-    def run(self):
-        r = requests.post('http://10.0.2.5:5000/set_text', json={"ahCount":str(ah_Count), "status":"CENG 4113/5113"}) # Set the initial values
-        if r.ok:
-            print(r.json()) # output to console the current values
 
+# Send the current ah count to the web server, in the background
+def Send_Ah_Count():
+    sender.send('/set_text', {"ahCount":str(ah_Count), "status":"CENG 4113/5113"})
 
-# Function to quit thread 
+
+# Show how the updates are getting through in the status bar, once a second
+def Show_Send_Stats():
+    stats = sender.stats()
+    state = "Connected" if stats["connected"] else "Server unreachable, retrying"
+    UI.statusbar.showMessage(state + " | sent/s: " + str(stats["sendRate"]) + " | sent: " + str(stats["sent"]) +
+                             " | merged: " + str(stats["coalesced"]) + " | failed: " + str(stats["failed"]) +
+                             " | out of order: " + str(stats["stale"]))
+
+
+# Function to quit the application
 def Quit(): 
-    thread.terminate() # terminate the webserver client thread
-    thread.wait()
+    sender.stop() # give the last updates a moment to reach the server
     App.quit() # exit application
 
 
@@ -25,7 +32,7 @@ def Handle_Increment_Click():
     global ah_Count # access global ah_Count variable
     ah_Count = ah_Count + 1 # Increment the ah_Count by 1
     UI.lblOutput.setText("Ah Count: " + str(ah_Count)) # Display the current ah_Count
-    r = requests.post('http://10.0.2.5:5000/set_text', json={"ahCount":str(ah_Count), "status":"CENG 4113/5113"}) # Send text data to web server
+    Send_Ah_Count() # Send text data to web server
 
 
 # Function that executes when Decrement Button is clicked
@@ -36,7 +43,7 @@ def Handle_Decrement_Click():
         ah_Count = 0   # If ah_Count goes negative, just set to 0
 
     UI.lblOutput.setText("Ah Count: " + str(ah_Count)) # Display the current ah_Count
-    r = requests.post('http://10.0.2.5:5000/set_text', json={"ahCount":str(ah_Count), "status":"CENG 4113/5113"}) # Send text data to web server
+    Send_Ah_Count() # Send text data to web server
 
 
 # Function that executes when any of the color sliders change value
@@ -49,7 +56,7 @@ def Handle_Color_Adjust():
     UI.blueMagLabel.setText("Blue:  " + str(UI.blueSlider.value())) # output the blue value for background rgb color
 
     # Send color data to web server
-    r = requests.post('http://10.0.2.5:5000/set_color', json={"red":str(UI.redSlider.value()), "green":str(UI.greenSlider.value()) , "blue":str(UI.blueSlider.value())})
+    sender.send('/set_color', {"red":str(UI.redSlider.value()), "green":str(UI.greenSlider.value()) , "blue":str(UI.blueSlider.value())}) # only the latest value is sent
 
 
 App = QtWidgets.QApplication([]) # Instantiate the application
@@ -65,7 +72,12 @@ UI.blueSlider.valueChanged.connect(Handle_Color_Adjust) # Connect Handle_Color_A
 UI.show() # Display the ui
 UI.lblOutput.setText("Ah Count: 0")
 
-thread = FlaskClient() # Instantiate the thread
-thread.start() # Begin the thread
+sender = CoalescingSender(serverUrl) # sends the updates on a background thread over one keep-alive connection
+sender.start()
+Send_Ah_Count() # Set the initial values
+
+statsTimer = QtCore.QTimer() # refresh the send statistics in the status bar
+statsTimer.timeout.connect(Show_Send_Stats)
+statsTimer.start(1000)
 
 sys.exit(App.exec_()) # Exit
\ No newline at end of file
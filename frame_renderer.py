@@ -0,0 +1,95 @@
+import threading
+import time
+import cv2
+import numpy
+
+#================================ FRAME RENDERER ============================================================
+# Scales, mirrors and converts preview frames on the video thread into a small ring of preallocated buffers, so the
+# GUI thread only puts a finished image on screen. A frame is skipped when every buffer is still in use.
+
+class FrameRenderer:
+    # maxFps: the most frames per second that will be handed to the GUI, normally the display refresh rate
+    # numBuffers: number of preallocated output buffers, one is being drawn while the others are filled
+    def __init__(self, maxFps=60, numBuffers=3):
+        self.minInterval = 1.0 / maxFps if maxFps else 0.0
+        self.numBuffers = numBuffers
+        self.lock = threading.Lock()
+        self.targetWidth = 0 # size of the widget the image is shown in, set from the GUI thread
+        self.targetHeight = 0
+        self.mirror = False # mirror the preview, set from the GUI thread
+        self.buffers = [] # preallocated RGB output images
+        self.scaled = None # preallocated BGR image at the output size
+        self.flipped = None # preallocated mirrored BGR image at the output size
+        self.inUse = [] # True while the GUI has not released the buffer yet
+        self.nextBuffer = 0
+        self.lastEmitTime = 0.0
+        self.renderedCount = 0 # frames handed to the GUI
+        self.skippedCount = 0 # frames skipped by the refresh-rate throttle or because every buffer was in use
+
+    # Called from the GUI thread when the preview widget changes size
+    def setTargetSize(self, width, height):
+        with self.lock:
+            self.targetWidth = width
+            self.targetHeight = height
+
+    # Largest size that fits the target while keeping the frame's aspect ratio (same as Qt.KeepAspectRatio)
+    def outputSize(self, frameWidth, frameHeight):
+        if self.targetWidth <= 0 or self.targetHeight <= 0:
+            return frameWidth, frameHeight
+        scale = min(self.targetWidth / frameWidth, self.targetHeight / frameHeight)
+        return max(1, int(frameWidth * scale)), max(1, int(frameHeight * scale))
+
+    # Make sure the preallocated buffers match the output size, reallocating only when the size changes.
+    # Buffers the GUI has not released yet are never freed, the old size is kept until they all come back
+    def allocate(self, width, height):
+        if self.scaled is not None and self.scaled.shape[0] == height and self.scaled.shape[1] == width:
+            return
+        if any(self.inUse):
+            return
+        self.scaled = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.flipped = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.buffers = [numpy.empty((height, width, 3), dtype=numpy.uint8) for i in range(self.numBuffers)]
+        self.inUse = [False] * self.numBuffers
+        self.nextBuffer = 0
+
+    # Turn a BGR camera frame into a display-ready RGB image.
+    # Returns (index, rgbImage), or None when the frame should be skipped. index must be passed to release() later
+    def render(self, frame):
+        now = time.monotonic()
+        if now - self.lastEmitTime < self.minInterval: # the screen cannot show it anyway
+            self.skippedCount += 1
+            return None
+
+        with self.lock:
+            frameHeight, frameWidth = frame.shape[:2]
+            width, height = self.outputSize(frameWidth, frameHeight)
+            self.allocate(width, height)
+            height, width = self.scaled.shape[:2] # may still be the old size while the GUI holds an old buffer
+            index = self.nextBuffer
+            if self.inUse[index]: # the GUI is still drawing this buffer, do not overwrite it
+                self.skippedCount += 1
+                return None
+            self.inUse[index] = True
+            self.nextBuffer = (index + 1) % self.numBuffers
+            mirror = self.mirror
+
+        source = frame
+        if (width, height) != (frameWidth, frameHeight):
+            cv2.resize(frame, (width, height), dst=self.scaled, interpolation=cv2.INTER_NEAREST)
+            source = self.scaled
+        if mirror:
+            cv2.flip(source, 1, dst=self.flipped)
+            source = self.flipped
+        output = self.buffers[index]
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=output)
+
+        self.lastEmitTime = now
+        self.renderedCount += 1
+        return index, output
+
+    # Called from the GUI thread once it has copied the image into a pixmap
+    def release(self, index):
+        with self.lock:
+            if index < len(self.inUse):
+                self.inUse[index] = False
+#----------------------------------END FRAME RENDERER----------------------------------------------------------
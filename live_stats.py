@@ -0,0 +1,299 @@
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+#================================ LIVE STATS STREAM ========================================================
+# Pushes the live state of the speech to any number of observers as Server-Sent Events on its own port:
+#   /live (snapshot, then deltas), /snapshot (JSON) and / (a page that shows the stream)
+# One thread with non-blocking sockets. A subscriber that falls behind is resynced with a snapshot, then dropped.
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("speaking", "emotion", "score", "wpm", "elapsed", "flag", "ahCount")
+
+VIEWER_PAGE = b"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width">
+<title>ToastMaster's Toolbox - Live</title></head><body style="font-family:sans-serif"><h2>Live speech stats</h2>
+<table id="stats"></table><script>
+var state = {};
+function show() {
+  var rows = "";
+  for (var key in state) rows += "<tr><td>" + key + "</td><td><b>" + state[key] + "</b></td></tr>";
+  document.getElementById("stats").innerHTML = rows;
+}
+var source = new EventSource("/live");
+source.addEventListener("snapshot", function (event) { state = JSON.parse(event.data); show(); });
+source.addEventListener("delta", function (event) { Object.assign(state, JSON.parse(event.data)); show(); });
+</script></body></html>"""
+
+
+def sseEvent(kind, data, eventId=None):
+    lines = "event: " + kind + "\n"
+    if eventId is not None:
+        lines += "id: " + str(eventId) + "\n"
+    return (lines + "data: " + json.dumps(data, separators=(",", ":"), default=float) + "\n\n").encode("utf-8")
+
+
+def httpHead(status, contentType, extra=""):
+    return ("HTTP/1.1 " + status + "\r\nContent-Type: " + contentType + "\r\nCache-Control: no-cache\r\n"
+            "Access-Control-Allow-Origin: *\r\n" + extra + "\r\n").encode("latin-1")
+
+
+class Subscriber:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.request = b"" # request head, until it is complete
+        self.streaming = False # True once the client is on /live
+        self.closeWhenSent = False # True for one-shot responses
+        self.messages = deque() # bytes objects waiting to be sent, shared with the other subscribers
+        self.offset = 0 # how much of messages[0] has been sent already
+        self.queued = 0 # bytes waiting in messages, not counting what has been sent of messages[0]
+        self.resyncs = 0 # times in a row this subscriber fell behind
+        self.writing = False # registered for EVENT_WRITE
+
+
+class LiveStatsServer:
+    # interval: seconds between deltas, changes in between are merged
+    # maxBuffer: bytes a subscriber may have waiting before it gets a snapshot instead
+    # maxResyncs: snapshots in a row before a subscriber is disconnected
+    # heartbeat: seconds between keep-alive comments, so dead connections are noticed
+    # sendBuffer: kernel send buffer per subscriber, kept small so a stalled client shows up here instead of silently
+    #             holding megabytes of old deltas in the kernel
+    def __init__(self, host="0.0.0.0", port=5001, interval=0.1, maxBuffer=65536, maxResyncs=3, heartbeat=15.0,
+                 sendBuffer=32768):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.maxBuffer = maxBuffer
+        self.maxResyncs = maxResyncs
+        self.heartbeat = heartbeat
+        self.sendBuffer = sendBuffer
+        self.lock = threading.Lock()
+        self.state = {field: None for field in FIELDS}
+        self.pending = {} # changes not yet sent
+        self.sequence = 0 # id of the last delta
+        self.subscribers = {} # socket -> Subscriber
+        self.listener = None
+        self.selector = None
+        self.running = False
+        self.thread = None
+        self.ready = threading.Event()
+        self.serialisedCount = 0 # deltas serialised (once each, whatever the number of subscribers)
+        self.bytesSent = 0
+        self.resyncCount = 0 # slow subscribers sent a snapshot instead of their backlog
+        self.droppedCount = 0 # slow subscribers disconnected
+        self.cpuSeconds = 0.0 # CPU time used by the stream thread
+
+    # Any thread: change some of the fields, e.g. publish(emotion="happy", score=0.91). Never blocks on the network
+    def publish(self, **fields):
+        with self.lock:
+            for field, value in fields.items():
+                if self.state.get(field) != value:
+                    self.state[field] = value
+                    self.pending[field] = value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.state)
+
+    # Start streaming. Returns False when the port cannot be opened (e.g. it is taken), the stream then stays off and
+    # publish() keeps working without anyone to send to
+    def start(self):
+        try:
+            self.listener = socket.create_server((self.host, self.port), reuse_port=False)
+        except OSError as error:
+            logger.warning("live stats stream is off, port %s could not be opened: %s", self.port, error)
+            self.listener = None
+            return False
+        self.listener.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Live-Stats", daemon=True)
+        self.thread.start()
+        self.ready.set()
+        return True
+
+    def boundPort(self):
+        if self.listener is None:
+            return self.port
+        return self.listener.getsockname()[1]
+
+    def run(self):
+        cpuStart = time.thread_time()
+        nextFlush = time.monotonic() + self.interval
+        nextHeartbeat = time.monotonic() + self.heartbeat
+        while self.running:
+            for key, events in self.selector.select(max(0.0, nextFlush - time.monotonic())):
+                if key.fileobj is self.listener:
+                    self.accept()
+                    continue
+                subscriber = self.subscribers.get(key.fileobj)
+                if subscriber is None:
+                    continue
+                if events & selectors.EVENT_READ:
+                    self.receive(subscriber)
+                if events & selectors.EVENT_WRITE and subscriber.sock in self.subscribers:
+                    self.flush(subscriber)
+            now = time.monotonic()
+            if now >= nextFlush:
+                nextFlush = now + self.interval
+                self.broadcastChanges()
+            if now >= nextHeartbeat:
+                nextHeartbeat = now + self.heartbeat
+                self.broadcast(b": keep-alive\n\n")
+            self.cpuSeconds = time.thread_time() - cpuStart
+        for subscriber in list(self.subscribers.values()):
+            self.disconnect(subscriber)
+        self.selector.close()
+        self.listener.close()
+
+    def accept(self):
+        try:
+            sock, address = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sendBuffer)
+        self.subscribers[sock] = Subscriber(sock, address)
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def receive(self, subscriber):
+        try:
+            data = subscriber.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data: # the client went away
+            self.disconnect(subscriber)
+            return
+        if subscriber.streaming or subscriber.closeWhenSent:
+            return # nothing more is expected from the client, ignore it
+        subscriber.request += data
+        if b"\r\n\r\n" not in subscriber.request:
+            if len(subscriber.request) > 8192:
+                self.disconnect(subscriber)
+            return
+        requestLine = subscriber.request.split(b"\r\n", 1)[0].decode("latin-1").split()
+        path = requestLine[1].split("?", 1)[0] if len(requestLine) >= 2 else ""
+        if path == "/live":
+            subscriber.streaming = True
+            with self.lock:
+                state = dict(self.state)
+                eventId = self.sequence
+            self.enqueue(subscriber, httpHead("200 OK", "text/event-stream", "Connection: keep-alive\r\n") +
+                         b"retry: 2000\n\n" + sseEvent("snapshot", state, eventId))
+        else:
+            if path == "/snapshot":
+                body = json.dumps(self.snapshot()).encode("utf-8")
+                head = httpHead("200 OK", "application/json", "Content-Length: " + str(len(body)) + "\r\nConnection: close\r\n")
+            elif path == "/":
+                body = VIEWER_PAGE
+                head = httpHead("200 OK", "text/html; charset=utf-8", "Content-Length: " + str(len(body)) + "\r\nConnection: close\r\n")
+            else:
+                body = b"not found"
+                head = httpHead("404 Not Found", "text/plain", "Content-Length: " + str(len(body)) + "\r\nConnection: close\r\n")
+            subscriber.closeWhenSent = True
+            self.enqueue(subscriber, head + body)
+
+    # Serialise what changed since the last call once, and queue it on every subscriber
+    def broadcastChanges(self):
+        with self.lock:
+            if not self.pending:
+                return
+            changes = self.pending
+            self.pending = {}
+            self.sequence += 1
+            eventId = self.sequence
+        self.serialisedCount += 1
+        self.broadcast(sseEvent("delta", changes, eventId))
+
+    def broadcast(self, message):
+        for subscriber in list(self.subscribers.values()):
+            if subscriber.streaming:
+                self.enqueue(subscriber, message)
+
+    def enqueue(self, subscriber, message):
+        if subscriber.streaming and subscriber.queued + len(message) > self.maxBuffer:
+            self.resync(subscriber)
+            return
+        subscriber.messages.append(message)
+        subscriber.queued += len(message)
+        self.flush(subscriber)
+
+    # The subscriber fell behind: throw its backlog away (keeping the event it is halfway through) and send a snapshot
+    def resync(self, subscriber):
+        subscriber.resyncs += 1
+        if subscriber.resyncs > self.maxResyncs:
+            self.droppedCount += 1
+            self.disconnect(subscriber)
+            return
+        self.resyncCount += 1
+        partial = subscriber.messages[0] if subscriber.messages and subscriber.offset else None
+        subscriber.messages.clear()
+        subscriber.queued = 0
+        if partial is not None:
+            subscriber.messages.append(partial)
+            subscriber.queued = len(partial)
+        with self.lock:
+            state = dict(self.state)
+            eventId = self.sequence
+        message = sseEvent("snapshot", state, eventId)
+        subscriber.messages.append(message)
+        subscriber.queued += len(message)
+        self.flush(subscriber)
+
+    # Send as much as the socket takes without blocking
+    def flush(self, subscriber):
+        while subscriber.messages:
+            message = subscriber.messages[0]
+            try:
+                sent = subscriber.sock.send(memoryview(message)[subscriber.offset:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.disconnect(subscriber)
+                return
+            self.bytesSent += sent
+            subscriber.offset += sent
+            if subscriber.offset < len(message):
+                break
+            subscriber.messages.popleft()
+            subscriber.queued -= len(message)
+            subscriber.offset = 0
+
+        if not subscriber.messages:
+            subscriber.resyncs = 0 # caught up
+            if subscriber.closeWhenSent:
+                self.disconnect(subscriber)
+                return
+        wantWrite = bool(subscriber.messages)
+        if wantWrite != subscriber.writing:
+            subscriber.writing = wantWrite
+            self.selector.modify(subscriber.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if wantWrite else 0))
+
+    def disconnect(self, subscriber):
+        if self.subscribers.pop(subscriber.sock, None) is None:
+            return
+        try:
+            self.selector.unregister(subscriber.sock)
+        except (KeyError, ValueError):
+            pass
+        subscriber.sock.close()
+
+    def stats(self):
+        streaming = sum(1 for subscriber in list(self.subscribers.values()) if subscriber.streaming)
+        return {"subscribers": streaming, "deltas": self.serialisedCount, "bytesSent": self.bytesSent,
+                "resyncs": self.resyncCount, "dropped": self.droppedCount, "cpuSeconds": round(self.cpuSeconds, 3)}
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2.0)
+#--------------------------------END LIVE STATS STREAM-----------------------------------------------
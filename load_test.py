@@ -0,0 +1,129 @@
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy
+
+#================================ LOAD TEST ================================================================
+# Hammers /set_text and /set_color of a running server from many concurrent clients and reports requests per second
+# and the p50/p99 latency of each endpoint. Every client keeps one HTTP/1.1 connection open, like a real client would.
+#
+# Usage:
+#   python load_test.py --url http://127.0.0.1:5000 --clients 32 --seconds 10    (against the running app)
+#   python load_test.py --selftest                                               (against a throw-away echo server)
+
+BODIES = {
+    "/set_text": {"ahCount": "0", "status": "load test"},
+    "/set_color": {"red": "10", "green": "20", "blue": "30"},
+}
+
+
+# One client: alternates between the endpoints until stopAt, recording (endpoint, latency) of every request.
+# prefix is put in front of every path, e.g. "/sessions/<id>" to load one session of the session server
+def client(host, port, stopAt, latencies, errors, lock, prefix=""):
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    local = {path: [] for path in BODIES}
+    failed = 0
+    count = 0
+    while time.perf_counter() < stopAt:
+        path = "/set_text" if count % 2 == 0 else "/set_color"
+        body = dict(BODIES[path])
+        if path == "/set_text":
+            body["ahCount"] = str(count % 20)
+        data = json.dumps(body)
+        startTime = time.perf_counter()
+        try:
+            connection.request("POST", prefix + path, data, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                failed += 1
+            else:
+                local[path].append(time.perf_counter() - startTime)
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+        count += 1
+    connection.close()
+    with lock:
+        for path in BODIES:
+            latencies[path].extend(local[path])
+        errors[0] += failed
+
+
+def run(url, clients=16, seconds=5.0, prefix=""):
+    target = urlparse(url)
+    latencies = {path: [] for path in BODIES}
+    errors = [0]
+    lock = threading.Lock()
+    stopAt = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(target.hostname, target.port or 80, stopAt, latencies, errors, lock, prefix))
+               for i in range(clients)]
+    startTime = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - startTime
+
+    results = {"clients": clients, "seconds": round(elapsed, 2), "errors": errors[0]}
+    for path, values in latencies.items():
+        values = numpy.array(values) * 1000.0
+        results[path] = {
+            "requests": len(values),
+            "requestsPerSecond": round(len(values) / elapsed, 1),
+            "p50ms": round(float(numpy.percentile(values, 50)), 2) if len(values) else None,
+            "p99ms": round(float(numpy.percentile(values, 99)), 2) if len(values) else None,
+        }
+    return results
+#--------------------------------END LOAD TEST-----------------------------------------------
+
+
+# A stand-in for the app's endpoints that only echoes the JSON back, to measure the server backend on its own
+def echoApp():
+    import flask
+    app = flask.Flask("load_test")
+
+    @app.route("/set_text", methods=["POST"])
+    def Set_Text():
+        return flask.jsonify(flask.request.json)
+
+    @app.route("/set_color", methods=["POST"])
+    def Set_Color():
+        return flask.jsonify(flask.request.json)
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the /set_text and /set_color endpoints")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to test")
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long to run")
+    parser.add_argument("--prefix", default="", help="path in front of the endpoints, e.g. /sessions/<id>")
+    parser.add_argument("--selftest", action="store_true", help="start a local echo server and test that instead")
+    args = parser.parse_args(argv)
+
+    runner = None
+    url = args.url
+    if args.selftest:
+        from web_server import ServerRunner
+        runner = ServerRunner(echoApp(), host="127.0.0.1", port=0, threads=8)
+        threading.Thread(target=runner.serve, daemon=True).start()
+        runner.ready.wait()
+        url = "http://127.0.0.1:" + str(runner.boundPort())
+        print("self test against " + runner.backend() + " on " + url)
+
+    print(json.dumps(run(url, args.clients, args.seconds, args.prefix), indent=2))
+    if runner is not None:
+        runner.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
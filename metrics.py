@@ -0,0 +1,343 @@
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+
+#================================ METRICS ==================================================================
+# Counters, gauges and latency histograms for every stage of the app, served in the Prometheus text format on /metrics,
+# plus an optional trace of the timed stages for chrome://tracing. With metrics off a timed stage costs a method call.
+
+# Latency buckets in seconds: sub-millisecond for the GUI thread up to the 10 s of a slow network recognition
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def labelText(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(key + "=\"" + value + "\"" for key, value in zip(labels, escaped)) + "}"
+
+
+def labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {} # label key -> value
+        self.tracked = {} # label key -> function returning the current value, called when scraped
+
+    # Read the value from function() whenever the metrics are scraped, instead of it being set as it changes
+    def track(self, function, **labels):
+        with self.lock:
+            self.tracked[labelKey(labels)] = function
+
+    def untrack(self, **labels):
+        with self.lock:
+            self.tracked.pop(labelKey(labels), None)
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+            tracked = dict(self.tracked)
+        for key, function in tracked.items():
+            try:
+                values[key] = function()
+            except Exception: # whatever it tracked has gone away, leave it out of this scrape
+                continue
+        return [(self.name, dict(key), value) for key, value in sorted(values.items())]
+
+    def render(self):
+        lines = ["# HELP " + self.name + " " + self.help, "# TYPE " + self.name + " " + self.kind]
+        for name, labels, value in self.samples():
+            lines.append(name + labelText(labels) + " " + repr(float(value)))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = labelKey(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[labelKey(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        Metric.__init__(self, name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, **labels):
+        self.observeKey(seconds, labelKey(labels))
+
+    # observe() for a label key made once with labelKey(), saves building it on every call in hot paths
+    def observeKey(self, seconds, key):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0] # per bucket, +Inf, then the sum
+            counts[index] += 1
+            counts[-1] += seconds
+
+    def render(self):
+        lines = ["# HELP " + self.name + " " + self.help, "# TYPE " + self.name + " " + self.kind]
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for key, counts in sorted(values.items()):
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(self.name + "_bucket" + labelText(dict(labels, le=le)) + " " + str(cumulative))
+            lines.append(self.name + "_sum" + labelText(labels) + " " + repr(counts[-1]))
+            lines.append(self.name + "_count" + labelText(labels) + " " + str(cumulative))
+        return lines
+
+    # Approximate percentile (0 to 100) of one label set, from the bucket counts. None when nothing was observed
+    def percentile(self, percent, **labels):
+        with self.lock:
+            counts = self.values.get(labelKey(labels))
+            counts = list(counts) if counts else None
+        if not counts or not sum(counts[:-1]):
+            return None
+        target = sum(counts[:-1]) * percent / 100.0
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = collections.OrderedDict() # name -> Metric, in the order they were registered
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    # Everything in the Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+#--------------------------------END METRICS-----------------------------------------------
+
+
+#================================ TRACE RECORDER ============================================================
+# Records timed stages as Chrome trace "complete" events into a bounded buffer (the oldest events are dropped once it
+# is full). Nothing is recorded unless start() has been called.
+
+class TraceRecorder:
+    def __init__(self, maxEvents=500000):
+        self.events = collections.deque(maxlen=maxEvents) # appending to a deque is thread safe, no lock on the hot path
+        self.recording = False
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def start(self):
+        self.events.clear()
+        self.origin = time.perf_counter()
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    # One span: name ran from start for seconds (perf_counter times), on the calling thread
+    def complete(self, name, start, seconds, category="stage"):
+        self.events.append((name, category, start, seconds, threading.get_ident()))
+
+    # A point in time, e.g. a dropped frame or a flag change
+    def instant(self, name, category="event"):
+        if self.recording:
+            self.events.append((name, category, time.perf_counter(), None, threading.get_ident()))
+
+    def chromeTrace(self):
+        threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = []
+        for name, category, start, seconds, threadId in list(self.events):
+            event = {"name": name, "cat": category, "ts": round((start - self.origin) * 1e6, 1), "pid": self.pid,
+                     "tid": threadId}
+            if seconds is None:
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=round(seconds * 1e6, 1))
+            events.append(event)
+        for threadId in set(event["tid"] for event in events):
+            events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": threadId,
+                           "args": {"name": threadNames.get(threadId, str(threadId))}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path):
+        with open(path, "w") as traceFile:
+            json.dump(self.chromeTrace(), traceFile)
+        return path
+#--------------------------------END TRACE RECORDER-----------------------------------------------
+
+
+#================================ APP METRICS ===============================================================
+# The metrics every part of the app reports to. With enabled=False stage() hands back a shared do-nothing timer and
+# the record methods return at once, so the instrumentation can stay in the code.
+
+class StageTimer:
+    __slots__ = ("metrics", "name", "gui", "start")
+
+    def __init__(self, metrics, name, gui):
+        self.metrics = metrics
+        self.name = name
+        self.gui = gui
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.metrics.record(self.name, self.start, time.perf_counter() - self.start, self.gui)
+        return False
+
+
+class NullStageTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+NULL_STAGE = NullStageTimer()
+
+
+class Metrics:
+    def __init__(self, enabled=True, maxTraceEvents=500000):
+        self.enabled = enabled
+        self.registry = MetricsRegistry()
+        self.tracer = TraceRecorder(maxTraceEvents)
+        self.stageSeconds = self.registry.histogram("toastmaster_stage_seconds", "Time spent in each pipeline stage")
+        self.latencySeconds = self.registry.histogram("toastmaster_latency_seconds",
+                                                      "End-to-end latencies, e.g. camera frame to emotion result")
+        self.guiBusySeconds = self.registry.counter("toastmaster_gui_busy_seconds_total",
+                                                    "Time the GUI thread spent in the app's own handlers")
+        self.events = self.registry.counter("toastmaster_events_total",
+                                            "Things that happened, e.g. recognizer errors and timeouts, by kind")
+        self.queueDepth = self.registry.gauge("toastmaster_queue_depth", "Items waiting in each queue")
+        self.dropped = self.registry.counter("toastmaster_dropped_total", "Work thrown away to keep up, by queue")
+        self.stageKeys = {} # stage name -> label key, so record() does not build one per call
+        self.startTime = time.time()
+        self.registry.gauge("toastmaster_start_time_seconds", "Unix time the app started").track(lambda: self.startTime)
+
+    # Time a block of code as stage `name`. gui=True for handlers running on the GUI thread
+    def stage(self, name, gui=False):
+        if not self.enabled:
+            return NULL_STAGE
+        return StageTimer(self, name, gui)
+
+    def record(self, name, start, seconds, gui=False):
+        key = self.stageKeys.get(name)
+        if key is None:
+            key = self.stageKeys[name] = labelKey({"stage": name})
+        self.stageSeconds.observeKey(seconds, key)
+        if gui:
+            self.guiBusySeconds.inc(seconds)
+        if self.tracer.recording:
+            self.tracer.complete(name, start, seconds)
+
+    # A latency measured elsewhere (seconds), e.g. from a capture timestamp to now
+    def latency(self, name, seconds):
+        if self.enabled:
+            self.latencySeconds.observe(seconds, path=name)
+
+    def count(self, kind, amount=1):
+        if self.enabled:
+            self.events.inc(amount, kind=kind)
+            self.tracer.instant(kind)
+
+    # function with every call timed as stage `name`, for wrapping callbacks and backends
+    def timed(self, name, function):
+        def timedFunction(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return timedFunction
+
+    def render(self):
+        return self.registry.render()
+#--------------------------------END APP METRICS-----------------------------------------------
+
+
+#================================ METRICS ROUTES ===========================================================
+#   GET  /metrics        every metric, Prometheus text format
+#   POST /trace/start    start recording a trace (drops whatever was recorded before)
+#   POST /trace/stop     stop recording, returns the trace as Chrome trace JSON
+#   GET  /trace          the trace recorded so far, Chrome trace JSON
+# Every request to the app is also timed, per endpoint, in toastmaster_http_request_seconds.
+def registerMetricsRoutes(app, metrics):
+    import flask
+    requestSeconds = metrics.registry.histogram("toastmaster_http_request_seconds", "Time to handle each web request")
+    requestStarts = threading.local()
+
+    @app.before_request
+    def Start_Request_Timer():
+        requestStarts.start = time.perf_counter()
+
+    @app.after_request
+    def Stop_Request_Timer(response):
+        start = getattr(requestStarts, "start", None)
+        if metrics.enabled and start is not None:
+            seconds = time.perf_counter() - start
+            endpoint = flask.request.endpoint or "unknown"
+            requestSeconds.observe(seconds, endpoint=endpoint, status=str(response.status_code))
+            if metrics.tracer.recording and start >= metrics.tracer.origin: # not the request that started the trace
+                metrics.tracer.complete("http " + endpoint, start, seconds, "http")
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def Metrics_Text():
+        return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/trace/start", methods=["POST"])
+    def Start_Trace():
+        metrics.tracer.start()
+        return flask.jsonify(recording=True)
+
+    @app.route("/trace/stop", methods=["POST"])
+    def Stop_Trace():
+        metrics.tracer.stop()
+        return flask.jsonify(metrics.tracer.chromeTrace())
+
+    @app.route("/trace", methods=["GET"])
+    def Get_Trace():
+        return flask.jsonify(metrics.tracer.chromeTrace())
+#--------------------------------END METRICS ROUTES-----------------------------------------------
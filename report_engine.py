@@ -0,0 +1,222 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy
+
+from emotion_store import EMOTIONS
+
+#================================ SESSION REPORT ============================================================
+# Keeps the report of the speech up to date while it is being given, so "Generate Report" only reads running totals.
+
+class SessionReport:
+    def __init__(self, emotionStore):
+        self.emotionStore = emotionStore
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.rateSum = 0.0 # sum of every speech rate sample, words per minute
+            self.rateCount = 0 # number of speech rate samples
+            self.ahCount = 0
+            self.seconds = 0 # how long the speaker talked
+            self.pauseStats = None # latest pause statistics from the local speaking rate estimator
+            self.fillerCounts = None # {filler word: count} from the filler word detector
+            self.audience = None # audience statistics from the audience camera, when there is one
+
+    def addSpeechRate(self, wordsPerMinute):
+        with self.lock:
+            self.rateSum += wordsPerMinute
+            self.rateCount += 1
+
+    def setAhCount(self, count):
+        self.ahCount = int(count)
+
+    def setDuration(self, seconds):
+        self.seconds = seconds
+
+    def setPauseStats(self, stats):
+        self.pauseStats = stats
+
+    def setFillerCounts(self, counts):
+        self.fillerCounts = dict(counts)
+
+    def setAudienceStats(self, stats):
+        self.audience = stats
+
+    def averageSpeechRate(self):
+        with self.lock:
+            return self.rateSum / self.rateCount if self.rateCount else 0
+
+    # Everything in the report as a plain dict, ready to be shown, saved as JSON or indexed
+    def summary(self, speaker="Speaker"):
+        minutes = self.seconds / 60.0
+        result = {
+            "speaker": speaker,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "averageWpm": round(self.averageSpeechRate(), 2),
+            "speechRateSamples": self.rateCount,
+            "topEmotion": self.emotionStore.topEmotion(),
+            "leastEmotion": self.emotionStore.leastEmotion(),
+            "emotionCounts": self.emotionStore.counts(),
+            "meanEmotionScores": self.emotionStore.meanScores(),
+            "ahCount": self.ahCount,
+            "fillerWordsPerMinute": round(self.ahCount / minutes, 3) if minutes > 0 else 0.0,
+            "durationSeconds": self.seconds,
+        }
+        if self.pauseStats is not None:
+            result["pauseCount"] = self.pauseStats["pauseCount"]
+            result["meanPauseSeconds"] = self.pauseStats["meanPause"]
+            result["longestPauseSeconds"] = self.pauseStats["longestPause"]
+        if self.fillerCounts is not None:
+            result["fillerWordCounts"] = self.fillerCounts
+        if self.audience is not None:
+            result["audience"] = self.audience
+        return result
+
+
+# The report as it is shown on the report page and written to the text file
+def reportText(summary):
+    mins, secs = divmod(int(summary["durationSeconds"]), 60)
+    outputText = "===========TOASTMASTERS' TOOLBOX REPORT===========\n"
+    if "averageWpm" in summary: # left out of a video-only report (batch_analyzer.py)
+        outputText = outputText + "   Average Words per Minute: " + str(summary["averageWpm"]) + "\n"
+    outputText = outputText + "   Your Top Used Emotion is: " + str(summary["topEmotion"]) + "\n"
+    outputText = outputText + " Your Least Used Emotion is: " + str(summary["leastEmotion"]) + "\n"
+    if "ahCount" in summary:
+        outputText = outputText + "Number of Filler Words Used: " + str(summary["ahCount"]) + "\n"
+    outputText = outputText + "              You Spoke for: " + str(mins) + " minutes, " + str(secs) + " seconds\n"
+    if "audience" in summary:
+        audience = summary["audience"]
+        outputText = outputText + "  Audience's Top Emotion was: " + str(audience["topEmotion"]) + "\n"
+        outputText = outputText + "         People in Audience: " + str(audience["peakFaces"]) + " at most (" + str(audience["averageFaces"]) + " watching on average)\n"
+    return outputText
+#--------------------------------END SESSION REPORT-----------------------------------------------
+
+
+#================================ REPORT HISTORY ============================================================
+# Every saved report goes into a history folder three ways:
+#   Reports/<speaker> <date>.json  the full report, readable by anything
+#   reports.bin                     one fixed-size binary record per report (HISTORY_RECORD), loadable with numpy.fromfile
+#   history.sqlite                  an index on (speaker, date) so trend queries only touch the rows they need
+# Queries go to the SQLite index and take milliseconds even with thousands of speeches, nothing is re-parsed.
+
+HISTORY_RECORD = numpy.dtype([
+    ("speaker", "S32"), ("time", "<f8"), ("averageWpm", "<f4"), ("durationSeconds", "<f4"), ("ahCount", "<u4"),
+    ("fillerWordsPerMinute", "<f4"), ("topEmotion", "i1"), ("leastEmotion", "i1"), ("emotionCounts", "<u4", len(EMOTIONS)),
+])
+
+
+# A speaker's name made safe to use in a file name: letters, digits, spaces, "_" and "-" are kept, anything else
+# (path separators, "..", ...) becomes "_"
+def safeFileName(name, maxLength=64):
+    return re.sub(r"[^\w -]", "_", name).strip()[:maxLength] or "Speaker"
+
+
+class ReportHistory:
+    def __init__(self, folder="Report History"):
+        self.folder = folder
+        os.makedirs(os.path.join(folder, "Reports"), exist_ok=True)
+        self.binaryPath = os.path.join(folder, "reports.bin")
+        self.database = sqlite3.connect(os.path.join(folder, "history.sqlite"), check_same_thread=False)
+        self.database.execute("""CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY, speaker TEXT NOT NULL, date TEXT NOT NULL, averageWpm REAL, durationSeconds REAL,
+            ahCount INTEGER, fillerWordsPerMinute REAL, topEmotion TEXT, leastEmotion TEXT, path TEXT)""")
+        self.database.execute("CREATE INDEX IF NOT EXISTS speakerDate ON reports (speaker, date)")
+        self.database.execute("CREATE INDEX IF NOT EXISTS reportDate ON reports (date)")
+        self.database.commit()
+
+    # Save one report summary (from SessionReport.summary()) and index it. Returns the path of the JSON file, which is
+    # named after the report's row id, so two reports of one speaker in the same second never share a file
+    def add(self, summary):
+        cursor = self.database.execute(
+            "INSERT INTO reports (speaker, date, averageWpm, durationSeconds, ahCount, fillerWordsPerMinute, topEmotion, leastEmotion) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (summary["speaker"], summary["date"], summary["averageWpm"], summary["durationSeconds"], summary["ahCount"],
+             summary["fillerWordsPerMinute"], summary["topEmotion"], summary["leastEmotion"]))
+        name = str(cursor.lastrowid) + " " + safeFileName(summary["speaker"]) + " " + summary["date"].replace(":", "-") + ".json"
+        path = os.path.join(self.folder, "Reports", name)
+        try:
+            with open(path, "w") as reportFile:
+                json.dump(summary, reportFile, indent=2)
+        except Exception:
+            self.database.rollback() # no index row for a report that was not saved
+            raise
+        self.database.execute("UPDATE reports SET path = ? WHERE id = ?", (path, cursor.lastrowid))
+
+        record = numpy.zeros(1, dtype=HISTORY_RECORD)
+        # at most 32 bytes, cut between characters so the name still decodes
+        record["speaker"] = summary["speaker"].encode("utf-8")[:32].decode("utf-8", "ignore").encode("utf-8")
+        record["time"] = time.mktime(time.strptime(summary["date"], "%Y-%m-%d %H:%M:%S"))
+        record["averageWpm"] = summary["averageWpm"]
+        record["durationSeconds"] = summary["durationSeconds"]
+        record["ahCount"] = summary["ahCount"]
+        record["fillerWordsPerMinute"] = summary["fillerWordsPerMinute"]
+        record["topEmotion"] = EMOTIONS.index(summary["topEmotion"]) if summary["topEmotion"] in EMOTIONS else -1
+        record["leastEmotion"] = EMOTIONS.index(summary["leastEmotion"]) if summary["leastEmotion"] in EMOTIONS else -1
+        record["emotionCounts"] = [summary["emotionCounts"].get(emotion, 0) for emotion in EMOTIONS]
+        with open(self.binaryPath, "ab") as binaryFile:
+            binaryFile.write(record.tobytes())
+
+        self.database.commit()
+        return path
+
+    # [(date, averageWpm)] of the speaker's last `last` speeches, oldest first
+    def wpmTrend(self, speaker, last=50):
+        rows = self.database.execute(
+            "SELECT date, averageWpm FROM reports WHERE speaker = ? ORDER BY date DESC LIMIT ?", (speaker, last)).fetchall()
+        return rows[::-1]
+
+    # [(date, fillerWordsPerMinute)] of the last `last` speeches, by one speaker or by everyone, oldest first
+    def fillerTrend(self, speaker=None, last=50):
+        if speaker is None:
+            rows = self.database.execute(
+                "SELECT date, fillerWordsPerMinute FROM reports ORDER BY date DESC LIMIT ?", (last,)).fetchall()
+        else:
+            rows = self.database.execute(
+                "SELECT date, fillerWordsPerMinute FROM reports WHERE speaker = ? ORDER BY date DESC LIMIT ?", (speaker, last)).fetchall()
+        return rows[::-1]
+
+    # {speaker: (speeches, average wpm, average filler words per minute)}
+    def speakerAverages(self):
+        rows = self.database.execute(
+            "SELECT speaker, COUNT(*), AVG(averageWpm), AVG(fillerWordsPerMinute) FROM reports GROUP BY speaker").fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    # The full report of a speaker's most recent speech (or of anyone's when speaker is None), None if there is none or
+    # its file has been deleted
+    def latest(self, speaker=None):
+        if speaker is None:
+            row = self.database.execute("SELECT path FROM reports ORDER BY date DESC LIMIT 1").fetchone()
+        else:
+            row = self.database.execute("SELECT path FROM reports WHERE speaker = ? ORDER BY date DESC LIMIT 1", (speaker,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(row[0]) as reportFile:
+                return json.load(reportFile)
+        except FileNotFoundError:
+            return None
+
+    # Every report as one NumPy array, read straight from the binary history
+    def loadBinary(self):
+        if not os.path.exists(self.binaryPath):
+            return numpy.zeros(0, dtype=HISTORY_RECORD)
+        return numpy.fromfile(self.binaryPath, dtype=HISTORY_RECORD)
+
+    # Write the whole index out as a CSV file
+    def exportCsv(self, path):
+        cursor = self.database.execute(
+            "SELECT speaker, date, averageWpm, durationSeconds, ahCount, fillerWordsPerMinute, topEmotion, leastEmotion FROM reports ORDER BY date")
+        with open(path, "w", newline="") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow([column[0] for column in cursor.description])
+            writer.writerows(cursor)
+
+    def close(self):
+        self.database.close()
+#--------------------------------END REPORT HISTORY-----------------------------------------------
@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import threading
+import time
+
+#================================ SESSION CLOCK =============================================================
+# One clock for the whole speech, computed from time.monotonic() so it cannot drift, with paused time left out.
+
+class SessionClock:
+    # now: the time source, time.monotonic unless a fake clock is given for testing
+    def __init__(self, now=time.monotonic):
+        self.now = now
+        self.lock = threading.Lock()
+        self.listeners = [] # called with no arguments whenever the clock starts, pauses, resumes or stops
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.startTime = None # monotonic time the session started
+            self.stopTime = None # monotonic time the session stopped, None while it runs
+            self.pausedAt = None # monotonic time of the pause going on right now
+            self.pauses = [] # (begin, end) monotonic times of every finished pause
+
+    def start(self):
+        with self.lock:
+            self.startTime = self.now()
+            self.stopTime = None
+            self.pausedAt = None
+            self.pauses = []
+        self.notify()
+
+    def pause(self):
+        with self.lock:
+            if self.startTime is None or self.stopTime is not None or self.pausedAt is not None:
+                return False
+            self.pausedAt = self.now()
+        self.notify()
+        return True
+
+    def resume(self):
+        with self.lock:
+            if self.pausedAt is None:
+                return False
+            self.pauses.append((self.pausedAt, self.now()))
+            self.pausedAt = None
+        self.notify()
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.startTime is None or self.stopTime is not None:
+                return
+            self.stopTime = self.pausedAt if self.pausedAt is not None else self.now()
+        self.notify()
+
+    def running(self):
+        return self.startTime is not None and self.stopTime is None and self.pausedAt is None
+
+    def paused(self):
+        return self.pausedAt is not None
+
+    # Session seconds at a time.monotonic() timestamp (now when None): time since the start, without the pauses
+    def toSession(self, timestamp=None):
+        with self.lock:
+            if self.startTime is None:
+                return 0.0
+            moment = self.now() if timestamp is None else timestamp
+            if self.stopTime is not None:
+                moment = min(moment, self.stopTime)
+            if self.pausedAt is not None:
+                moment = min(moment, self.pausedAt)
+            pausedSeconds = sum(min(end, moment) - begin for begin, end in self.pauses if begin < moment)
+            return max(0.0, moment - self.startTime - pausedSeconds)
+
+    def elapsed(self):
+        return self.toSession()
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+#--------------------------------END SESSION CLOCK-----------------------------------------------
+
+
+#================================ CLOCK SCHEDULER ===========================================================
+# Fires callbacks at given session times (the flag thresholds, the time limit, a once-a-second display tick). Due times
+# are absolute session seconds, so a late or slow callback never pushes the following ones back, and a pause simply
+# holds everything until the clock resumes. run() sleeps until the next event is due instead of polling every second.
+
+class ScheduledEvent:
+    def __init__(self, due, callback, name, interval=None):
+        self.due = due # session seconds
+        self.callback = callback # callback(due)
+        self.name = name
+        self.interval = interval # seconds between repeats, None for a one-off event
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ClockScheduler:
+    # maxWait: the longest run() sleeps before checking shouldStop() again
+    def __init__(self, clock, maxWait=0.25):
+        self.clock = clock
+        self.maxWait = maxWait
+        self.condition = threading.Condition()
+        self.events = [] # heap of (due, order, event)
+        self.order = itertools.count() # keeps events due at the same time in the order they were added
+        self.fired = [] # (name, due, session time it actually fired), for checking the timing
+        self.clock.addListener(self.wake)
+
+    # Call callback(due) once the clock reaches `seconds`
+    def at(self, seconds, callback, name=None):
+        return self.add(ScheduledEvent(float(seconds), callback, name))
+
+    # Call callback(due) at start, start + interval, start + 2 * interval, ... (due times never drift)
+    def every(self, interval, callback, name=None, start=0.0):
+        return self.add(ScheduledEvent(float(start), callback, name, float(interval)))
+
+    def add(self, event):
+        with self.condition:
+            heapq.heappush(self.events, (event.due, next(self.order), event))
+            self.condition.notify()
+        return event
+
+    def clear(self):
+        with self.condition:
+            self.events = []
+            self.condition.notify()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify()
+
+    # Drop every event and stop listening to the clock, for a scheduler that is no longer needed
+    def close(self):
+        self.clear()
+        self.clock.removeListener(self.wake)
+
+    # Fire every event that is due now. Returns the number fired
+    def runDue(self):
+        count = 0
+        while True:
+            now = self.clock.elapsed()
+            with self.condition:
+                while self.events and self.events[0][2].cancelled:
+                    heapq.heappop(self.events)
+                if not self.events or self.events[0][0] > now or not self.clock.running():
+                    return count
+                due, order, event = heapq.heappop(self.events)
+                if event.interval is not None:
+                    heapq.heappush(self.events, (due + event.interval, next(self.order), event))
+                    event.due = due + event.interval
+            self.fired.append((event.name, due, now))
+            event.callback(due)
+            count += 1
+
+    # Seconds of real time until the next event is due, None when nothing is scheduled or the clock is not running
+    def untilNext(self):
+        with self.condition:
+            if not self.events:
+                return None
+            due = self.events[0][0]
+        if not self.clock.running():
+            return None
+        return max(0.0, due - self.clock.elapsed())
+
+    # Fire events as they fall due until shouldStop() returns True or nothing is left to fire
+    def run(self, shouldStop):
+        while not shouldStop():
+            self.runDue()
+            with self.condition:
+                empty = not self.events
+            if empty:
+                return
+            wait = self.untilNext()
+            with self.condition:
+                self.condition.wait(self.maxWait if wait is None else min(wait, self.maxWait))
+#--------------------------------END CLOCK SCHEDULER-----------------------------------------------
@@ -0,0 +1,202 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy
+
+from emotion_store import EMOTIONS
+
+#================================ SESSION LOG ==============================================================
+# Append-only binary recording of a speech: a 64 byte header, then 48 byte records written through a memory map.
+# The kind byte of a record is written last, so readers stop at the first record a crash left unfinished.
+
+MAGIC = b"TMSLOG01"
+VERSION = 1
+HEADER = struct.Struct("<8sHHHHd") # magic, version, record size, header size, reserved, start wall time
+HEADER_SIZE = 64
+TEXT_BYTES = 28 # bytes of transcript text carried by each TEXT record
+
+# record kinds
+EMOTION = 1 # scores = the 7 FER scores, flags bit 0 = face present
+SPEECH_RATE = 2 # value = words per minute, aux = source (RATE_TRANSCRIPT or RATE_LOCAL)
+TRANSCRIPT = 3 # count = number of TEXT records just before this one, aux = length of the text in bytes
+TEXT = 4 # text = next TEXT_BYTES bytes of a transcript
+AH_COUNT = 5 # value = the new ah count
+TIMER = 6 # value = seconds into the speech, aux = timer event (see TIMER_EVENTS)
+
+RATE_TRANSCRIPT = 0
+RATE_LOCAL = 1
+TIMER_EVENTS = ("start", "green", "yellow", "red", "limit", "stop", "pause", "resume")
+
+RECORD = numpy.dtype({
+    "names": ["time", "kind", "flags", "count", "value", "scores", "text", "aux"],
+    "formats": ["<f8", "u1", "u1", "<u2", "<f4", ("<f4", 7), "S" + str(TEXT_BYTES), "<i4"],
+    "offsets": [0, 8, 9, 10, 12, 16, 16, 44], # scores and text share the same bytes
+    "itemsize": 48,
+})
+
+
+class SessionLog:
+    # path: file to create (an existing file is overwritten)
+    # growRecords: how many records the file is grown by each time it fills up
+    # clock: optional SessionClock, record times are then its session seconds (pauses left out)
+    def __init__(self, path, growRecords=16384, clock=None):
+        self.path = path
+        self.growRecords = growRecords
+        self.clock = clock
+        self.lock = threading.RLock() # re-entrant, transcript() holds it around several write() calls
+        self.origin = time.monotonic() # record times are seconds since this moment
+        self.file = open(path, "w+b")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, HEADER_SIZE, 0, time.time()).ljust(HEADER_SIZE, b"\0"))
+        self.capacity = 0
+        self.count = 0 # records written
+        self.map = None
+        self.records = None
+        self.grow()
+
+    # Make room for growRecords more records and map the file again
+    def grow(self):
+        self.records = None # the array view has to go before the map can be closed
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.capacity += self.growRecords
+        self.file.truncate(HEADER_SIZE + self.capacity * RECORD.itemsize)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.records = numpy.frombuffer(self.map, dtype=RECORD, count=self.capacity, offset=HEADER_SIZE)
+
+    # Seconds since the session started, from a time.monotonic() value (now when None)
+    def sessionTime(self, timestamp=None):
+        if self.clock is not None:
+            return self.clock.toSession(timestamp)
+        return (time.monotonic() if timestamp is None else timestamp) - self.origin
+
+    # Write one record, the kind byte goes in last so a half-written record is never seen as complete
+    def write(self, kind, timestamp=None, flags=0, count=0, value=0.0, scores=None, text=None, aux=0):
+        with self.lock:
+            if self.records is None:
+                return
+            if self.count >= self.capacity:
+                self.grow()
+            record = self.records[self.count]
+            record["time"] = self.sessionTime(timestamp)
+            record["flags"] = flags
+            record["count"] = count
+            record["value"] = value
+            if scores is not None:
+                record["scores"] = scores
+            if text is not None:
+                record["text"] = text
+            record["aux"] = aux
+            record["kind"] = kind # commit
+            self.count += 1
+
+    def emotion(self, scores, timestamp=None):
+        if scores is None:
+            self.write(EMOTION, timestamp, flags=0)
+        elif isinstance(scores, dict):
+            self.write(EMOTION, timestamp, flags=1, scores=[scores.get(emotion, 0.0) for emotion in EMOTIONS])
+        else:
+            self.write(EMOTION, timestamp, flags=1, scores=scores)
+
+    def speechRate(self, wordsPerMinute, source=RATE_TRANSCRIPT, timestamp=None):
+        self.write(SPEECH_RATE, timestamp, value=wordsPerMinute, aux=source)
+
+    def transcript(self, text, timestamp=None):
+        data = text.encode("utf-8")
+        pieces = [data[i:i + TEXT_BYTES] for i in range(0, len(data), TEXT_BYTES)]
+        with self.lock: # keep the TEXT records and their TRANSCRIPT record together
+            for piece in pieces:
+                self.write(TEXT, timestamp, text=piece)
+            self.write(TRANSCRIPT, timestamp, count=len(pieces), aux=len(data))
+
+    def ahCount(self, count, timestamp=None):
+        self.write(AH_COUNT, timestamp, value=count)
+
+    def timerEvent(self, event, seconds, timestamp=None):
+        self.write(TIMER, timestamp, value=seconds, aux=TIMER_EVENTS.index(event))
+
+    # Push everything to disk and trim the unused space at the end of the file
+    def close(self):
+        with self.lock:
+            if self.records is None:
+                return
+            self.records = None
+            self.map.flush()
+            self.map.close()
+            self.file.truncate(HEADER_SIZE + self.count * RECORD.itemsize)
+            self.file.close()
+
+
+# Stand-in used while no speech is being recorded, so callers never have to check
+class NullSessionLog:
+    def emotion(self, scores, timestamp=None):
+        pass
+
+    def speechRate(self, wordsPerMinute, source=RATE_TRANSCRIPT, timestamp=None):
+        pass
+
+    def transcript(self, text, timestamp=None):
+        pass
+
+    def ahCount(self, count, timestamp=None):
+        pass
+
+    def timerEvent(self, event, seconds, timestamp=None):
+        pass
+
+    def close(self):
+        pass
+#--------------------------------END SESSION LOG-----------------------------------------------
+
+
+#================================ READING A SESSION LOG =====================================================
+# Open a session log read-only. Returns (startWallTime, records): records is a NumPy structured array mapped straight
+# onto the file (no copy), cut off at the last complete record, so it can be read while the session is still running
+# or after a crash
+def readSessionLog(path):
+    with open(path, "rb") as file:
+        magic, version, recordSize, headerSize, reserved, startWallTime = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or recordSize != RECORD.itemsize:
+        raise ValueError(path + " is not a session log")
+    fileRecords = (os.path.getsize(path) - headerSize) // recordSize
+    if fileRecords <= 0:
+        return startWallTime, numpy.zeros(0, dtype=RECORD)
+    records = numpy.memmap(path, dtype=RECORD, mode="r", offset=headerSize, shape=(fileRecords,))
+    unfinished = numpy.flatnonzero(records["kind"] == 0)
+    if len(unfinished):
+        records = records[:unfinished[0]]
+    return startWallTime, records
+
+
+# (times, scores, facePresent) of every emotion record
+def emotionRecords(records):
+    rows = records[records["kind"] == EMOTION]
+    return rows["time"], rows["scores"], (rows["flags"] & 1).astype(bool)
+
+
+# (times, wordsPerMinute) of the speech rate samples from one source
+def speechRateRecords(records, source=RATE_TRANSCRIPT):
+    rows = records[(records["kind"] == SPEECH_RATE) & (records["aux"] == source)]
+    return rows["time"], rows["value"]
+
+
+# [(time, text)] of every transcript that was fully written
+def transcriptRecords(records):
+    result = []
+    for index in numpy.flatnonzero(records["kind"] == TRANSCRIPT):
+        count = int(records["count"][index])
+        pieces = records["text"][index - count:index]
+        if count > index or not numpy.all(records["kind"][index - count:index] == TEXT):
+            continue
+        data = b"".join(piece.ljust(TEXT_BYTES, b"\0") for piece in pieces)[:int(records["aux"][index])]
+        result.append((float(records["time"][index]), data.decode("utf-8", "replace")))
+    return result
+
+
+# [(time, event name, seconds into the speech)] of every timer event
+def timerRecords(records):
+    rows = records[records["kind"] == TIMER]
+    return [(float(row["time"]), TIMER_EVENTS[row["aux"]], float(row["value"])) for row in rows]
+#--------------------------------END READING A SESSION LOG-----------------------------------------------
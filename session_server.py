@@ -0,0 +1,381 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+import flask
+
+from speech_core import SpeechSession
+from speech_pipeline import BACKENDS
+
+#================================ SPEECH SESSIONS ==========================================================
+# One computer can coach several speeches at once (one per room on a contest night, each with its own camera,
+# microphone and ah-counter). Every speech is a SpeechSession (speech_core.py), which owns its emotion store, report,
+# session log, clock and, when given a camera and a microphone, its own video and speech pipelines. This module is
+# the web front-end over them: the SessionManager keys sessions by id, evicts the ones nobody has used for a while,
+# and flushes their log and report to disk when they go.
+#
+# HTTP API (registerSessionRoutes), every room's ah-counter and timer keeper talk to their own session:
+#   POST   /sessions                  create: {"speaker", "video", "audio", "backend", "rateSource",
+#                                              "green", "yellow", "red", "limit"}
+#   GET    /sessions                  state of every session
+#   GET    /sessions/<id>             state of one session
+#   POST   /sessions/<id>/start       start the speech (clock, pipelines, log)
+#   POST   /sessions/<id>/stop        stop the speech
+#   POST   /sessions/<id>/pause       hold the speech clock, /resume carries on
+#   POST   /sessions/<id>/set_text    same body as /set_text: {"ahCount", "status"}
+#   POST   /sessions/<id>/set_color   same body as /set_color: {"red", "green", "blue"}
+#   GET    /sessions/<id>/report      the report so far
+#   DELETE /sessions/<id>             end the session, flush it to disk and return the final report
+#
+# Every body is checked before it reaches a session, a bad one gets a 400 with the reason. "video" and "audio" can
+# only name a device the manager was configured with (videoSources/audioSources) or a file in its uploadFolder, so a
+# client on the network cannot make the process open any camera or path it likes.
+
+MAX_SECONDS = 4 * 3600 # longest flag threshold or time limit a session accepts
+MAX_AH_COUNT = 100000
+
+
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# value as an int when it is a whole number from low to high (the clients send numbers as strings), otherwise None
+def wholeNumber(value, low, high):
+    if isinstance(value, (bool, float)):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if low <= number <= high else None
+
+
+# Reason a /set_text body is not acceptable, None when it is fine
+def textError(payload):
+    if not isinstance(payload, dict):
+        return "expected a JSON object"
+    if "status" in payload and not isinstance(payload["status"], str):
+        return "status must be a string"
+    if "ahCount" in payload and wholeNumber(payload["ahCount"], 0, MAX_AH_COUNT) is None:
+        return "ahCount must be a whole number from 0 to " + str(MAX_AH_COUNT)
+    return None
+
+
+# Reason a /set_color body is not acceptable, None when it is fine
+def colorError(payload):
+    if not isinstance(payload, dict):
+        return "expected a JSON object"
+    for channel in ("red", "green", "blue"):
+        if wholeNumber(payload.get(channel, 0), 0, 255) is None:
+            return channel + " must be a whole number from 0 to 255"
+    return None
+
+
+class SessionManager:
+    # folder: where every session's log and final report are written
+    # idleSeconds: a session no client has sent a request for in this long is evicted, even while its devices run
+    # history: optional ReportHistory, every closed session's report is added to it
+    # videoSources, audioSources: devices a client may ask for by name (camera indexes, "synthetic", "default", ...)
+    # uploadFolder: a client may also name a recording in this folder, None for no recordings
+    # sessionOptions: defaults for every new session (detectorFactory, ferWorkers, ...)
+    def __init__(self, folder="Sessions", idleSeconds=1800, history=None, maxSessions=16, videoSources=("synthetic",),
+                 audioSources=(), uploadFolder=None, **sessionOptions):
+        self.folder = folder
+        self.videoSources = tuple(videoSources)
+        self.audioSources = tuple(audioSources)
+        self.uploadFolder = uploadFolder
+        self.idleSeconds = idleSeconds
+        self.history = history
+        self.maxSessions = maxSessions
+        self.sessionOptions = sessionOptions
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.reaper = None
+        self.evictedCount = 0
+
+    # A client's "video" or "audio": a configured device, or the path of a file in uploadFolder. Raises ValueError
+    def resolveSource(self, source, devices):
+        if source is None or (source in devices and not isinstance(source, bool)):
+            return source
+        if isinstance(source, str) and self.uploadFolder is not None:
+            folder = os.path.realpath(self.uploadFolder)
+            path = os.path.realpath(os.path.join(folder, source))
+            if os.path.dirname(path) == folder and os.path.isfile(path):
+                return path
+        raise ValueError("not an available device or uploaded recording: " + repr(source))
+
+    # Check the options a client sent to POST /sessions. Returns them ready for create(), raises ValueError
+    def checkOptions(self, options):
+        if not isinstance(options, dict):
+            raise ValueError("expected a JSON object")
+        unknown = set(options) - {"speaker", "video", "audio", "backend", "rateSource", "green", "yellow", "red", "limit"}
+        if unknown:
+            raise ValueError("unknown options: " + ", ".join(sorted(unknown)))
+        checked = dict(options)
+        if not isinstance(options.get("speaker", ""), str) or len(options.get("speaker", "")) > 64:
+            raise ValueError("speaker must be a name of at most 64 characters")
+        if options.get("backend", "google") not in BACKENDS:
+            raise ValueError("backend must be one of " + ", ".join(sorted(BACKENDS)))
+        if options.get("rateSource", "transcript") not in ("transcript", "local"):
+            raise ValueError("rateSource must be transcript or local")
+        times = []
+        for name, default in (("green", 300), ("yellow", 360), ("red", 420), ("limit", 450)):
+            value = options.get(name, default)
+            if not isNumber(value) or not 0 < value <= MAX_SECONDS:
+                raise ValueError(name + " must be a number of seconds from 1 to " + str(MAX_SECONDS))
+            times.append(value)
+        if times != sorted(times):
+            raise ValueError("green, yellow, red and limit must come in that order")
+        checked["video"] = self.resolveSource(options.get("video"), self.videoSources)
+        checked["audio"] = self.resolveSource(options.get("audio"), self.audioSources)
+        return checked
+
+    # Returns the new session, or None when maxSessions are already open
+    def create(self, **options):
+        config = dict(self.sessionOptions)
+        config.update(options)
+        with self.lock:
+            if len(self.sessions) >= self.maxSessions:
+                return None
+            sessionId = uuid.uuid4().hex[:8]
+            session = SpeechSession(sessionId, folder=self.folder, **config)
+            self.sessions[sessionId] = session
+        return session
+
+    def get(self, sessionId):
+        with self.lock:
+            session = self.sessions.get(sessionId)
+        if session is not None:
+            session.touch()
+        return session
+
+    def list(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    # Close one session, flush it to disk and return its final report (None if there is no such session)
+    def close(self, sessionId):
+        with self.lock:
+            session = self.sessions.pop(sessionId, None)
+        if session is None:
+            return None
+        summary = session.close()
+        if self.history is not None:
+            self.history.add(summary)
+        return summary
+
+    # Close every session idle for longer than idleSeconds. Returns the ids that were evicted
+    def evictIdle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [sessionId for sessionId, session in self.sessions.items() if now - session.lastActive > self.idleSeconds]
+        for sessionId in idle:
+            self.close(sessionId)
+            self.evictedCount += 1
+        return idle
+
+    # Check for idle sessions every interval seconds on a background thread
+    def startReaper(self, interval=30.0):
+        def reap():
+            while not self.stopEvent.wait(interval):
+                self.evictIdle()
+        self.reaper = threading.Thread(target=reap, name="Session-Reaper", daemon=True)
+        self.reaper.start()
+
+    def closeAll(self):
+        self.stopEvent.set()
+        for session in self.list():
+            self.close(session.id)
+#--------------------------------END SPEECH SESSIONS-----------------------------------------------
+
+
+#================================ SESSION ROUTES ===========================================================
+def registerSessionRoutes(app, manager):
+    sessions = flask.Blueprint("sessions", __name__, url_prefix="/sessions")
+
+    def lookup(sessionId):
+        session = manager.get(sessionId)
+        if session is None:
+            flask.abort(404)
+        return session
+
+    @sessions.route("", methods=["POST"])
+    def Create_Session():
+        options = flask.request.get_json(silent=True)
+        try:
+            options = manager.checkOptions({} if options is None else options)
+        except ValueError as error:
+            return flask.jsonify(error=str(error)), 400
+        session = manager.create(**options)
+        if session is None:
+            return flask.jsonify(error="too many sessions"), 503
+        return flask.jsonify(session.state()), 201
+
+    @sessions.route("", methods=["GET"])
+    def List_Sessions():
+        return flask.jsonify([session.state() for session in manager.list()])
+
+    @sessions.route("/<sessionId>", methods=["GET"])
+    def Get_Session(sessionId):
+        return flask.jsonify(lookup(sessionId).state())
+
+    @sessions.route("/<sessionId>/start", methods=["POST"])
+    def Start_Session(sessionId):
+        session = lookup(sessionId)
+        session.start()
+        return flask.jsonify(session.state())
+
+    @sessions.route("/<sessionId>/stop", methods=["POST"])
+    def Stop_Session(sessionId):
+        session = lookup(sessionId)
+        session.stop()
+        return flask.jsonify(session.state())
+
+    @sessions.route("/<sessionId>/pause", methods=["POST"])
+    def Pause_Session(sessionId):
+        session = lookup(sessionId)
+        session.pause()
+        return flask.jsonify(session.state())
+
+    @sessions.route("/<sessionId>/resume", methods=["POST"])
+    def Resume_Session(sessionId):
+        session = lookup(sessionId)
+        session.resume()
+        return flask.jsonify(session.state())
+
+    @sessions.route("/<sessionId>/set_text", methods=["POST"])
+    def Set_Session_Text(sessionId):
+        session = lookup(sessionId)
+        error = textError(flask.request.get_json(silent=True))
+        if error is not None:
+            return flask.jsonify(error=error), 400
+        if not session.setText(flask.request.json):
+            return flask.jsonify(stale=True)
+        return flask.jsonify(flask.request.json)
+
+    @sessions.route("/<sessionId>/set_color", methods=["POST"])
+    def Set_Session_Color(sessionId):
+        session = lookup(sessionId)
+        error = colorError(flask.request.get_json(silent=True))
+        if error is not None:
+            return flask.jsonify(error=error), 400
+        if not session.setColor(flask.request.json):
+            return flask.jsonify(stale=True)
+        return flask.jsonify(flask.request.json)
+
+    @sessions.route("/<sessionId>/report", methods=["GET"])
+    def Session_Report(sessionId):
+        return flask.jsonify(lookup(sessionId).summary())
+
+    @sessions.route("/<sessionId>", methods=["DELETE"])
+    def Close_Session(sessionId):
+        summary = manager.close(sessionId)
+        if summary is None:
+            flask.abort(404)
+        return flask.jsonify(summary)
+
+    app.register_blueprint(sessions)
+#--------------------------------END SESSION ROUTES-----------------------------------------------
+
+
+# Resident memory of this process in MB (Linux), None where /proc is not available
+def residentMegabytes():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+# Scaling test: N sessions at once, each playing a recorded speech video through the stub detector and a recorded
+# WAV through a stub recognizer in real time, with its ah-counter posting every second. Reports CPU and memory per
+# session. python session_server.py --sessions 1 2 4 8 --seconds 10
+def main(argv=None):
+    import argparse
+    import resource
+    import tempfile
+    from batch_analyzer import StubDetector, makeSyntheticVideo
+    from speech_rate import makeSyntheticSpeech
+
+    parser = argparse.ArgumentParser(description="Run N simulated speeches at once and measure the cost per session")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="session counts to try")
+    parser.add_argument("--seconds", type=float, default=10.0, help="how long each run lasts")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp()
+    video = makeSyntheticVideo(os.path.join(folder, "speech.avi"), seconds=args.seconds + 5, fps=15)
+    audio = os.path.join(folder, "speech.wav")
+    makeSyntheticSpeech(audio, seconds=args.seconds + 5)
+    app = flask.Flask("session_server")
+    manager = SessionManager(os.path.join(folder, "Sessions"), uploadFolder=folder, detectorFactory=StubDetector,
+                             backendOptions={"latency": 0.2})
+    registerSessionRoutes(app, manager)
+    client = app.test_client()
+
+    # bad bodies are turned away before they reach a session
+    for body in ({"video": "/etc/passwd"}, {"audio": "../speech.wav"}, {"video": 3}, {"limit": "soon"},
+                 {"green": 500, "limit": 450}, {"backend": "shell"}):
+        response = client.post("/sessions", json=body)
+        assert response.status_code == 400, (body, response.status_code)
+    checkId = client.post("/sessions", json={"video": "speech.avi", "audio": "speech.wav", "backend": "stub"}).get_json()["id"]
+    assert client.post("/sessions/" + checkId + "/set_text", json={"ahCount": "many"}).status_code == 400
+    assert client.post("/sessions/" + checkId + "/set_text", json={"ahCount": -1}).status_code == 400
+    assert client.post("/sessions/" + checkId + "/set_color", json={"red": 300}).status_code == 400
+    assert client.post("/sessions/" + checkId + "/set_text", json={"ahCount": "2", "status": "ok"}).status_code == 200
+    assert client.post("/sessions/" + checkId + "/set_color", json={"red": "255", "green": 0, "blue": "9"}).status_code == 200
+    client.delete("/sessions/" + checkId)
+
+    results = []
+    baseMemory = residentMegabytes()
+    for count in args.sessions:
+        ids = [client.post("/sessions", json={"speaker": "Room " + str(n), "video": "speech.avi", "audio": "speech.wav",
+                                              "backend": "stub"}).get_json()["id"] for n in range(count)]
+        memoryBefore = residentMegabytes()
+        cpuBefore = resource.getrusage(resource.RUSAGE_SELF)
+        startTime = time.perf_counter()
+        for sessionId in ids:
+            client.post("/sessions/" + sessionId + "/start")
+        ahCount = 0
+        while time.perf_counter() - startTime < args.seconds:
+            time.sleep(1.0)
+            ahCount += 1
+            for sessionId in ids:
+                client.post("/sessions/" + sessionId + "/set_text", json={"ahCount": str(ahCount), "status": "bench"})
+        states = [client.get("/sessions/" + sessionId).get_json() for sessionId in ids]
+        memoryAfter = residentMegabytes()
+        cpuAfter = resource.getrusage(resource.RUSAGE_SELF)
+        elapsed = time.perf_counter() - startTime
+        reports = [client.delete("/sessions/" + sessionId).get_json() for sessionId in ids]
+        cpu = (cpuAfter.ru_utime - cpuBefore.ru_utime) + (cpuAfter.ru_stime - cpuBefore.ru_stime)
+        results.append({
+            "sessions": count,
+            "cpuPercentPerSession": round(cpu / elapsed * 100 / count, 1),
+            "memoryMbPerSession": round((memoryAfter - memoryBefore) / count, 1) if memoryBefore is not None else None,
+            "emotionFramesPerSession": round(sum(sum(report["emotionCounts"].values()) for report in reports) / count),
+            "wordsPerSession": round(sum(state["words"] for state in states) / count),
+            "ahCountsCorrect": all(report["ahCount"] == ahCount for report in reports),
+        })
+    for result in results:
+        result["baseMemoryMb"] = round(baseMemory, 1) if baseMemory is not None else None
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("sessions  CPU %/session  MB/session  emotion frames/session  words/session  ah counts ok")
+        for result in results:
+            print(str(result["sessions"]).rjust(8) + str(result["cpuPercentPerSession"]).rjust(15) +
+                  str(result["memoryMbPerSession"]).rjust(12) + str(result["emotionFramesPerSession"]).rjust(24) +
+                  str(result["wordsPerSession"]).rjust(15) + str(result["ahCountsCorrect"]).rjust(14))
+    manager.closeAll()
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+
+startTime = time.monotonic()
+
+from speech_core import SpeechSession, isRecording
+from report_engine import ReportHistory, reportText
+from startup import buildFer
+
+#================================ HEADLESS SESSION ==========================================================
+# Runs a whole speech without the window: the same SpeechSession the Qt app and the /sessions API use, fed from a
+# camera and microphone or from recordings, with the flags, transcript and Ah Count printed as they happen and the
+# report printed or saved at the end. Qt is never imported, so it starts in a fraction of the GUI's time and memory,
+# and it runs on machines with no display (a recording booth, a server scoring uploaded speeches, CI).
+#
+# The speech ends when every recording has played to its end, at the time limit (unless --keep-going), after
+# --seconds, or on Ctrl+C.
+#
+# Usage:
+#   python speech_cli.py --video speech.mp4 --audio speech.wav --limit 7:30 --output report.json
+#   python speech_cli.py --video 0 --audio default --seconds 120 --backend sphinx
+#   python speech_cli.py --demo --seconds 10 --json
+
+# "7:30" or "450" -> 450 seconds
+def parseSeconds(text):
+    minutes, _, seconds = text.rpartition(":")
+    return int(minutes or 0) * 60 + int(seconds)
+
+
+# Device index for a number, otherwise a file, "synthetic" (video) or "default" (audio)
+def parseSource(text):
+    if text is None:
+        return None
+    return int(text) if text.isdigit() else text
+
+
+# Peak resident memory of this process in MB
+def peakMegabytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+# Print what happens during the speech, one line per event, to stderr so stdout only carries the report
+def followSession(session, verbose):
+    def say(text):
+        mins, secs = divmod(int(session.elapsed()), 60)
+        print("[{:02d}:{:02d}] ".format(mins, secs) + text, file=sys.stderr, flush=True)
+
+    session.on("started", lambda: say("speech started"))
+    session.on("flag", lambda flag, due: say(flag + " flag"))
+    session.on("limit", lambda due: say("time limit reached"))
+    session.on("paused", lambda: say("speech paused"))
+    session.on("resumed", lambda: say("speech resumed"))
+    session.on("ahCount", lambda total, increased: increased and say("Ah Count: " + str(total)))
+    session.on("command", lambda command: say("voice command: " + command))
+    if verbose:
+        session.on("speech", lambda result: say("said: " + result.text if result.text is not None else
+                                                "not understood: " + str(result.error or "")))
+        session.on("wpm", lambda wpm: say("speech rate: " + str(wpm) + " wpm"))
+
+
+# The voice commands work as they do in the window: pause and resume hold the clock, stop ends the speech
+def obeyCommands(session, finished):
+    def command(name):
+        if name == "pause speech":
+            session.pause()
+        elif name == "resume speech":
+            session.resume()
+        elif name == "stop speech":
+            finished.set()
+    session.on("command", command)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a speech session without the GUI and print its report")
+    parser.add_argument("--video", help="camera index, video file or 'synthetic' (no video when left out)")
+    parser.add_argument("--audio", help="microphone device index, 'default' for the default microphone, or a WAV file")
+    parser.add_argument("--audience", help="audience camera index, video file or 'synthetic' for audience mode")
+    parser.add_argument("--backend", default="google", help="speech recognizer: google, sphinx or stub")
+    parser.add_argument("--rate-source", choices=("transcript", "local"), default="transcript",
+                        help="speech rate from the recognised words or measured from the audio")
+    parser.add_argument("--speaker", default="Speaker", help="speaker's name, for the report and the history")
+    parser.add_argument("--green", type=parseSeconds, default=300, help="green flag, seconds or m:ss")
+    parser.add_argument("--yellow", type=parseSeconds, default=360, help="yellow flag, seconds or m:ss")
+    parser.add_argument("--red", type=parseSeconds, default=420, help="red flag, seconds or m:ss")
+    parser.add_argument("--limit", type=parseSeconds, default=450, help="time limit, seconds or m:ss")
+    parser.add_argument("--keep-going", action="store_true", help="keep running after the time limit")
+    parser.add_argument("--seconds", type=float, help="stop after this many seconds")
+    parser.add_argument("--fer-workers", type=int, default=1, help="threads running Facial Expression Recognition")
+    parser.add_argument("--stub-detector", action="store_true", help="use the stub detector instead of the FER model")
+    parser.add_argument("--demo", action="store_true",
+                        help="synthetic video and speech with the stub detector and recognizer, no devices needed")
+    parser.add_argument("--folder", default="Session Logs", help="where the session log and report are written")
+    parser.add_argument("--output", help="also write the report to this file, JSON if it ends in .json, text otherwise")
+    parser.add_argument("--history", action="store_true", help="add the report to the report history")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON instead of text")
+    parser.add_argument("--verbose", action="store_true", help="print every phrase and speech rate as well")
+    args = parser.parse_args(argv)
+
+    video = parseSource(args.video)
+    audio = parseSource(args.audio)
+    audience = parseSource(args.audience)
+    detectorFactory = buildFer
+    backendOptions = {}
+    if args.demo:
+        import tempfile
+        from batch_analyzer import makeSyntheticVideo
+        from speech_rate import makeSyntheticSpeech
+        folder = tempfile.mkdtemp()
+        seconds = (args.seconds or 20.0) + 2
+        video = video if video is not None else makeSyntheticVideo(os.path.join(folder, "speech.avi"), seconds=seconds)
+        if audio is None:
+            audio = os.path.join(folder, "speech.wav")
+            makeSyntheticSpeech(audio, seconds=seconds)
+        args.backend = "stub"
+        backendOptions = {"latency": 0.2}
+        args.stub_detector = True
+    if args.stub_detector:
+        from batch_analyzer import StubDetector
+        detectorFactory = StubDetector
+    if video is None and audio is None and audience is None:
+        parser.error("nothing to analyse, give --video, --audio, --audience or --demo")
+
+    session = SpeechSession(time.strftime("Speech %Y-%m-%d %H-%M-%S"), speaker=args.speaker, folder=args.folder,
+                            video=video, audio=audio, audience=audience, backend=args.backend,
+                            backendOptions=backendOptions, rateSource=args.rate_source, green=args.green,
+                            yellow=args.yellow, red=args.red, limit=args.limit, detectorFactory=detectorFactory,
+                            audienceDetectorFactory=detectorFactory, ferWorkers=args.fer_workers)
+    finished = threading.Event()
+    followSession(session, args.verbose)
+    obeyCommands(session, finished)
+    if not args.keep_going:
+        session.on("limit", lambda due: finished.set())
+    signal.signal(signal.SIGINT, lambda number, frame: finished.set())
+
+    print("ready in " + str(round(time.monotonic() - startTime, 2)) + " s", file=sys.stderr)
+    session.start()
+    stopAt = None if args.seconds is None else time.monotonic() + args.seconds
+    # every source is a recording: the speech is over when they all are
+    recordings = all(source is None or isRecording(source) for source in (video, audio, audience))
+    while not finished.wait(0.25):
+        if stopAt is not None and time.monotonic() >= stopAt:
+            break
+        if recordings and not session.devicesRunning():
+            break
+    summary = session.close()
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            if args.output.endswith(".json"):
+                json.dump(summary, outputFile, indent=2)
+            else:
+                outputFile.write(reportText(summary))
+    if args.history:
+        ReportHistory().add(summary)
+    print(json.dumps(summary, indent=2) if args.json else reportText(summary))
+    print("speech " + str(round(session.elapsed(), 1)) + " s, peak memory " + str(round(peakMegabytes())) + " MB, log " +
+          session.logPath, file=sys.stderr)
+    return 0
+#--------------------------------END HEADLESS SESSION-----------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+import json
+import os
+import threading
+import time
+
+import speech_recognition as sr
+
+from video_pipeline import FramePipeline, openFrameSource, detectEmotions
+from speech_pipeline import ContinuousSpeechCapture, openAudioSource, makeBackend
+from speech_rate import SpeakingRateEstimator
+from emotion_store import EmotionStore
+from report_engine import SessionReport
+from session_log import SessionLog, NullSessionLog, RATE_LOCAL, RATE_TRANSCRIPT
+from session_clock import SessionClock, ClockScheduler
+from update_sender import SequenceFilter
+from filler_words import FillerDetector, AhCountMerger, DEFAULT_LEXICON
+from audience import AudienceAnalyzer, AudienceStats
+from metrics import Metrics
+from startup import buildFer
+
+#================================ SPEECH SESSION CORE =======================================================
+# Everything that belongs to one speech lives in a SpeechSession instead of in process-wide globals: its clock,
+# emotion store, report, session log, ah count and, when given a camera, a microphone or an audience camera, the
+# pipelines that read them. Nothing here imports Qt or Flask, so the same session runs behind the Qt window, behind
+# the /sessions web API (session_server.py) and in the headless command line tool (speech_cli.py).
+#
+# Lifecycle:
+#   open()          start the devices (camera, microphone, audience camera) without recording, e.g. for a preview
+#                   and the voice commands before the speech starts
+#   start(logName)  start the speech: clock, session log, timer; opens the devices if open() was not called
+#   pause()/resume() hold the speech clock, the flags and the time limit wait for it
+#   stop()          end the speech and close its log; the devices stay open only if open() opened them
+#   closeDevices()  stop the devices
+#   close()         stop everything and write the final report next to the log, returns the report
+#
+# Front-ends follow the session through on(event, callback). Callbacks run on the session's worker threads, so a
+# GUI hands them on to its own thread (see ui_bus.py). Events and their arguments:
+#   "frame"      (frame)              every captured camera frame, for a preview
+#   "videoStats" (stats)              once a second, FramePipeline.stats()
+#   "emotion"    (result)             every scored frame, video_pipeline.EmotionResult
+#   "audience"   (result)             every scored audience frame, its faces from audience.AudienceAnalyzer
+#   "speech"     (result)             every recognised phrase (result.text is None when recognition failed)
+#   "localRate"  (stats)              a few times a second, the speaking rate measured from the raw audio
+#   "wpm"        (wpm)                the speech rate, from the source chosen by rateSource
+#   "ahCount"    (total, increased)   the Ah Count, from the ah-counter client or the transcript's filler words
+#   "command"    (command)            a voice command in the transcript, one of VOICE_COMMANDS
+#   "status"     (text)               status text sent by the ah-counter client
+#   "color"      ([red, green, blue]) colour sent by the ah-counter client
+#   "tick"       (seconds)            once a second of the speech clock while the speech runs
+#   "flag"       (flag, seconds)      a flag threshold was crossed
+#   "limit"      (seconds)            the time limit was reached, recording stops
+#   "started", "stopped", "paused", "resumed" ()
+
+FLAGS = ("green", "yellow", "red")
+VOICE_COMMANDS = ("start speech", "stop speech", "pause speech", "resume speech")
+
+
+# True for a video or WAV file, which ends, rather than a device or the synthetic camera
+def isRecording(source):
+    return isinstance(source, str) and source not in ("synthetic", "default")
+
+
+class SpeechSession:
+    # video: camera index, video file or "synthetic" (None for no video), audio: microphone device index, "default"
+    #        for the default microphone or a WAV file (None for none)
+    # audience: audience camera index, video file or "synthetic" (None for no audience mode)
+    # backend: speech recognizer name from speech_pipeline.BACKENDS
+    # rateSource: "transcript" for the rate of the recognised phrases, "local" for the rate measured from the audio
+    # green, yellow, red, limit: flag thresholds and time limit in seconds
+    # fillerLexicon, ahMergePolicy: filler words counted from the transcript and how that count is combined with the
+    #                               room's ah-counter (see filler_words.AhCountMerger)
+    # detectorFactory: builds one detector per FER worker, audienceDetectorFactory the audience worker's (it needs
+    #                  every face, so a plain FER model rather than a face tracker)
+    # videoSize: capture size of the speaker's camera, loopVideo: replay a video file from the start when it ends
+    # metrics: a metrics.Metrics every stage is timed with, None for a disabled one
+    def __init__(self, sessionId, speaker="Speaker", folder="Sessions", video=None, audio=None, backend="google",
+                 rateSource="transcript", green=300, yellow=360, red=420, limit=450, detectorFactory=buildFer,
+                 ferWorkers=1, speechWorkers=2, backendOptions=None, fillerLexicon=DEFAULT_LEXICON, ahMergePolicy="max",
+                 audience=None, audienceMaxFaces=16, audienceDetectorFactory=buildFer, videoSize=(400, 300),
+                 loopVideo=False, phraseTimeLimit=5, metrics=None):
+        self.id = sessionId
+        self.speaker = speaker
+        self.folder = folder
+        self.video = video
+        self.audio = audio
+        self.audience = audience
+        self.backendName = backend
+        self.backendOptions = backendOptions or {}
+        self.rateSource = rateSource
+        self.thresholds = {"green": green, "yellow": yellow, "red": red}
+        self.limit = limit
+        self.detectorFactory = detectorFactory
+        self.audienceDetectorFactory = audienceDetectorFactory
+        self.ferWorkers = ferWorkers
+        self.speechWorkers = speechWorkers
+        self.audienceMaxFaces = audienceMaxFaces
+        self.videoSize = videoSize
+        self.loopVideo = loopVideo
+        self.phraseTimeLimit = phraseTimeLimit
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.emotionStore = EmotionStore()
+        self.report = SessionReport(self.emotionStore)
+        self.audienceStats = AudienceStats(audienceMaxFaces) if audience is not None else None
+        self.log = NullSessionLog()
+        self.logPath = None # path of the current (or last) speech's session log
+        self.sequenceFilter = SequenceFilter() # this room's ah-counter updates, in order
+        self.fillerDetector = FillerDetector(fillerLexicon)
+        self.ahMerger = AhCountMerger(ahMergePolicy)
+        self.lock = threading.Lock()
+        self.listeners = {} # event name -> callbacks
+        self.running = False # a speech has been started and not stopped
+        self.speaking = False # the speech is being recorded, False again once the time limit is reached
+        self.limitReached = False
+        self.clock = SessionClock() # this speech's clock, every record of the session is timestamped with it
+        self.lastActive = time.monotonic() # when a client last asked for this session (see SessionManager.get)
+        self.emotion = None
+        self.score = None
+        self.wpm = 0.0
+        self.localWpm = 0.0
+        self.status = ""
+        self.color = None
+        self.words = 0
+        self.lastTranscript = ""
+        self.devicesOpen = False
+        self.keepDevices = False # open() was called, so stop() leaves the devices running
+        self.stopEvent = threading.Event() # set to stop the device threads
+        self.timerStopEvent = threading.Event()
+        self.threads = []
+        self.timerThread = None
+        self.pipeline = None
+
+    # Call callback(*arguments) on every `event` (see the list above)
+    def on(self, event, callback):
+        self.listeners.setdefault(event, []).append(callback)
+
+    def emit(self, event, *arguments):
+        for callback in self.listeners.get(event, ()):
+            callback(*arguments)
+
+    # A client request for this session. Only SessionManager.get() calls it, so a session whose camera and microphone
+    # keep running but that no client asks for any more still becomes idle
+    def touch(self):
+        self.lastActive = time.monotonic()
+
+    # Seconds the speaker has been talking, pauses left out
+    def elapsed(self):
+        return self.clock.elapsed()
+
+    # Flag colour the timer keeper should be showing, None before the green threshold
+    def flag(self):
+        elapsed = self.elapsed()
+        shown = None
+        for flag in FLAGS:
+            if elapsed >= self.thresholds[flag]:
+                shown = flag
+        return shown
+
+    # Flag thresholds and time limit in seconds, for the next start()
+    def setThresholds(self, green, yellow, red, limit):
+        self.thresholds = {"green": green, "yellow": yellow, "red": red}
+        self.limit = limit
+
+    def open(self):
+        self.openDevices(keep=True)
+
+    def openDevices(self, keep):
+        with self.lock:
+            if self.devicesOpen:
+                return
+            self.devicesOpen = True
+            self.keepDevices = keep
+            self.stopEvent.clear()
+        if self.video is not None:
+            self.startThread(self.runVideo, "Video")
+        if self.audio is not None:
+            self.startThread(self.runAudio, "Speech")
+        if self.audience is not None:
+            self.startThread(self.runAudience, "Audience")
+
+    def startThread(self, target, name):
+        thread = threading.Thread(target=target, name=name + "-" + str(self.id), daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    # True while any device is still being read, False once every recording has played to its end
+    def devicesRunning(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def closeDevices(self):
+        with self.lock:
+            if not self.devicesOpen:
+                return
+            self.devicesOpen = False
+        self.stopEvent.set()
+        for thread in self.threads:
+            thread.join(5.0)
+        self.threads = []
+
+    # logName: file name of the session log in folder, the session id by default
+    def start(self, logName=None):
+        with self.lock:
+            if self.running:
+                return
+            os.makedirs(self.folder, exist_ok=True)
+            self.clock.start()
+            self.logPath = os.path.join(self.folder, logName or str(self.id) + ".tmlog")
+            self.log = SessionLog(self.logPath, clock=self.clock)
+            self.report.reset()
+            self.report.setAhCount(self.ahMerger.total()) # the ah-counter client keeps its count between speeches
+            self.emotionStore.clear()
+            self.fillerDetector.reset()
+            self.ahMerger.resetAuto()
+            if self.audienceStats is not None:
+                self.audienceStats.reset()
+            self.limitReached = False
+            self.running = True
+            self.speaking = True
+            self.timerStopEvent.clear()
+            self.log.timerEvent("start", 0)
+        self.openDevices(keep=False)
+        self.timerThread = threading.Thread(target=self.runTimer, name="Timer-" + str(self.id), daemon=True)
+        self.timerThread.start()
+        self.emit("started")
+
+    # End the speech and close its log. The report stays readable through summary() until the next start()
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            self.speaking = False
+            self.clock.stop()
+        self.timerStopEvent.set()
+        if self.timerThread is not None and self.timerThread is not threading.current_thread():
+            self.timerThread.join(5.0)
+        self.timerThread = None
+        if not self.keepDevices:
+            self.closeDevices()
+        self.report.setDuration(int(self.elapsed()))
+        self.log.timerEvent("stop", int(self.elapsed()))
+        log, self.log = self.log, NullSessionLog() # the device threads may still be running, swap before closing
+        log.close()
+        self.emit("stopped")
+
+    # Hold the speech clock. Returns False when it was not running
+    def pause(self):
+        paused = self.clock.pause()
+        if paused:
+            self.log.timerEvent("pause", self.elapsed())
+            self.emit("paused")
+        return paused
+
+    # Carry on after pause(). Returns False when the clock was not paused
+    def resume(self):
+        resumed = self.clock.resume()
+        if resumed:
+            self.log.timerEvent("resume", self.elapsed())
+            self.emit("resumed")
+        return resumed
+
+    # Fires the flag and time limit events exactly when they are due on the session clock, and ticks once a second.
+    # Nothing here adds up sleeps, so the timer cannot drift, and pausing the clock holds it
+    def runTimer(self):
+        scheduler = ClockScheduler(self.clock)
+        scheduler.every(1.0, self.onTick, "tick")
+        for flag in FLAGS:
+            scheduler.at(self.thresholds[flag], lambda due, flag=flag: self.onFlag(flag, due), flag)
+        scheduler.at(self.limit, lambda due: self.onLimit(due, scheduler), "limit")
+        scheduler.run(self.timerStopEvent.is_set)
+        scheduler.close()
+
+    def onTick(self, due):
+        self.metrics.latency("timer_tick", self.elapsed() - due) # how late the tick fired
+        self.emit("tick", due)
+
+    def onFlag(self, flag, due):
+        self.log.timerEvent(flag, due)
+        self.emit("flag", flag, due)
+
+    def onLimit(self, due, scheduler):
+        scheduler.clear() # nothing more to time
+        self.log.timerEvent("limit", due)
+        self.limitReached = True
+        self.speaking = False # the speech is over, nothing after the limit is recorded
+        self.emit("limit", due)
+
+    # Video pipeline: frames from the camera (or a recording, at its own frame rate) scored on this session's FER
+    # workers. Capture runs on this thread, so the preview gets every frame and FER always scores the newest one
+    def runVideo(self):
+        capture = openFrameSource(self.video, *self.videoSize)
+        recording = isRecording(self.video)
+        if recording:
+            capture.loop = self.loopVideo # a recorded speech ends when the recording does, unless it loops
+        metrics = self.metrics
+        self.pipeline = pipeline = FramePipeline(self.detectorFactory, onFrame=self.onFrame,
+                                                 onEmotion=metrics.timed("emotion_update", self.onEmotion),
+                                                 numWorkers=self.ferWorkers, queueSize=1,
+                                                 analyse=metrics.timed("fer_inference", detectEmotions),
+                                                 onError=lambda error: metrics.count("fer_error"))
+        pipeline.start()
+        # read from the pipeline whenever /metrics is scraped, labelled with the session so sessions do not overwrite each other
+        metrics.queueDepth.track(pipeline.queue.depth, queue="fer", session=self.id)
+        metrics.dropped.track(lambda: pipeline.queue.droppedCount, queue="fer", session=self.id)
+        metrics.dropped.track(lambda: pipeline.staleCount, queue="fer_stale", session=self.id)
+        nextStatsTime = time.monotonic() + 1.0
+
+        def reportStats(): # once a second, for the FPS label
+            nonlocal nextStatsTime
+            if time.monotonic() >= nextStatsTime:
+                self.emit("videoStats", pipeline.stats())
+                nextStatsTime = time.monotonic() + 1.0
+
+        # a recording is over when it stops giving frames, a camera gets a few tries first
+        pipeline.runCapture(metrics.timed("capture", capture.read), self.stopEvent.is_set, everyRead=reportStats,
+                            ended=lambda: recording)
+        pipeline.stop()
+        capture.release()
+        metrics.queueDepth.untrack(queue="fer", session=self.id)
+        metrics.dropped.untrack(queue="fer", session=self.id)
+        metrics.dropped.untrack(queue="fer_stale", session=self.id)
+
+    # Speech pipeline: microphone (or WAV file, played in real time) into the recognizer and the local rate estimator.
+    # The audio is split into phrases here and each phrase is recognised on a worker thread, so nothing is missed while
+    # a recognition is in flight
+    def runAudio(self):
+        source = openAudioSource(self.audio)
+        estimator = SpeakingRateEstimator(sampleRate=source.sampleRate, onUpdate=self.onLocalRate)
+        backend = makeBackend(self.backendName, **self.backendOptions)
+        backend.recognize = self.metrics.timed("recognize", backend.recognize) # time every recognition, errors included
+        capture = ContinuousSpeechCapture(source, backend, self.metrics.timed("speech_update", self.onSpeech),
+                                          phraseTimeLimit=self.phraseTimeLimit, workers=self.speechWorkers,
+                                          onAudio=self.metrics.timed("rate_estimate", estimator.process))
+        self.metrics.queueDepth.track(lambda: capture.inFlight, queue="recognizer", session=self.id) # phrases waiting for the recognizer
+        capture.run(self.stopEvent.is_set)
+        self.metrics.queueDepth.untrack(queue="recognizer", session=self.id)
+
+    # Audience pipeline: every face the audience camera sees, classified in one batch per frame
+    def runAudience(self):
+        capture = openFrameSource(self.audience, 640, 480) # more pixels than the speaker's camera, the faces are smaller
+        recording = isRecording(self.audience)
+        if recording:
+            capture.loop = self.loopVideo
+        analyzer = AudienceAnalyzer(self.audienceMaxFaces)
+        pipeline = FramePipeline(self.audienceDetectorFactory, onEmotion=self.onAudience, numWorkers=1, queueSize=1,
+                                 analyse=self.metrics.timed("audience_inference", analyzer.analyse),
+                                 onError=lambda error: self.metrics.count("audience_error"))
+        pipeline.start()
+        self.metrics.dropped.track(lambda: pipeline.queue.droppedCount, queue="audience", session=self.id)
+        pipeline.runCapture(capture.read, self.stopEvent.is_set, ended=lambda: recording) # the oldest waiting frame is dropped
+        pipeline.stop()
+        capture.release()
+        self.metrics.dropped.untrack(queue="audience", session=self.id)
+
+    def onFrame(self, frame):
+        self.emit("frame", frame)
+
+    def onEmotion(self, result):
+        self.metrics.latency("frame_to_emotion", time.monotonic() - result.captureTime) # camera to result, queueing included
+        if self.speaking:
+            self.emotionStore.append(self.clock.toSession(result.captureTime), result.scores)
+            self.log.emotion(result.scores, result.captureTime)
+        self.emotion, self.score = result.emotion, result.score
+        self.emit("emotion", result)
+
+    def onAudience(self, result):
+        if self.speaking: # only the audience's reaction to the speech counts
+            self.audienceStats.update(result)
+        self.emit("audience", result)
+
+    def onLocalRate(self, stats):
+        self.localWpm = stats["wordsPerMinute"]
+        if self.speaking:
+            self.report.setPauseStats(stats)
+        if self.rateSource == "local":
+            self.wpm = self.localWpm
+            if self.speaking and stats["voiced"]: # only sample the rate while the speaker is actually talking
+                self.report.addSpeechRate(self.wpm)
+                self.log.speechRate(self.wpm, RATE_LOCAL)
+            self.emit("wpm", self.wpm)
+        self.emit("localRate", stats)
+
+    def onSpeech(self, result):
+        if result.text is None:
+            if isinstance(result.error, sr.RequestError): # bad connection, or the recognizer is unavailable
+                self.metrics.count("recognizer_timeout" if "timed out" in str(result.error).lower() else "recognizer_request_error")
+            else:
+                self.metrics.count("recognizer_unknown_audio")
+            self.emit("speech", result)
+            return
+        for command in VOICE_COMMANDS:
+            if command in result.text:
+                self.emit("command", command)
+        self.words += result.wordCount()
+        self.lastTranscript = result.text
+        if self.speaking:
+            self.log.transcript(result.text)
+            end = self.elapsed() # the phrase has just been recognised, so it ended a little before now
+            fillers = self.fillerDetector.process(result.text, max(0.0, end - result.duration()), end)
+            if fillers:
+                self.report.setFillerCounts(self.fillerDetector.usedCounts())
+                self.showAhCount(*self.ahMerger.addAuto(fillers))
+        self.emit("speech", result)
+        if self.rateSource == "transcript":
+            self.wpm = round(result.wordsPerMinute(), 1)
+            if self.speaking:
+                self.report.addSpeechRate(self.wpm)
+                self.log.speechRate(self.wpm, RATE_TRANSCRIPT)
+            self.emit("wpm", self.wpm)
+
+    # The room's ah-counter client, same body as /set_text. Returns False for an out-of-order update
+    def setText(self, payload):
+        if not self.sequenceFilter.accept("/set_text", payload):
+            return False
+        if "status" in payload:
+            self.status = payload["status"]
+            self.emit("status", self.status)
+        if "ahCount" in payload:
+            self.showAhCount(*self.ahMerger.setManual(int(payload["ahCount"])))
+        return True
+
+    def showAhCount(self, total, increased=False):
+        if total != self.report.ahCount:
+            self.report.setAhCount(total)
+            self.log.ahCount(total)
+        self.emit("ahCount", total, increased)
+
+    def setColor(self, payload):
+        if not self.sequenceFilter.accept("/set_color", payload):
+            return False
+        self.color = [int(payload.get(channel, 0)) for channel in ("red", "green", "blue")]
+        self.emit("color", self.color)
+        return True
+
+    def state(self):
+        return {"id": self.id, "speaker": self.speaker, "speaking": self.speaking, "paused": self.clock.paused(),
+                "elapsed": round(self.elapsed(), 1),
+                "flag": self.flag(), "limitReached": self.limitReached or self.elapsed() >= self.limit,
+                "emotion": self.emotion, "score": self.score, "wpm": self.wpm, "words": self.words,
+                "ahCount": self.report.ahCount, "status": self.status,
+                "idleSeconds": round(time.monotonic() - self.lastActive, 1)}
+
+    def summary(self):
+        self.report.setDuration(int(self.elapsed()))
+        if self.audienceStats is not None:
+            self.report.setAudienceStats(self.audienceStats.summary()) # how the audience reacted
+        return self.report.summary(self.speaker)
+
+    # End the session: stop the speech and the devices, and write the final report next to the log
+    def close(self):
+        self.stop()
+        self.closeDevices()
+        summary = self.summary()
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, str(self.id) + ".json"), "w") as reportFile:
+            json.dump(summary, reportFile, indent=2)
+        return summary
+#--------------------------------END SPEECH SESSION CORE-----------------------------------------------
@@ -0,0 +1,336 @@
+import logging
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+#================================ RECOGNIZER BACKENDS ======================================================
+# Every backend takes an sr.AudioData and returns the recognised text. Like speech_recognition itself they raise
+# sr.UnknownValueError when nothing could be understood and sr.RequestError when the recognizer is unavailable.
+
+class GoogleBackend:
+    name = "Google Speech Recognition"
+
+    def __init__(self, key=None):
+        self.recognizer = sr.Recognizer()
+        self.key = key # None uses the default API key, for testing purposes only
+
+    def recognize(self, audio):
+        return self.recognizer.recognize_google(audio, key=self.key)
+
+
+# Offline, but does not work very well compared to Google (see speech_test.py)
+class SphinxBackend:
+    name = "Sphinx"
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio):
+        return self.recognizer.recognize_sphinx(audio)
+
+
+# Deterministic stand-in for tests: "hears" wordsPerSecond words for every second of audio after waiting latency seconds.
+# A list of transcripts can be given instead, they are handed out in order and then repeated
+class StubBackend:
+    name = "Stub"
+
+    def __init__(self, wordsPerSecond=2.5, latency=0.0, transcripts=None):
+        self.wordsPerSecond = wordsPerSecond
+        self.latency = latency
+        self.transcripts = list(transcripts or [])
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def recognize(self, audio):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            call = self.calls
+            self.calls += 1
+        if self.transcripts:
+            return self.transcripts[call % len(self.transcripts)]
+        seconds = len(audio.frame_data) / float(audio.sample_rate * audio.sample_width)
+        words = int(round(seconds * self.wordsPerSecond))
+        if words == 0:
+            raise sr.UnknownValueError()
+        return " ".join(["word"] * words)
+
+
+BACKENDS = {"google": GoogleBackend, "sphinx": SphinxBackend, "stub": StubBackend}
+
+def makeBackend(name, **options):
+    return BACKENDS[name](**options)
+#--------------------------------END RECOGNIZER BACKENDS-----------------------------------------------
+
+
+#================================ AUDIO SOURCES =============================================================
+# An audio source is opened once and then read continuously: read(numFrames) returns raw little-endian PCM bytes.
+
+# The default microphone, kept open for the whole session instead of being reopened for every phrase
+class MicrophoneSource:
+    def __init__(self, deviceIndex=None, sampleRate=16000, chunkFrames=1024):
+        self.microphone = sr.Microphone(device_index=deviceIndex, sample_rate=sampleRate, chunk_size=chunkFrames)
+        self.chunkFrames = chunkFrames
+        self.sampleRate = sampleRate
+        self.sampleWidth = 2
+
+    def open(self):
+        self.microphone.__enter__()
+        self.sampleRate = self.microphone.SAMPLE_RATE
+        self.sampleWidth = self.microphone.SAMPLE_WIDTH
+
+    def read(self, numFrames):
+        return self.microphone.stream.read(numFrames)
+
+    def close(self):
+        self.microphone.__exit__(None, None, None)
+
+
+# A mono 16-bit WAV file played back as if it were a microphone. With realtime=True reads are paced like a live device.
+# read() returns b"" once the file is finished
+class WavFileSource:
+    def __init__(self, path, chunkFrames=1024, realtime=False):
+        self.path = path
+        self.chunkFrames = chunkFrames
+        self.realtime = realtime
+        self.sampleRate = 16000
+        self.sampleWidth = 2
+        self.wav = None
+        self.startTime = 0.0
+        self.framesRead = 0
+
+    def open(self):
+        self.wav = wave.open(self.path, "rb")
+        if self.wav.getnchannels() != 1 or self.wav.getsampwidth() != 2: # the capture loop reads the bytes as mono int16
+            self.wav.close()
+            raise ValueError(self.path + " is not a mono 16-bit WAV file")
+        self.sampleRate = self.wav.getframerate()
+        self.sampleWidth = self.wav.getsampwidth()
+        self.startTime = time.monotonic()
+        self.framesRead = 0
+
+    def read(self, numFrames):
+        data = self.wav.readframes(numFrames)
+        self.framesRead += len(data) // self.sampleWidth
+        if self.realtime: # wait until this much audio would have been recorded by a real microphone
+            delay = self.startTime + self.framesRead / float(self.sampleRate) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return data
+
+    def close(self):
+        self.wav.close()
+
+
+# The audio source for a setting: a microphone device index (None for the default microphone) or a WAV file to play
+# back in real time instead of a microphone
+def openAudioSource(source, sampleRate=16000, chunkFrames=1024):
+    if source == "default":
+        source = None # the default microphone
+    if isinstance(source, str):
+        return WavFileSource(source, chunkFrames, realtime=True)
+    return MicrophoneSource(source, sampleRate, chunkFrames)
+#--------------------------------END AUDIO SOURCES-----------------------------------------------
+
+
+#================================ CONTINUOUS SPEECH CAPTURE =================================================
+# Fixed-size ring of 16-bit samples addressed by absolute sample number, so a phrase can be cut out by its start and
+# end sample while recording carries on
+class AudioRingBuffer:
+    def __init__(self, capacity):
+        self.samples = numpy.zeros(capacity, dtype=numpy.int16)
+        self.capacity = capacity
+        self.written = 0 # total number of samples ever written
+
+    def write(self, chunk):
+        count = len(chunk)
+        if count >= self.capacity: # only the newest samples fit
+            chunk = chunk[-self.capacity:]
+            self.written += count - self.capacity
+            count = self.capacity
+        position = self.written % self.capacity
+        firstPart = min(count, self.capacity - position)
+        self.samples[position:position + firstPart] = chunk[:firstPart]
+        self.samples[:count - firstPart] = chunk[firstPart:]
+        self.written += count
+
+    # Copy out samples [start, end), clamped to what is still held in the ring
+    def read(self, start, end):
+        start = max(start, self.written - self.capacity, 0)
+        end = min(end, self.written)
+        if end <= start:
+            return numpy.zeros(0, dtype=numpy.int16)
+        indices = numpy.arange(start, end) % self.capacity
+        return self.samples[indices]
+
+
+# A recognised (or failed) phrase. start and end are seconds since the capture began
+class PhraseResult:
+    def __init__(self, sequence, start, end, text=None, error=None):
+        self.sequence = sequence # phrases are numbered in the order they were spoken
+        self.start = start
+        self.end = end
+        self.text = text # None when recognition failed
+        self.error = error # the sr.UnknownValueError / sr.RequestError raised by the backend, if any
+
+    def duration(self):
+        return self.end - self.start
+
+    def wordCount(self):
+        return len(self.text.split()) if self.text else 0
+
+    # words per minute over the time the phrase actually took
+    def wordsPerMinute(self):
+        return self.wordCount() * 60.0 / self.duration() if self.duration() > 0 else 0.0
+
+
+class ContinuousSpeechCapture:
+    # source: an audio source (MicrophoneSource, WavFileSource, ...)
+    # backend: a recognizer backend (GoogleBackend, SphinxBackend, StubBackend, ...)
+    # onResult(result): called with a PhraseResult for every phrase, always in the order the phrases were spoken
+    # phraseTimeLimit: the longest a phrase may run, in seconds, before it is cut and sent for recognition
+    # pauseSeconds: this much quiet ends a phrase
+    # energyThreshold: RMS level that counts as speaking (a noisy room raises it, see isSpeech)
+    # workers: number of recognitions that may be in flight at once
+    # onAudio(chunk): optional, called on the capture thread with every chunk of int16 samples as it is recorded
+    def __init__(self, source, backend, onResult, phraseTimeLimit=5.0, pauseSeconds=0.8, energyThreshold=300,
+                 workers=2, preRollSeconds=0.3, minPhraseSeconds=0.3, bufferSeconds=30.0, onAudio=None):
+        self.source = source
+        self.backend = backend
+        self.onResult = onResult
+        self.onAudio = onAudio
+        self.phraseTimeLimit = phraseTimeLimit
+        self.pauseSeconds = pauseSeconds
+        self.energyThreshold = energyThreshold
+        self.preRollSeconds = preRollSeconds
+        self.minPhraseSeconds = minPhraseSeconds
+        self.bufferSeconds = bufferSeconds
+        self.noiseFloor = None # running RMS level of the quiet parts, used to raise the threshold in noisy rooms
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Recognizer")
+        self.resultLock = threading.Lock()
+        self.pendingResults = {} # finished results waiting for an earlier phrase to finish first
+        self.readyResults = deque() # results in spoken order, waiting to be handed to onResult
+        self.delivering = False # a recognizer thread is handing on readyResults, the others leave theirs to it
+        self.nextToDeliver = 0
+        self.phraseCount = 0
+        self.inFlight = 0 # recognitions submitted but not finished
+        self.ring = None
+
+    # Capture loop, runs on the calling thread until shouldStop() returns True or the source runs out of audio
+    def run(self, shouldStop):
+        self.source.open()
+        sampleRate = self.source.sampleRate
+        chunkFrames = self.source.chunkFrames
+        self.ring = AudioRingBuffer(int(self.bufferSeconds * sampleRate))
+        preRoll = int(self.preRollSeconds * sampleRate)
+        pauseLimit = int(self.pauseSeconds * sampleRate)
+        phraseLimit = int(self.phraseTimeLimit * sampleRate)
+        minPhrase = int(self.minPhraseSeconds * sampleRate)
+        phraseStart = None # sample where the current phrase started, None while nobody is speaking
+        lastVoice = 0 # last sample that was loud enough to count as speech
+        try:
+            while not shouldStop():
+                data = self.source.read(chunkFrames)
+                if not data:
+                    break
+                chunk = numpy.frombuffer(data, dtype=numpy.int16)
+                chunkStart = self.ring.written
+                self.ring.write(chunk)
+                chunkEnd = self.ring.written
+                if self.onAudio is not None:
+                    self.onAudio(chunk)
+
+                if self.isSpeech(chunk):
+                    lastVoice = chunkEnd
+                    if phraseStart is None:
+                        phraseStart = max(0, chunkStart - preRoll) # keep a little audio from before the speech began
+
+                if phraseStart is None:
+                    continue
+                if chunkEnd - phraseStart >= phraseLimit: # phrase is too long, cut it here and keep listening
+                    self.submit(phraseStart, chunkEnd, sampleRate)
+                    phraseStart = chunkEnd if lastVoice == chunkEnd else None
+                elif chunkEnd - lastVoice >= pauseLimit: # the speaker paused, the phrase is over
+                    if lastVoice - phraseStart >= minPhrase:
+                        self.submit(phraseStart, lastVoice, sampleRate)
+                    phraseStart = None
+
+            if phraseStart is not None and lastVoice - phraseStart >= minPhrase: # send whatever was still being said
+                self.submit(phraseStart, lastVoice, sampleRate)
+        finally:
+            self.source.close()
+            self.pool.shutdown(wait=True)
+
+    # Loud enough to be speech? Quiet chunks also update the noise floor
+    def isSpeech(self, chunk):
+        rms = float(numpy.sqrt(numpy.mean(chunk.astype(numpy.float32) ** 2))) if len(chunk) else 0.0
+        threshold = self.energyThreshold
+        if self.noiseFloor is not None:
+            threshold = max(threshold, self.noiseFloor * 2.0)
+        if rms < threshold:
+            self.noiseFloor = rms if self.noiseFloor is None else 0.95 * self.noiseFloor + 0.05 * rms
+            return False
+        return True
+
+    # Copy the phrase out of the ring and hand it to a recognition worker, the capture loop never waits for it
+    def submit(self, start, end, sampleRate):
+        samples = self.ring.read(start, end)
+        audio = sr.AudioData(samples.tobytes(), sampleRate, 2)
+        sequence = self.phraseCount
+        self.phraseCount += 1
+        with self.resultLock:
+            self.inFlight += 1
+        self.pool.submit(self.recognize, sequence, start / float(sampleRate), end / float(sampleRate), audio)
+
+    def recognize(self, sequence, start, end, audio):
+        try:
+            result = PhraseResult(sequence, start, end, text=self.backend.recognize(audio))
+        except (sr.UnknownValueError, sr.RequestError) as error:
+            result = PhraseResult(sequence, start, end, error=error)
+        except Exception as error: # a broken backend must not stop later phrases from being delivered
+            result = PhraseResult(sequence, start, end, error=sr.RequestError(str(error)))
+        self.deliver(result)
+
+    # Hand results on in the order they were spoken, even though recognitions can finish out of order. onResult is
+    # called outside resultLock, by one thread at a time, so a slow callback never holds up the other recognizers
+    def deliver(self, result):
+        with self.resultLock:
+            self.inFlight -= 1
+            self.pendingResults[result.sequence] = result
+            while self.nextToDeliver in self.pendingResults:
+                self.readyResults.append(self.pendingResults.pop(self.nextToDeliver))
+                self.nextToDeliver += 1
+            if self.delivering:
+                return
+            self.delivering = True
+        while True:
+            with self.resultLock:
+                if not self.readyResults:
+                    self.delivering = False
+                    return
+                phrase = self.readyResults.popleft()
+            try:
+                self.onResult(phrase)
+            except Exception: # a failing callback must not lose the phrases after it
+                logger.exception("phrase %d could not be delivered", phrase.sequence)
+#--------------------------------END CONTINUOUS SPEECH CAPTURE-----------------------------------------------
+
+
+# Quick check without a microphone or network: python speech_pipeline.py speech.wav
+# Plays a WAV file in real time through the capture loop with a stub recognizer that takes 2 seconds per phrase,
+# and prints every phrase with its timestamps. The phrases should cover the speech with no gaps from recognition.
+if __name__ == "__main__":
+    import sys
+
+    def show(result):
+        print("%6.2f - %6.2f  %s" % (result.start, result.end, result.text if result.text else "(" + type(result.error).__name__ + ")"))
+
+    capture = ContinuousSpeechCapture(WavFileSource(sys.argv[1], realtime=True), StubBackend(latency=2.0), show, workers=4)
+    capture.run(lambda: False)
@@ -0,0 +1,207 @@
+import collections
+import wave
+import numpy
+
+#================================ LOCAL SPEAKING RATE ======================================================
+# Estimates the speaking rate straight from the microphone samples: syllables are counted as peaks in the speech-band
+# energy of 10 ms frames, pauses as long runs of unvoiced frames.
+
+class SpeakingRateEstimator:
+    # sampleRate: samples per second of the 16-bit mono audio passed to process()
+    # windowSeconds: how much audio is gathered before the estimate is updated
+    # historySeconds: the rate is measured over this much of the most recent audio
+    # minPauseSeconds: quiet stretches at least this long count as pauses. The gaps between the syllables of slow speech
+    #                  run to 0.4 s, so shorter stretches are not pauses
+    # minVoicedSeconds: voiced stretches shorter than this (a click, a breath) do not break up a pause
+    # syllablesPerWord: used to turn syllables per minute into words per minute
+    # onUpdate(stats): called after every window with the latest statistics (see stats())
+    def __init__(self, sampleRate=16000, windowSeconds=0.25, frameSeconds=0.01, historySeconds=10.0,
+                 minPauseSeconds=0.5, minVoicedSeconds=0.05, syllablesPerWord=1.5, onUpdate=None):
+        self.sampleRate = sampleRate
+        self.frameLength = int(sampleRate * frameSeconds)
+        self.frameSeconds = self.frameLength / float(sampleRate)
+        self.windowLength = int(sampleRate * windowSeconds) // self.frameLength * self.frameLength
+        self.historyFrames = int(historySeconds / self.frameSeconds)
+        self.minPauseFrames = int(round(minPauseSeconds / self.frameSeconds))
+        self.minVoicedFrames = int(round(minVoicedSeconds / self.frameSeconds))
+        self.syllablesPerWord = syllablesPerWord
+        self.onUpdate = onUpdate
+
+        frequencies = numpy.fft.rfftfreq(self.frameLength, 1.0 / sampleRate)
+        self.band = (frequencies >= 300) & (frequencies <= 3000) # FFT bins in the speech band
+        self.taper = numpy.hanning(self.frameLength).astype(numpy.float32)
+        self.smoothLength = 5 # frames in the moving average that smooths the energy contour (50 ms)
+        self.smoothKernel = numpy.ones(self.smoothLength, dtype=numpy.float32) / self.smoothLength
+        self.voicedMarginDb = 12.0 # a frame is voiced when it is this far above the noise floor
+        self.dipDb = 2.0 # a syllable peak must rise this far above the lowest point since the previous syllable
+        self.minPeakGapFrames = int(round(0.1 / self.frameSeconds)) # syllables are at least 100 ms apart
+
+        self.pending = numpy.zeros(0, dtype=numpy.int16) # samples not yet filling a whole window
+        self.frameIndex = 0 # number of 10 ms frames processed so far
+        self.noiseFloor = None # energy of the room when nobody speaks, in dB
+        self.rawTail = numpy.zeros(0, dtype=numpy.float32) # last energies, so smoothing runs across windows
+        self.contourTail = numpy.zeros(0, dtype=numpy.float32) # last smoothed energies, so peaks can span windows
+        self.lastPeakFrame = -10 ** 9 # frame of the most recent syllable
+        self.dipSincePeak = numpy.inf # lowest smoothed energy since the most recent syllable
+        self.peakFrames = collections.deque() # frames of the syllables inside the history
+        self.voicedFlags = collections.deque() # 1 for every voiced frame inside the history, 0 otherwise
+        self.voicedInHistory = 0
+        self.silentRun = 0 # length, in frames, of the quiet stretch going on right now
+        self.hasSpoken = False # pauses only count once the speaker has started
+        self.pauseCount = 0
+        self.totalPauseFrames = 0
+        self.longestPauseFrames = 0
+        self.syllableCount = 0 # syllables since the start
+        self.lastStats = None
+
+    # Feed raw 16-bit samples (bytes or an int16 array). Returns the statistics of every window that was completed
+    def process(self, samples):
+        if isinstance(samples, (bytes, bytearray)):
+            samples = numpy.frombuffer(samples, dtype=numpy.int16)
+        self.pending = numpy.concatenate((self.pending, samples))
+        updates = []
+        while len(self.pending) >= self.windowLength:
+            window = self.pending[:self.windowLength]
+            self.pending = self.pending[self.windowLength:]
+            self.processWindow(window)
+            self.lastStats = self.stats()
+            updates.append(self.lastStats)
+            if self.onUpdate is not None:
+                self.onUpdate(self.lastStats)
+        return updates
+
+    def processWindow(self, window):
+        # energy of the speech band in every frame, all frames at once
+        frames = window.reshape(-1, self.frameLength).astype(numpy.float32) * self.taper
+        power = numpy.abs(numpy.fft.rfft(frames, axis=1)) ** 2
+        energy = 10.0 * numpy.log10(power[:, self.band].sum(axis=1) + 1e-3)
+        count = len(energy)
+
+        # the noise floor follows the quietest frames, dropping at once and creeping up slowly
+        quietest = float(numpy.percentile(energy, 10))
+        if self.noiseFloor is None or quietest < self.noiseFloor:
+            self.noiseFloor = quietest
+        else:
+            self.noiseFloor += 0.02 * (quietest - self.noiseFloor)
+        threshold = self.noiseFloor + self.voicedMarginDb
+        voiced = energy > threshold
+
+        # smooth the contour, carrying the end of the previous window so the moving average has no seams
+        raw = numpy.concatenate((self.rawTail, energy))
+        smoothed = numpy.convolve(raw, self.smoothKernel, mode="valid")[-count:] if len(raw) >= self.smoothLength else energy
+        self.rawTail = raw[-(self.smoothLength - 1):]
+        self.findPeaks(smoothed, threshold)
+        self.countPauses(voiced)
+
+        # keep the voiced history to historySeconds
+        self.voicedFlags.extend(voiced.astype(numpy.int8).tolist())
+        self.voicedInHistory += int(voiced.sum())
+        while len(self.voicedFlags) > self.historyFrames:
+            self.voicedInHistory -= self.voicedFlags.popleft()
+        self.frameIndex += count
+        while self.peakFrames and self.peakFrames[0] <= self.frameIndex - self.historyFrames:
+            self.peakFrames.popleft()
+
+    # A syllable is a local maximum of the smoothed energy that is voiced, far enough from the previous syllable,
+    # and rises at least dipDb above the lowest point since the previous syllable
+    def findPeaks(self, smoothed, threshold):
+        contour = numpy.concatenate((self.contourTail, smoothed))
+        offset = self.frameIndex - len(self.contourTail) # frame number of contour[0]
+        middle = contour[1:-1]
+        candidates = numpy.nonzero((middle > contour[:-2]) & (middle >= contour[2:]) & (middle > threshold))[0] + 1
+        searchFrom = 0
+        for position in candidates:
+            frame = offset + position
+            if frame <= self.lastPeakFrame:
+                continue
+            self.dipSincePeak = min(self.dipSincePeak, float(contour[searchFrom:position + 1].min()))
+            searchFrom = position
+            if frame - self.lastPeakFrame < self.minPeakGapFrames:
+                continue
+            if contour[position] - self.dipSincePeak < self.dipDb:
+                continue
+            self.peakFrames.append(frame)
+            self.syllableCount += 1
+            self.lastPeakFrame = frame
+            self.dipSincePeak = numpy.inf
+        if len(contour) - 1 > searchFrom: # the rest of the window still counts towards the next dip
+            self.dipSincePeak = min(self.dipSincePeak, float(contour[searchFrom:-1].min()))
+        self.contourTail = contour[-2:] # the last frame can only be judged once the next one is known
+
+    # Quiet stretches of at least minPauseSeconds between voiced frames count as pauses. Voiced runs shorter than
+    # minVoicedSeconds inside the window are merged into the quiet around them
+    def countPauses(self, voiced):
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], voiced.astype(numpy.int8), [0])))) # run boundaries
+        starts, ends = edges[0::2], edges[1::2]
+        keep = (ends - starts >= self.minVoicedFrames) | (starts == 0) | (ends == len(voiced)) # runs at the edges may go on in the next window
+        edges = numpy.column_stack((starts[keep], ends[keep])).ravel()
+        position = 0
+        for start in edges[0::2]: # start of every voiced run
+            self.endSilence(start - position)
+            self.hasSpoken = True
+            position = start
+        runEnds = edges[1::2]
+        if len(runEnds): # the window ends in the quiet after the last voiced run
+            self.silentRun = len(voiced) - runEnds[-1]
+        else:
+            self.silentRun += len(voiced)
+
+    def endSilence(self, framesBeforeVoice):
+        silence = self.silentRun + framesBeforeVoice
+        self.silentRun = 0
+        if self.hasSpoken and silence >= self.minPauseFrames:
+            self.pauseCount += 1
+            self.totalPauseFrames += silence
+            self.longestPauseFrames = max(self.longestPauseFrames, silence)
+
+    def stats(self):
+        historyMinutes = min(self.frameIndex, self.historyFrames) * self.frameSeconds / 60.0
+        voicedMinutes = self.voicedInHistory * self.frameSeconds / 60.0
+        syllablesPerMinute = len(self.peakFrames) / historyMinutes if historyMinutes > 0 else 0.0
+        return {
+            "time": self.frameIndex * self.frameSeconds, # seconds of audio processed
+            "syllablesPerMinute": round(syllablesPerMinute, 1), # over the recent history, pauses included
+            "wordsPerMinute": round(syllablesPerMinute / self.syllablesPerWord, 1),
+            "articulationRate": round(len(self.peakFrames) / voicedMinutes, 1) if voicedMinutes > 0 else 0.0, # syllables per minute of actual speaking
+            "voiced": self.silentRun < self.minPauseFrames and self.hasSpoken, # is the speaker talking right now
+            "syllables": self.syllableCount,
+            "pauseCount": self.pauseCount,
+            "meanPause": round(self.totalPauseFrames * self.frameSeconds / self.pauseCount, 3) if self.pauseCount else 0.0,
+            "longestPause": round(self.longestPauseFrames * self.frameSeconds, 3),
+            "totalPause": round(self.totalPauseFrames * self.frameSeconds, 3),
+        }
+#--------------------------------END LOCAL SPEAKING RATE-----------------------------------------------
+
+
+# Write a WAV file of synthetic "speech" with a known number of syllables: voiced bursts (a 140 Hz tone with harmonics,
+# shaped like a vowel) at syllablesPerSecond, broken up by pauses. Returns the number of syllables and pauses written
+def makeSyntheticSpeech(path, seconds=30.0, syllablesPerSecond=4.0, pauseEvery=2.5, pauseSeconds=0.6,
+                        sampleRate=16000, noiseLevel=30.0, seed=0):
+    rng = numpy.random.default_rng(seed)
+    syllableLength = int(0.12 * sampleRate)
+    t = numpy.arange(syllableLength) / float(sampleRate)
+    vowel = sum(numpy.sin(2 * numpy.pi * 140 * k * t) / k for k in range(1, 12)) * numpy.hanning(syllableLength)
+    audio = rng.normal(0, noiseLevel, int(seconds * sampleRate))
+    position = int(0.5 * sampleRate)
+    syllables = 0
+    pauses = 0
+    sinceLastPause = 0.0
+    while position + syllableLength < len(audio):
+        loudness = rng.uniform(3000, 6000)
+        audio[position:position + syllableLength] += vowel * loudness
+        syllables += 1
+        step = 1.0 / syllablesPerSecond
+        sinceLastPause += step
+        if sinceLastPause >= pauseEvery:
+            step += pauseSeconds
+            sinceLastPause = 0.0
+            pauses += 1
+        position += int(step * sampleRate)
+    samples = numpy.clip(audio, -32768, 32767).astype(numpy.int16)
+    wav = wave.open(path, "wb")
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(sampleRate)
+    wav.writeframes(samples.tobytes())
+    wav.close()
+    return syllables, pauses
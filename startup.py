@@ -0,0 +1,156 @@
+import importlib
+import threading
+import time
+
+#================================ MODEL WARM-UP =============================================================
+# Imports the heavy libraries, builds FER and runs its first inference on a background thread after the window is up,
+# then hands the detector to the first FER worker that asks for it.
+
+# A FER detector, imported here so TensorFlow is only loaded when a detector is actually built
+def buildFer():
+    from fer import FER
+    return FER()
+
+
+# Run the detector once on a blank frame (the face detector) and once on a given face box (the emotion classifier), so
+# the first real frame does not pay for TensorFlow's first-call setup
+def warmDetector(detector, width=400, height=300):
+    import numpy
+    frame = numpy.full((height, width, 3), 128, dtype=numpy.uint8)
+    detector.detect_emotions(frame)
+    detector.detect_emotions(frame, face_rectangles=[(width // 4, height // 4, width // 2, height // 2)])
+
+
+class ModelWarmup:
+    # build(): returns a new detector
+    # warm(detector): runs it once so it is ready for real frames, None to skip
+    # onStatus(status, seconds): optional, called on the loading thread with "loading", "imported" (only when there
+    # is something to preload), "warming", "ready" or "failed: <error>" and the seconds since start()
+    # preload: names of modules to import first, e.g. ("cv2", "flask"), so the GUI thread finds them already loaded
+    def __init__(self, build=buildFer, warm=warmDetector, onStatus=None, preload=()):
+        self.build = build
+        self.warm = warm
+        self.onStatus = onStatus
+        self.preload = tuple(preload)
+        self.readyEvent = threading.Event()
+        self.lock = threading.Lock()
+        self.detector = None # the warmed-up detector until the first worker takes it
+        self.error = None
+        self.startTime = None
+        self.importSeconds = None # seconds to import the preload modules
+        self.buildSeconds = None # seconds to import the library and build the detector
+        self.warmSeconds = None # seconds for the warm-up inference
+        self.thread = None
+
+    def start(self):
+        self.startTime = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name="Model-Warmup", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.status("loading")
+            for module in self.preload:
+                importlib.import_module(module)
+            self.importSeconds = time.monotonic() - self.startTime
+            if self.preload:
+                self.status("imported")
+            detector = self.build()
+            self.buildSeconds = time.monotonic() - self.startTime - self.importSeconds
+            self.status("warming")
+            if self.warm is not None:
+                self.warm(detector)
+            self.warmSeconds = time.monotonic() - self.startTime - self.importSeconds - self.buildSeconds
+            with self.lock:
+                self.detector = detector
+            self.status("ready")
+        except Exception as error: # the workers build their own detector and report the error themselves
+            self.error = error
+            self.status("failed: " + str(error))
+        self.readyEvent.set()
+
+    def status(self, status):
+        if self.onStatus is not None:
+            self.onStatus(status, time.monotonic() - self.startTime)
+
+    # Block until the warm-up has finished (or failed). Returns True when it succeeded
+    def wait(self, timeout=None):
+        self.readyEvent.wait(timeout)
+        return self.readyEvent.is_set() and self.error is None
+
+    def ready(self):
+        return self.readyEvent.is_set() and self.error is None
+
+    # The warmed-up detector, handed out once. Later callers get None and build their own
+    def take(self):
+        with self.lock:
+            detector = self.detector
+            self.detector = None
+        return detector
+#--------------------------------END MODEL WARM-UP-----------------------------------------------
+
+
+#================================ STARTUP TIMELINE ==========================================================
+# Seconds from launch to each startup milestone ("window", "model ready", "first emotion", ...), each noted once
+
+class StartupTimeline:
+    def __init__(self, origin=None):
+        self.origin = time.monotonic() if origin is None else origin
+        self.lock = threading.Lock()
+        self.milestones = [] # (name, seconds since origin), in the order they happened
+
+    # Note a milestone now. Returns True the first time, False when it was already noted
+    def mark(self, name):
+        seconds = time.monotonic() - self.origin
+        with self.lock:
+            if any(milestone == name for milestone, when in self.milestones):
+                return False
+            self.milestones.append((name, seconds))
+        return True
+
+    def seconds(self, name):
+        with self.lock:
+            for milestone, when in self.milestones:
+                if milestone == name:
+                    return when
+        return None
+
+    def marks(self):
+        with self.lock:
+            return list(self.milestones)
+
+    def report(self):
+        return "Startup: " + ", ".join(name + " " + str(round(seconds, 2)) + " s" for name, seconds in self.marks())
+#--------------------------------END STARTUP TIMELINE-----------------------------------------------
+
+
+# Warm-up of the real FER model with the app's preloaded modules and a timeline like the app's. The main thread keeps
+# ticking while the model loads, the way the GUI event loop would. Exits with an error when the warm-up fails.
+# python startup.py
+if __name__ == "__main__":
+    import sys
+    import numpy
+
+    timeline = StartupTimeline()
+    timeline.mark("window")
+    warmup = ModelWarmup(buildFer, onStatus=lambda status, seconds: print("  %6.2f s  %s" % (seconds, status)),
+                         preload=("cv2", "speech_recognition", "flask"))
+    warmup.start()
+    ticks = 0
+    while not warmup.readyEvent.wait(0.01):
+        ticks += 1 # stands in for the event loop redrawing the window
+    if not warmup.ready():
+        sys.exit("warm-up failed: " + str(warmup.error))
+    timeline.mark("model ready")
+    detector = warmup.take()
+    frame = numpy.zeros((300, 400, 3), dtype=numpy.uint8)
+    frame[100:200, 160:240] = 200
+    firstStart = time.monotonic()
+    faces = detector.detect_emotions(frame)
+    timeline.mark("first emotion")
+    print("first inference after warm-up: " + str(round((time.monotonic() - firstStart) * 1000, 1)) + " ms, " +
+          str(len(faces)) + " face(s)")
+    print("imports " + str(round(warmup.importSeconds, 2)) + " s, build " + str(round(warmup.buildSeconds, 2)) +
+          " s, warm-up inference " + str(round(warmup.warmSeconds, 2)) + " s, main thread ticked " + str(ticks) +
+          " times while loading")
+    print(timeline.report())
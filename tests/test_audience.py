@@ -0,0 +1,76 @@
+import time
+
+import numpy
+
+from audience import AudienceAnalyzer, AudienceStats, makeAudienceFrame
+from batch_analyzer import StubDetector
+from emotion_batch import classifyFaces
+from emotion_store import EMOTIONS
+
+
+class Result:
+    def __init__(self, faces):
+        self.faces = faces
+
+
+# Faces that drift a few pixels keep their id, a face that appears gets a new one
+def test_face_ids_are_stable():
+    detector = StubDetector()
+    analyzer = AudienceAnalyzer(maxFaces=64, minFaceSize=8)
+    stats = AudienceStats()
+    for shift in range(5):
+        ids = stats.update(Result(analyzer.analyse(detector, makeAudienceFrame(6, shift=shift * 3)).faces))
+    assert sorted(ids) == list(range(6))
+    ids = stats.update(Result(analyzer.analyse(detector, makeAudienceFrame(7, shift=12)).faces))
+    assert sorted(ids) == list(range(7))
+
+
+def test_largest_faces_are_kept():
+    analyzer = AudienceAnalyzer(maxFaces=4, minFaceSize=8)
+    analysed = analyzer.analyse(StubDetector(), makeAudienceFrame(10))
+    assert len(analysed.faces) == 4
+    areas = [box[2] * box[3] for box, scores in analysed.faces]
+    assert areas == sorted(areas, reverse=True)
+    assert set(analysed.scores) == set(EMOTIONS)
+
+
+def test_empty_frame_is_none():
+    assert AudienceAnalyzer().analyse(StubDetector(), numpy.zeros((480, 640, 3), dtype=numpy.uint8)) is None
+
+
+# One forward pass for every face beats one pass per face
+def test_batched_classification_is_faster():
+    detector = StubDetector()
+    frame = makeAudienceFrame(16)
+    boxes = detector.find_faces(frame, bgr=True)
+    assert len(boxes) == 16
+
+    def timed(run, repeats=30):
+        run()
+        startTime = time.perf_counter()
+        for i in range(repeats):
+            run()
+        return time.perf_counter() - startTime
+
+    batched = timed(lambda: classifyFaces(detector, [frame], [boxes]))
+    separate = timed(lambda: numpy.concatenate([classifyFaces(detector, [frame], [[box]]) for box in boxes]))
+    assert batched < separate
+
+
+# A long session with faces coming and going: the per-face counts stay bounded, and the report counts the people
+# watching at the same time, not the face ids handed out
+def test_long_session_stays_bounded():
+    random = numpy.random.default_rng(0)
+    stats = AudienceStats()
+    scores = numpy.eye(len(EMOTIONS), dtype=numpy.float32)[3]
+    seated = [(x * 60, 100, 40, 40) for x in range(5)]
+    for frame in range(3000):
+        passing = [(int(random.integers(0, 600)), 300, 30, 30)] # someone walking past, never at the same spot
+        stats.update(Result([(box, scores) for box in seated + passing]))
+        assert len(stats.perFace) <= 5 + stats.tracker.maxMissed + 1
+    summary = stats.summary()
+    assert stats.tracker.nextId > 1000
+    assert summary["peakFaces"] == 6
+    assert summary["averageFaces"] == 6.0
+    assert "uniqueFaces" not in summary
+    assert summary["faceTopEmotions"]["0"] == EMOTIONS[3]
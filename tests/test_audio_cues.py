@@ -0,0 +1,62 @@
+import logging
+import random
+import time
+
+import numpy
+
+import audio_cues
+from audio_cues import CueEngine, NullSink, loadWav, toneCue
+
+
+# Two overlapping dings rendered block by block equal the sum of the two cues, sample for sample
+def test_overlapping_cues_are_mixed():
+    ring = loadWav("ring.wav")
+    sink = NullSink(realtime=False, keep=True)
+    engine = CueEngine(sink)
+    engine.add("ding", ring * 0.5)
+    engine.start()
+    engine.play("ding")
+    sink.advance(10) # the second ding starts 10 blocks (2560 frames) after the first
+    engine.play("ding")
+    sink.advance(len(ring) // engine.blockFrames + 20)
+    mixed = sink.output().astype(numpy.float32) / 32767.0
+    expected = numpy.zeros_like(mixed)
+    expected[:len(ring)] += ring * 0.5
+    expected[2560:2560 + len(ring)] += ring * 0.5
+    expected = numpy.clip(expected, -1.0, 1.0)
+    assert numpy.abs(mixed - expected).max() * 32767 <= 1.0
+    assert engine.stats()["peakVoices"] == 2
+
+
+# Cues triggered at random moments against a real-time sink start within a couple of blocks
+def test_cues_start_quickly():
+    random.seed(0)
+    engine = CueEngine(NullSink(realtime=True))
+    engine.load("ding", "ring.wav")
+    engine.add("green", toneCue(660))
+    engine.start()
+    for i in range(50):
+        time.sleep(random.uniform(0.0, 0.02))
+        engine.play("ding" if i % 4 else "green")
+    time.sleep(0.05)
+    stats = engine.stats()
+    engine.close()
+    assert stats["triggered"] == 50
+    assert stats["startLatencyMsMax"] < 50
+
+
+# Without a sound card the engine falls back to a NullSink and says so in the log, not on stdout
+def test_no_sound_output_is_logged(monkeypatch, caplog, capsys):
+    class MissingSink:
+        def start(self, render, sampleRate, channels, blockFrames):
+            raise OSError("no output device")
+
+    monkeypatch.setattr(audio_cues, "PyAudioSink", MissingSink)
+    with caplog.at_level(logging.WARNING, logger="audio_cues"):
+        engine = audio_cues.openCueEngine()
+    try:
+        assert isinstance(engine.sink, NullSink)
+        assert "audio cues are muted" in caplog.text and "no output device" in caplog.text
+        assert capsys.readouterr().out == ""
+    finally:
+        engine.close()
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from batch_analyzer import analyseVideos, makeSyntheticVideo, measureScaling
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    return makeSyntheticVideo(str(tmp_path_factory.mktemp("batch") / "clip.avi"), seconds=40)
+
+
+# Chunks are scored in any order by any worker, the merged summary must not depend on how many there were
+def test_results_do_not_depend_on_worker_count(clip):
+    one = analyseVideos([clip], workers=1, chunkSeconds=2.0, stride=1, useStub=True)
+    two = analyseVideos([clip], workers=2, chunkSeconds=2.0, stride=1, useStub=True)
+    assert one == two
+    assert one[clip]["framesAnalysed"] == 40 * 15
+
+
+def test_scaling_rows(clip):
+    rows = measureScaling([clip], [1, 2], chunkSeconds=2.0, useStub=True)
+    assert [row["workers"] for row in rows] == [1, 2]
+    assert rows[0]["speedup"] == 1.0
+    assert all(row["framesPerSecond"] > 0 for row in rows)
+
+
+# 20 chunks over two processes: clearly faster than one, with room left for process start-up and the merge
+@pytest.mark.skipif((os.cpu_count() or 1) < 2, reason="needs at least two cores")
+def test_two_workers_are_faster_than_one(clip):
+    rows = measureScaling([clip], [1, 2], chunkSeconds=2.0, useStub=True)
+    assert rows[1]["speedup"] > 1.3
@@ -0,0 +1,29 @@
+import numpy
+
+from emotion_store import EMOTIONS, EmotionStore
+
+
+# The ring keeps `capacity` rows, the running totals keep counting every row
+def test_ring_wraps_and_totals_stay_exact():
+    store = EmotionStore(capacity=1000)
+    rng = numpy.random.default_rng(0)
+    expected = numpy.zeros(len(EMOTIONS), dtype=int)
+    for i in range(5000):
+        scores = None if i % 10 == 0 else rng.random(len(EMOTIONS))
+        if scores is not None:
+            expected[int(numpy.argmax(scores))] += 1
+        store.append(i / 30.0, scores)
+    assert len(store) == 1000
+    assert [store.counts()[emotion] for emotion in EMOTIONS] == expected.tolist()
+    assert store.topEmotion() == EMOTIONS[int(expected.argmax())]
+    assert store.leastEmotion() == EMOTIONS[int(expected.argmin())]
+
+
+def test_dominant_per_window():
+    store = EmotionStore()
+    for i in range(300): # 10 s of happy, then 10 s of sad, at 15 rows a second
+        scores = numpy.zeros(len(EMOTIONS))
+        scores[EMOTIONS.index("happy" if i < 150 else "sad")] = 1.0
+        store.append(i / 15.0, scores)
+    starts, dominant = store.dominantPerWindow(5.0)
+    assert [EMOTIONS[i] for i in dominant] == ["happy", "happy", "sad", "sad"]
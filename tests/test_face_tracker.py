@@ -0,0 +1,87 @@
+import time
+
+import cv2
+import numpy
+import pytest
+
+from batch_analyzer import StubDetector, makeSyntheticVideo
+from face_tracker import TrackingDetector, compareWithFullDetection
+
+
+@pytest.fixture(scope="module")
+def frames(tmp_path_factory):
+    clip = cv2.VideoCapture(makeSyntheticVideo(str(tmp_path_factory.mktemp("video") / "speech.avi")))
+    frames = []
+    while True:
+        ret, frame = clip.read()
+        if not ret:
+            break
+        frames.append(frame)
+    clip.release()
+    return frames
+
+
+# A speaker with a textured face (the template match needs some detail to lock on to), moving like the synthetic clip
+@pytest.fixture(scope="module")
+def texturedFrames():
+    face = numpy.random.default_rng(0).integers(60, 250, (100, 80), dtype=numpy.uint8)
+    face = cv2.GaussianBlur(face, (5, 5), 0)
+    frames = []
+    for frameNumber in range(80):
+        frame = numpy.zeros((300, 400, 3), dtype=numpy.uint8)
+        x = 150 + int(20 * numpy.sin(frameNumber / 10.0))
+        y = 100 + int(10 * numpy.cos(frameNumber / 15.0))
+        frame[y:y + 100, x:x + 80] = face[:, :, None]
+        frames.append(frame)
+    return frames
+
+
+# The stub with FER's costs on a 400x300 frame: the full-frame face detector takes most of the time, classifying one
+# face crop much less
+class FerCostDetector(StubDetector):
+    detectSeconds = 0.02
+    classifySeconds = 0.005
+
+    def detect_emotions(self, img, face_rectangles=None):
+        if face_rectangles is None:
+            time.sleep(self.detectSeconds)
+        time.sleep(self.classifySeconds)
+        return super().detect_emotions(img, face_rectangles)
+
+
+# Tracking is good enough when the top emotion matches full detection on at least 95% of frames
+def test_tracking_agrees_with_full_detection(frames):
+    agreement, fullTime, trackedTime = compareWithFullDetection(StubDetector, frames)
+    assert agreement >= 0.95
+
+
+def test_tracker_detects_again_every_few_frames(frames):
+    tracker = TrackingDetector(StubDetector(), redetectEvery=10)
+    for frame in frames:
+        tracker.detect_emotions(frame)
+    assert tracker.trackCount > 0
+    assert tracker.detectCount >= len(frames) // 11
+
+
+def test_no_face_raises_index_error(frames):
+    with pytest.raises(IndexError):
+        TrackingDetector(StubDetector()).top_emotion(frames[0] * 0)
+
+
+# With the default re-check interval the tracked path costs well under full detection per frame, and still agrees
+def test_tracking_costs_less_than_full_detection(texturedFrames):
+    agreement, fullTime, trackedTime = compareWithFullDetection(FerCostDetector, texturedFrames, redetectEvery=10)
+    assert agreement >= 0.95
+    assert trackedTime < 0.5 * fullTime
+
+    tracker = TrackingDetector(FerCostDetector(), redetectEvery=10)
+    for frame in texturedFrames:
+        tracker.detect_emotions(frame)
+    assert tracker.detectCount <= len(texturedFrames) // 10 + 1 # the face was never lost
+
+
+# Even when the tracker keeps losing the face (the synthetic clip's face is one flat colour), it is no dearer
+def test_lost_tracking_is_no_dearer(frames):
+    agreement, fullTime, trackedTime = compareWithFullDetection(FerCostDetector, frames[:60], redetectEvery=10)
+    assert agreement >= 0.95
+    assert trackedTime < fullTime
@@ -0,0 +1,80 @@
+import random
+import re
+import time
+
+import pytest
+
+from filler_words import AhCountMerger, FillerDetector, entryPattern
+
+VOCABULARY = ("the", "speech", "today", "about", "our", "club", "members", "really", "want", "to", "share", "story",
+              "when", "was", "young", "learned", "that", "people", "listen", "best", "if", "you", "known", "them",
+              "liked", "also", "sold", "mean", "kind", "umbrella", "sort", "uhuru") # near misses: liked, sold, umbrella
+FILLERS = ("um", "uh", "like", "you know", "so", "i mean", "basically", "kind of", "ummm", "uhh")
+
+
+# Phrases with a known number of fillers put in among words that only look like them
+def makeCorpus(count, seed=0):
+    rng = random.Random(seed)
+    phrases = []
+    expected = 0
+    for i in range(count):
+        words = [rng.choice(VOCABULARY) for j in range(rng.randint(6, 14))]
+        for j in range(rng.randint(0, 2)):
+            words.insert(rng.randint(0, len(words)), rng.choice(FILLERS))
+            expected += 1
+        phrases.append(" ".join(words))
+    return phrases, expected
+
+
+def test_counts_match_the_fillers_put_in():
+    phrases, expected = makeCorpus(5000)
+    detector = FillerDetector()
+    for i, phrase in enumerate(phrases):
+        detector.process(phrase, i * 3.0, i * 3.0 + 3.0)
+    assert detector.total == expected
+
+
+def test_longest_phrase_wins_and_stretched_words_match():
+    detector = FillerDetector()
+    assert [word for word, position in detector.scan("you know I mean ummm sooo")] == ["you know", "i mean", "um", "so"]
+    assert detector.scan("umbrella liked sold") == []
+
+
+# The fillers of a phrase are counted once, and the final result takes back a filler a partial guess had
+def test_partial_results_are_corrected():
+    detector = FillerDetector()
+    detector.process("so um", partial=True)
+    detector.process("so um I think", partial=True)
+    detector.process("so um I think uh", partial=True)
+    detector.process("so I think uh we should", partial=False)
+    assert detector.total == 2
+    assert detector.usedCounts() == {"so": 1, "uh": 1}
+
+
+# One compiled pattern scans faster than one pattern per lexicon entry
+def test_one_pattern_is_faster_than_one_per_entry():
+    phrases, expected = makeCorpus(5000)
+    detector = FillerDetector()
+    startTime = time.perf_counter()
+    for phrase in phrases:
+        detector.scan(phrase)
+    compiledSeconds = time.perf_counter() - startTime
+    separate = [re.compile(r"\b" + entryPattern(entry) + r"\b", re.IGNORECASE) for entry in detector.entries]
+    startTime = time.perf_counter()
+    for phrase in phrases:
+        for pattern in separate:
+            pattern.findall(phrase)
+    assert compiledSeconds < time.perf_counter() - startTime
+
+
+@pytest.mark.parametrize("policy, expected", [("max", 5), ("sum", 8), ("manual", 3), ("auto", 5)])
+def test_merge_policies(policy, expected):
+    merger = AhCountMerger(policy)
+    merger.setManual(3)
+    assert merger.addAuto(5)[0] == expected
+    assert merger.addAuto(-10)[0] == {"max": 3, "sum": 3, "manual": 3, "auto": 0}[policy]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        AhCountMerger("median")
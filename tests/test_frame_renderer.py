@@ -0,0 +1,76 @@
+import os
+import time
+
+import cv2
+import numpy
+import pytest
+
+from frame_renderer import FrameRenderer
+
+FRAME = numpy.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=numpy.uint8)
+
+
+# Scaled to fit the target, mirrored and turned into RGB, the same as doing it the slow way
+def test_render_matches_opencv():
+    renderer = FrameRenderer(maxFps=0)
+    renderer.setTargetSize(640, 640)
+    renderer.mirror = True
+    index, rgb = renderer.render(FRAME)
+    expected = cv2.cvtColor(cv2.flip(cv2.resize(FRAME, (640, 480), interpolation=cv2.INTER_NEAREST), 1), cv2.COLOR_BGR2RGB)
+    assert rgb.shape == (480, 640, 3)
+    assert numpy.array_equal(rgb, expected)
+
+
+# A buffer the GUI has not released is never written to, the frame is skipped instead
+def test_buffers_in_use_are_not_overwritten():
+    renderer = FrameRenderer(maxFps=0, numBuffers=2)
+    first = renderer.render(FRAME)
+    second = renderer.render(FRAME)
+    assert renderer.render(FRAME) is None
+    renderer.release(first[0])
+    third = renderer.render(FRAME)
+    assert third[1] is first[1] # the same preallocated buffer, no new array
+    assert renderer.renderedCount == 3 and renderer.skippedCount == 1
+    assert second is not None
+
+
+def test_frames_faster_than_the_display_are_skipped():
+    renderer = FrameRenderer(maxFps=10)
+    index, rgb = renderer.render(FRAME)
+    renderer.release(index)
+    assert renderer.render(FRAME) is None
+    time.sleep(0.11)
+    assert renderer.render(FRAME) is not None
+
+
+# The GUI thread only makes a pixmap now, which costs less than the old flip, convert and scale on the GUI thread
+def test_gui_thread_work_is_smaller():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+    from PyQt5 import QtGui
+    from PyQt5.QtCore import Qt
+
+    App = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    label = QtWidgets.QLabel()
+    label.resize(640, 480)
+    frames = 200
+    startTime = time.perf_counter()
+    for i in range(frames):
+        flipped = cv2.flip(FRAME, 1)
+        height, width, channel = flipped.shape
+        qImg = QtGui.QImage(flipped.data, width, height, 3 * width, QtGui.QImage.Format_RGB888).rgbSwapped()
+        label.setPixmap(QtGui.QPixmap(qImg).scaled(label.width(), label.height(), Qt.KeepAspectRatio, Qt.FastTransformation))
+    before = time.perf_counter() - startTime
+
+    renderer = FrameRenderer(maxFps=0)
+    renderer.setTargetSize(label.width(), label.height())
+    renderer.mirror = True
+    guiTime = 0.0
+    for i in range(frames):
+        index, rgb = renderer.render(FRAME)
+        image = QtGui.QImage(rgb.data, rgb.shape[1], rgb.shape[0], rgb.strides[0], QtGui.QImage.Format_RGB888)
+        startTime = time.perf_counter()
+        label.setPixmap(QtGui.QPixmap.fromImage(image))
+        renderer.release(index)
+        guiTime += time.perf_counter() - startTime
+    assert guiTime < before
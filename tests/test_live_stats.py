@@ -0,0 +1,116 @@
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from live_stats import LiveStatsServer
+
+
+@pytest.fixture
+def server():
+    server = LiveStatsServer(host="127.0.0.1", port=0, interval=1 / 30, maxBuffer=4096, sendBuffer=4096)
+    server.start()
+    yield server
+    server.stop()
+
+
+def subscribe(port, receiveBuffer=None):
+    sock = socket.socket()
+    if receiveBuffer is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receiveBuffer)
+    sock.connect(("127.0.0.1", port))
+    sock.sendall(b"GET /live HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+    sock.setblocking(False)
+    return sock
+
+
+# Reads every subscriber socket and counts the delta events each one got
+def reader(socks, counts, stopEvent):
+    selector = selectors.DefaultSelector()
+    tails = {}
+    for sock in socks:
+        selector.register(sock, selectors.EVENT_READ)
+        tails[sock] = b""
+    while not stopEvent.is_set():
+        for key, events in selector.select(0.05):
+            try:
+                data = key.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                selector.unregister(key.fileobj)
+                continue
+            joined = tails[key.fileobj] + data
+            counts[key.fileobj] = counts.get(key.fileobj, 0) + joined.count(b"event: delta")
+            tails[key.fileobj] = joined[-11:]
+    selector.close()
+
+
+def test_snapshot(server):
+    server.publish(emotion="happy", wpm=130)
+    with urllib.request.urlopen("http://127.0.0.1:" + str(server.boundPort()) + "/snapshot") as response:
+        state = json.loads(response.read())
+    assert state["emotion"] == "happy" and state["wpm"] == 130
+
+
+# Every reading subscriber gets the deltas, changes in between are merged
+def test_subscribers_get_every_delta(server):
+    socks = [subscribe(server.boundPort()) for i in range(20)]
+    counts = {}
+    stopEvent = threading.Event()
+    readerThread = threading.Thread(target=reader, args=(socks, counts, stopEvent))
+    readerThread.start()
+    time.sleep(0.3) # let every subscriber connect
+    deltasBefore = server.serialisedCount
+    for frame in range(30):
+        server.publish(elapsed=frame, wpm=120 + frame)
+        time.sleep(1 / 30)
+    time.sleep(0.3)
+    stopEvent.set()
+    readerThread.join()
+    deltas = server.serialisedCount - deltasBefore
+    for sock in socks:
+        sock.close()
+    assert deltas > 0
+    assert min(counts.get(sock, 0) for sock in socks) == deltas
+
+
+# A subscriber that never reads is resynced and then dropped, the reading one does not miss anything
+def test_stalled_subscriber_is_dropped(server):
+    server.interval = 0.0005
+    fast = subscribe(server.boundPort())
+    slow = subscribe(server.boundPort(), receiveBuffer=4096)
+    counts = {}
+    stopEvent = threading.Event()
+    readerThread = threading.Thread(target=reader, args=([fast], counts, stopEvent))
+    readerThread.start()
+    time.sleep(0.2)
+    for frame in range(20000):
+        server.publish(elapsed=frame, status="burst " + "x" * 100)
+        if frame % 5 == 0:
+            time.sleep(0.0005)
+    time.sleep(0.5)
+    stopEvent.set()
+    readerThread.join()
+    stats = server.stats()
+    fast.close()
+    slow.close()
+    assert stats["resyncs"] >= 1
+    assert stats["dropped"] == 1
+    assert counts.get(fast, 0) == stats["deltas"]
+
+
+# A port that is already taken leaves the stream off instead of raising into the GUI
+def test_port_in_use_leaves_the_stream_off(server, caplog):
+    second = LiveStatsServer(host="127.0.0.1", port=server.boundPort())
+    with caplog.at_level(logging.WARNING, logger="live_stats"):
+        assert second.start() is False
+    assert "live stats stream is off" in caplog.text
+    second.publish(emotion="happy") # publishing still works, there is just nobody to send to
+    assert second.snapshot()["emotion"] == "happy"
+    second.stop()
@@ -0,0 +1,52 @@
+import json
+import time
+
+from metrics import Metrics, labelKey
+
+
+def timeStages(metrics, calls=50000):
+    startTime = time.perf_counter()
+    for i in range(calls):
+        with metrics.stage("bench"):
+            pass
+    return (time.perf_counter() - startTime) / calls
+
+
+def test_stages_are_recorded_only_when_enabled():
+    off = Metrics(enabled=False)
+    on = Metrics(enabled=True)
+    timeStages(off, 1000)
+    timeStages(on, 1000)
+    assert not off.stageSeconds.values
+    assert on.stageSeconds.values[labelKey({"stage": "bench"})][-1] > 0
+    assert "toastmaster_stage_seconds_count{stage=\"bench\"} 1000" in on.render()
+
+
+# A timed stage stays in the microseconds, and costs less with metrics off
+def test_stage_overhead():
+    off = timeStages(Metrics(enabled=False))
+    on = timeStages(Metrics(enabled=True))
+    assert off < on < 50e-6
+
+
+def test_tracked_values_are_read_when_scraped():
+    metrics = Metrics()
+    queue = [1, 2, 3]
+    metrics.queueDepth.track(lambda: len(queue), queue="fer", session="local")
+    metrics.count("recognizer_timeout")
+    metrics.latency("frame_to_emotion", 0.042)
+    queue.append(4)
+    text = metrics.render()
+    assert "toastmaster_queue_depth{queue=\"fer\",session=\"local\"} 4.0" in text
+    assert "toastmaster_events_total{kind=\"recognizer_timeout\"} 1.0" in text
+    metrics.queueDepth.untrack(queue="fer", session="local")
+    assert "queue=\"fer\"" not in metrics.render()
+
+
+def test_trace_is_chrome_json():
+    metrics = Metrics()
+    metrics.tracer.start()
+    timeStages(metrics, 10)
+    metrics.tracer.stop()
+    trace = json.loads(json.dumps(metrics.tracer.chromeTrace()))
+    assert len([event for event in trace["traceEvents"] if event["name"] == "bench"]) == 10
@@ -0,0 +1,97 @@
+import os
+import time
+
+import numpy
+import pytest
+
+from emotion_store import EmotionStore
+from report_engine import ReportHistory, SessionReport, reportText, safeFileName
+
+
+def makeReport(speaker="Ann Lee", date="2024-05-01 19:30:00", **fields):
+    report = {"speaker": speaker, "date": date, "averageWpm": 130.0, "durationSeconds": 300, "ahCount": 3,
+              "fillerWordsPerMinute": 0.6, "topEmotion": "happy", "leastEmotion": "sad", "emotionCounts": {}}
+    report.update(fields)
+    return report
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ReportHistory(str(tmp_path))
+    yield history
+    history.close()
+
+
+def test_safe_file_name():
+    assert safeFileName("../Ann/Lee") == "___Ann_Lee"
+    assert safeFileName("///") == "___"
+    assert safeFileName("") == "Speaker"
+
+
+# Names that are not safe in a path, and two reports in the same second, still get their own file in Reports
+def test_reports_get_unique_safe_paths(history):
+    report = makeReport(speaker="../Ann/Lee")
+    paths = [history.add(report), history.add(report)]
+    assert len(set(paths)) == 2
+    for path in paths:
+        assert os.path.dirname(path) == os.path.join(history.folder, "Reports")
+        assert os.path.exists(path)
+    assert history.latest("../Ann/Lee")["speaker"] == "../Ann/Lee"
+    assert len(history.loadBinary()) == 2
+
+
+# A long name is cut to 32 bytes on a character boundary, so the binary history always decodes
+def test_long_speaker_name_is_cut_on_a_character(history):
+    speaker = "Zoë " + "é" * 40 # two-byte characters, the 32nd byte falls in the middle of one
+    history.add(makeReport(speaker=speaker))
+    stored = bytes(history.loadBinary()["speaker"][0])
+    assert len(stored) <= 32
+    assert speaker.startswith(stored.decode("utf-8"))
+    assert history.latest(speaker)["speaker"] == speaker
+
+
+def test_latest_without_its_file(history):
+    path = history.add(makeReport())
+    os.remove(path)
+    assert history.latest() is None
+    assert history.latest("Ann Lee") is None
+
+
+def test_trends_and_averages(history):
+    for i in range(10):
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(1.6e9 + i * 3600))
+        history.add(makeReport(speaker="Member " + str(i % 2), date=date, averageWpm=100.0 + i))
+    assert [wpm for date, wpm in history.wpmTrend("Member 1", last=3)] == [105.0, 107.0, 109.0]
+    assert len(history.fillerTrend(last=4)) == 4
+    assert history.speakerAverages()["Member 0"][:2] == (5, 104.0)
+
+
+# The running totals give the same summary generateReport shows, and the history can store it as it is
+def test_session_summary(history):
+    store = EmotionStore()
+    for i, emotion in enumerate((3, 3, 4)): # happy, happy, sad
+        scores = numpy.zeros(7)
+        scores[emotion] = 1.0
+        store.append(float(i), scores)
+    report = SessionReport(store)
+    for wpm in (120, 140):
+        report.addSpeechRate(wpm)
+    report.setAhCount(3)
+    report.setDuration(90)
+    summary = report.summary("Ann Lee")
+    assert summary["averageWpm"] == 130.0
+    assert (summary["topEmotion"], summary["leastEmotion"]) == ("happy", "sad")
+    assert summary["fillerWordsPerMinute"] == 2.0
+    assert history.latest() is None
+    history.add(summary)
+    assert history.latest("Ann Lee")["averageWpm"] == 130.0
+
+
+def test_report_text():
+    text = reportText({"durationSeconds": 75, "averageWpm": 120, "topEmotion": "happy", "leastEmotion": "sad", "ahCount": 2})
+    assert "You Spoke for: 1 minutes, 15 seconds" in text
+    assert "Number of Filler Words Used: 2" in text
+    assert "Words per Minute" not in reportText({"durationSeconds": 5, "topEmotion": "happy", "leastEmotion": "sad"})
+    audience = {"topEmotion": "neutral", "peakFaces": 7, "averageFaces": 5.5}
+    text = reportText({"durationSeconds": 5, "topEmotion": "happy", "leastEmotion": "sad", "audience": audience})
+    assert "People in Audience: 7 at most (5.5 watching on average)" in text
@@ -0,0 +1,59 @@
+import random
+
+from session_clock import ClockScheduler, SessionClock
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 1000.0
+
+    def now(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += seconds
+
+
+# A 20-minute speech on a fake clock advanced in irregular 1 to 50 ms steps, with a one-minute pause at 10:00: every
+# flag fires once, at most one step late, the pause is left out, and the display ticks every second with no drift
+def test_flags_ticks_and_pause():
+    random.seed(0)
+    fake = FakeClock()
+    clock = SessionClock(now=fake.now)
+    scheduler = ClockScheduler(clock)
+    thresholds = {"green": 900, "yellow": 1050, "red": 1140, "limit": 1200}
+    flags = []
+    ticks = []
+    for name, due in thresholds.items():
+        scheduler.at(due, lambda due, name=name: flags.append((name, due, clock.elapsed(), fake.now())), name)
+    tick = scheduler.every(1.0, lambda due: ticks.append(due), "tick")
+
+    clock.start()
+    startWall = fake.now()
+    maxStep = 0.05
+    paused = False
+    while clock.elapsed() < 1200.5:
+        fake.advance(random.uniform(0.001, maxStep))
+        if not paused and clock.elapsed() >= 600:
+            clock.pause()
+            pauseStart = fake.now()
+            paused = True
+        if clock.paused() and fake.now() - pauseStart >= 60:
+            clock.resume()
+            pauseLength = fake.now() - pauseStart
+        scheduler.runDue()
+    tick.cancel()
+
+    assert [name for name, due, fired, wall in flags] == ["green", "yellow", "red", "limit"]
+    assert all(0 <= fired - due <= maxStep for name, due, fired, wall in flags)
+    assert all(abs((wall - startWall) - (fired + pauseLength)) < 1e-6 for name, due, fired, wall in flags)
+    assert ticks == [float(second) for second in range(len(ticks))]
+    assert len(ticks) == 1201
+
+
+def test_session_time_of_a_timestamp():
+    fake = FakeClock()
+    clock = SessionClock(now=fake.now)
+    clock.start()
+    fake.advance(5.0)
+    assert clock.toSession(fake.now() - 1.0) == 4.0
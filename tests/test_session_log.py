@@ -0,0 +1,57 @@
+import numpy
+import pytest
+
+from session_log import (HEADER_SIZE, RATE_LOCAL, RECORD, SessionLog, emotionRecords, readSessionLog,
+                         speechRateRecords, timerRecords, transcriptRecords)
+
+TEXT = "a transcript that is longer than one record can hold on its own"
+
+
+# Written records read back the same, while the log is still open (as after a crash) and after it is closed, with the
+# file grown several times on the way
+def test_write_and_read_back(tmp_path):
+    path = str(tmp_path / "session.tmlog")
+    log = SessionLog(path, growRecords=64)
+    scores = numpy.full(7, 1.0 / 7, dtype=numpy.float32)
+    for i in range(500):
+        log.emotion(scores)
+    log.emotion(None)
+    log.transcript(TEXT)
+    log.speechRate(130.5)
+    log.speechRate(99.0, source=RATE_LOCAL)
+    log.ahCount(3)
+    log.timerEvent("green", 60)
+    startWall, records = readSessionLog(path)
+    assert len(records) > 500
+    log.close()
+
+    startWall, records = readSessionLog(path)
+    times, emotionScores, facePresent = emotionRecords(records)
+    assert len(times) == 501
+    assert numpy.allclose(emotionScores[0], scores)
+    assert facePresent[:500].all() and not facePresent[500]
+    assert [text for time, text in transcriptRecords(records)] == [TEXT]
+    assert speechRateRecords(records)[1].tolist() == [130.5]
+    assert speechRateRecords(records, RATE_LOCAL)[1].tolist() == [99.0]
+    assert [(event, seconds) for time, event, seconds in timerRecords(records)] == [("green", 60.0)]
+
+
+# A transcript cut off before its TRANSCRIPT record is never read back
+def test_unfinished_transcript_is_left_out(tmp_path):
+    path = str(tmp_path / "session.tmlog")
+    log = SessionLog(path)
+    log.transcript(TEXT)
+    log.close()
+    count = len(readSessionLog(path)[1])
+    records = numpy.memmap(path, dtype=RECORD, mode="r+", offset=HEADER_SIZE, shape=(count,))
+    records["kind"][count - 1] = 0 # as if the crash came before the TRANSCRIPT record was finished
+    records.flush()
+    del records
+    assert transcriptRecords(readSessionLog(path)[1]) == []
+
+
+def test_not_a_session_log(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+        readSessionLog(str(path))
@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+pytest.importorskip("speech_recognition")
+
+from batch_analyzer import StubDetector
+from session_server import SessionManager
+
+
+# Emotions flowing from a running camera do not keep a session alive, only client requests do
+def test_only_requests_keep_a_session_alive(tmp_path):
+    manager = SessionManager(folder=str(tmp_path), idleSeconds=0.5, detectorFactory=StubDetector)
+    abandoned = manager.create(video="synthetic")
+    watched = manager.create(video="synthetic")
+    emotions = []
+    abandoned.on("emotion", lambda *arguments: emotions.append(arguments))
+    abandoned.start()
+    watched.start()
+    try:
+        for i in range(8):
+            time.sleep(0.1)
+            assert manager.get(watched.id) is watched
+        assert emotions
+        assert manager.evictIdle() == [abandoned.id]
+        assert manager.get(abandoned.id) is None
+        assert manager.get(watched.id) is watched
+    finally:
+        manager.closeAll()
@@ -0,0 +1,58 @@
+import threading
+import time
+import wave
+
+import pytest
+
+pytest.importorskip("speech_recognition")
+
+from speech_pipeline import ContinuousSpeechCapture, StubBackend, WavFileSource
+from speech_rate import makeSyntheticSpeech
+
+
+@pytest.fixture(scope="module")
+def speech(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("audio") / "speech.wav")
+    makeSyntheticSpeech(path, seconds=20)
+    return path
+
+
+# A recognizer slower than the phrases come in still gets every phrase, delivered in spoken order, with no gaps
+def test_phrases_are_delivered_in_order(speech):
+    results = []
+    capture = ContinuousSpeechCapture(WavFileSource(speech), StubBackend(latency=0.2), results.append, workers=4)
+    capture.run(lambda: False)
+    assert len(results) >= 3 and results[-1].end > 15.0 # 20 s of speech, cut into phrases of at most 5 s
+    assert [result.sequence for result in results] == list(range(len(results)))
+    assert all(result.text for result in results)
+    assert all(earlier.start < later.start and later.start - earlier.end < 1.0 for earlier, later in zip(results, results[1:]))
+    assert capture.inFlight == 0
+
+
+# A failing callback is logged, the phrases after it are still delivered, and a slow one does not hold up the others
+def test_callback_errors_do_not_lose_phrases(speech):
+    delivered = []
+    threads = set()
+
+    def onResult(result):
+        threads.add(threading.current_thread().name)
+        if result.sequence == 1:
+            raise RuntimeError("broken handler")
+        time.sleep(0.05)
+        delivered.append(result.sequence)
+
+    capture = ContinuousSpeechCapture(WavFileSource(speech), StubBackend(latency=0.05), onResult, workers=4)
+    capture.run(lambda: False)
+    assert 1 not in delivered
+    assert delivered == sorted(delivered) and len(delivered) == capture.phraseCount - 1
+
+
+def test_only_mono_16_bit_wav_files(tmp_path):
+    path = str(tmp_path / "stereo.wav")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0" * 400)
+    with pytest.raises(ValueError):
+        WavFileSource(path).open()
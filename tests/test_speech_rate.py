@@ -0,0 +1,44 @@
+import time
+import wave
+
+import numpy
+import pytest
+
+from speech_rate import SpeakingRateEstimator, makeSyntheticSpeech
+
+
+def readWav(path):
+    with wave.open(path, "rb") as wav:
+        return numpy.frombuffer(wav.readframes(wav.getnframes()), dtype=numpy.int16)
+
+
+# Synthetic speech with a known number of syllables and pauses, fed in microphone-sized chunks: syllables within 5%,
+# pauses within 1, much faster than real time
+@pytest.mark.parametrize("rate", [2.0, 3.0, 4.0, 5.0])
+def test_syllables_and_pauses(tmp_path, rate):
+    path = str(tmp_path / "speech.wav")
+    syllables, pauses = makeSyntheticSpeech(path, syllablesPerSecond=rate)
+    samples = readWav(path)
+    estimator = SpeakingRateEstimator(historySeconds=60.0)
+    startTime = time.perf_counter()
+    for chunk in range(0, len(samples), 1024):
+        estimator.process(samples[chunk:chunk + 1024])
+    elapsed = time.perf_counter() - startTime
+    stats = estimator.lastStats
+    assert abs(stats["syllables"] - syllables) <= 0.05 * syllables
+    assert abs(stats["pauseCount"] - pauses) <= 1
+    assert len(samples) / 16000.0 / elapsed > 50
+
+
+# A click in the middle of a pause does not split it into two short quiet stretches
+def test_click_does_not_break_a_pause():
+    rng = numpy.random.default_rng(0)
+    samples = rng.normal(0, 30, 16000 * 3)
+    t = numpy.arange(1600) / 16000.0
+    vowel = numpy.sin(2 * numpy.pi * 140 * t) * numpy.hanning(1600) * 5000
+    samples[8000:9600] += vowel # speech, 0.7 s of quiet with a 20 ms click in the middle, speech
+    samples[15200:15520] += numpy.sin(numpy.arange(320) * 0.3) * 8000
+    samples[20800:22400] += vowel
+    estimator = SpeakingRateEstimator(minPauseSeconds=0.5)
+    estimator.process(numpy.clip(samples, -32768, 32767).astype(numpy.int16))
+    assert estimator.lastStats["pauseCount"] == 1
@@ -0,0 +1,74 @@
+import sys
+import threading
+import time
+
+from batch_analyzer import StubDetector
+from startup import ModelWarmup, StartupTimeline
+
+
+# The detector is built and warmed up on a background thread while the caller keeps going, and handed out once
+def test_warmup_in_the_background():
+    statuses = []
+
+    def slowBuild():
+        time.sleep(0.2)
+        return StubDetector()
+
+    warmup = ModelWarmup(slowBuild, onStatus=lambda status, seconds: statuses.append(status))
+    warmup.start()
+    ticks = 0
+    while not warmup.wait(0.01):
+        ticks += 1 # stands in for the event loop redrawing the window
+    assert ticks >= 5
+    assert statuses == ["loading", "warming", "ready"]
+    assert isinstance(warmup.take(), StubDetector)
+    assert warmup.take() is None
+
+
+def test_failed_warmup_is_reported():
+    def brokenBuild():
+        raise ImportError("No module named 'fer'")
+
+    warmup = ModelWarmup(brokenBuild)
+    warmup.start()
+    assert warmup.wait(5.0) is False
+    assert isinstance(warmup.error, ImportError)
+    assert warmup.take() is None
+
+
+# Preloaded modules are imported on the loading thread, before the detector is built
+def test_preload_on_the_loading_thread(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    statuses = []
+    importedBy = []
+
+    def build():
+        importedBy.append(("colorsys" in sys.modules, threading.current_thread().name))
+        return StubDetector()
+
+    warmup = ModelWarmup(build, onStatus=lambda status, seconds: statuses.append(status), preload=("colorsys",))
+    warmup.start()
+    assert warmup.wait(5.0)
+    assert statuses == ["loading", "imported", "warming", "ready"]
+    assert importedBy == [(True, "Model-Warmup")]
+    assert warmup.importSeconds is not None and warmup.buildSeconds is not None
+
+
+def test_failed_preload_is_reported():
+    statuses = []
+    warmup = ModelWarmup(StubDetector, onStatus=lambda status, seconds: statuses.append(status),
+                         preload=("no_such_module_here",))
+    warmup.start()
+    assert warmup.wait(5.0) is False
+    assert isinstance(warmup.error, ImportError)
+    assert statuses[-1].startswith("failed: ")
+
+
+def test_timeline_marks_each_milestone_once():
+    timeline = StartupTimeline()
+    assert timeline.mark("window")
+    assert not timeline.mark("window")
+    timeline.mark("model ready")
+    assert [name for name, seconds in timeline.marks()] == ["window", "model ready"]
+    assert timeline.seconds("first emotion") is None
+    assert timeline.report().startswith("Startup: window ")
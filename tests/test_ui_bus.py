@@ -0,0 +1,82 @@
+import threading
+
+from ui_bus import UiUpdateBus
+
+
+class Widget:
+    def __init__(self):
+        self.calls = []
+
+    def setText(self, text):
+        self.calls.append(text)
+
+    def setStyleSheet(self, style):
+        self.calls.append(style)
+
+
+class Window:
+    def __init__(self):
+        self.fpsLabel = Widget()
+        self.timerLabel = Widget()
+
+
+# Workers publishing as fast as they can: only the newest value reaches each widget, and a colour that is already on
+# screen is never set again
+def test_updates_are_merged_and_unchanged_values_dropped():
+    window = Window()
+    bus = UiUpdateBus()
+
+    def worker():
+        for i in range(5000):
+            bus.setText("fpsLabel", "Frames Per Second: " + str(i))
+            bus.setStyle("timerLabel", "background-color: green")
+
+    threads = [threading.Thread(target=worker) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        bus.apply(window)
+    bus.apply(window)
+    assert window.fpsLabel.calls[-1] == "Frames Per Second: 4999"
+    assert window.timerLabel.calls == ["background-color: green"]
+    stats = bus.stats()
+    assert stats["published"] == 40000
+    assert stats["applied"] == len(window.fpsLabel.calls) + len(window.timerLabel.calls)
+
+
+def test_calls_run_in_order_on_apply():
+    bus = UiUpdateBus()
+    order = []
+    bus.call(order.append, 1)
+    bus.call(order.append, 2)
+    assert order == []
+    bus.apply(Window())
+    assert order == [1, 2]
+
+
+# After forget() a value that was on screen is applied again
+def test_forget():
+    window = Window()
+    bus = UiUpdateBus()
+    bus.setText("fpsLabel", "30")
+    bus.apply(window)
+    bus.setText("fpsLabel", "30")
+    bus.apply(window)
+    assert window.fpsLabel.calls == ["30"]
+    bus.forget("fpsLabel")
+    bus.setText("fpsLabel", "30")
+    bus.apply(window)
+    assert window.fpsLabel.calls == ["30", "30"]
+
+
+# A prompt shown through the bus between two equal recognition results: the second result is shown again
+def test_text_set_through_the_bus_is_not_lost():
+    window = Window()
+    bus = UiUpdateBus()
+    bus.setText("timerLabel", "You said: start speech")
+    bus.apply(window)
+    bus.setText("timerLabel", "Say 'Start Speech'!")
+    bus.apply(window)
+    bus.setText("timerLabel", "You said: start speech")
+    bus.apply(window)
+    assert window.timerLabel.calls == ["You said: start speech", "Say 'Start Speech'!", "You said: start speech"]
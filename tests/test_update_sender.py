@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from update_sender import CoalescingSender, SequenceFilter
+
+flask = pytest.importorskip("flask")
+web_server = pytest.importorskip("web_server")
+
+
+@pytest.fixture
+def echoServer():
+    app = flask.Flask("update_sender_test")
+    sequenceFilter = SequenceFilter()
+    received = []
+
+    @app.route("/set_color", methods=["POST"])
+    def Set_Color():
+        time.sleep(0.02) # a server that takes 20 ms per request
+        if not sequenceFilter.accept("/set_color", flask.request.json):
+            return flask.jsonify(stale=True)
+        received.append(flask.request.json["red"])
+        return flask.jsonify(flask.request.json)
+
+    runner = web_server.ServerRunner(app, host="127.0.0.1", port=0, threads=4)
+    thread = threading.Thread(target=runner.serve, daemon=True)
+    thread.start()
+    assert runner.ready.wait(5.0)
+    yield "http://127.0.0.1:" + str(runner.boundPort()), received, sequenceFilter
+    runner.stop()
+    thread.join(5.0)
+
+
+def test_slider_drag_is_coalesced(echoServer):
+    url, received, sequenceFilter = echoServer
+    sender = CoalescingSender(url)
+    sender.start()
+    for value in range(300): # a slider drag fires valueChanged for every step
+        sender.send("/set_color", {"red": str(value), "green": "0", "blue": "0"})
+        time.sleep(0.002)
+    sender.stop(flush=2.0)
+
+    stats = sender.stats()
+    assert received[-1] == "299"
+    assert len(received) < 150
+    assert stats["sent"] == len(received)
+    assert stats["sent"] + stats["coalesced"] == 300
+    assert stats["failed"] == 0 and stats["waiting"] == 0
+    assert received == sorted(received, key=int)
+
+    # an update older than one already applied is refused
+    assert not sequenceFilter.accept("/set_color", {"client": sender.clientId, "sequence": 5})
+
+
+def test_sequence_filter():
+    sequenceFilter = SequenceFilter()
+    assert sequenceFilter.accept("/set_text", {"client": "a", "sequence": 2})
+    assert not sequenceFilter.accept("/set_text", {"client": "a", "sequence": 1})
+    assert not sequenceFilter.accept("/set_text", {"client": "a", "sequence": 2})
+    assert sequenceFilter.accept("/set_text", {"client": "b", "sequence": 1}) # clients are kept apart
+    assert sequenceFilter.accept("/set_color", {"client": "a", "sequence": 1}) # and so are endpoints
+    assert sequenceFilter.accept("/set_text", {"ahCount": "3"}) # no sequence number: always accepted
+    assert sequenceFilter.staleCount == 2
+
+
+def test_offline_server_keeps_only_the_newest_update():
+    offline = CoalescingSender("http://127.0.0.1:9", timeout=0.2, maxBackoff=0.5) # nothing listens on the discard port
+    offline.start()
+    for value in range(20):
+        offline.send("/set_text", {"ahCount": str(value), "status": "offline"})
+    time.sleep(1.0)
+    stats = offline.stats()
+    offline.stop(flush=0)
+
+    assert stats["sent"] == 0
+    assert stats["failed"] >= 1
+    assert stats["waiting"] == 1
+    assert not stats["connected"]
+    assert offline.pending["/set_text"]["ahCount"] == "19"
@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+
+import pytest
+
+from video_pipeline import FramePipeline, LatestFrameQueue
+
+
+class SlowDetector:
+    def detect_emotions(self, frame):
+        time.sleep(0.1)
+        return [{"box": [0, 0, 10, 10], "emotions": {"neutral": 0.9, "happy": 0.1}}]
+
+
+class FlakyDetector:
+    calls = 0
+
+    def detect_emotions(self, frame):
+        FlakyDetector.calls += 1
+        if FlakyDetector.calls % 2:
+            raise ValueError("bad frame")
+        return []
+
+
+def fakeCamera():
+    time.sleep(1 / 30)
+    return True, object()
+
+
+def test_full_queue_drops_the_oldest_frame():
+    queue = LatestFrameQueue(2)
+    assert not queue.put(1)
+    assert not queue.put(2)
+    assert queue.put(3)
+    assert queue.droppedCount == 1
+    assert queue.get(0) == 2 and queue.get(0) == 3
+    assert queue.get(0.01) is None
+
+
+# A 30 fps camera with a 10 fps detector: capture keeps its rate, the surplus frames are dropped, and a second
+# worker doubles the frames analysed
+def test_capture_is_not_held_back_by_inference():
+    analysed = {}
+    for workers in (1, 2):
+        results = []
+        pipeline = FramePipeline(SlowDetector, onEmotion=results.append, numWorkers=workers)
+        pipeline.start()
+        stopAt = time.monotonic() + 2
+        pipeline.runCapture(fakeCamera, lambda: time.monotonic() > stopAt)
+        pipeline.stop()
+        stats = pipeline.stats()
+        assert pipeline.captureStats.total > 45
+        assert stats["dropped"] > 0
+        assert results and results[-1].emotion == "neutral"
+        assert [result.frameIndex for result in results] == sorted(result.frameIndex for result in results)
+        analysed[workers] = len(results)
+    assert analysed[2] > 1.5 * analysed[1]
+
+
+def test_worker_survives_errors_and_capture_gives_up():
+    frames = iter(range(20))
+
+    def endingCamera():
+        return next(frames, None) is not None, object()
+
+    FlakyDetector.calls = 0
+    errors = []
+    pipeline = FramePipeline(FlakyDetector, onError=errors.append, maxFailedReads=5, queueSize=20)
+    pipeline.start()
+    startTime = time.monotonic()
+    assert pipeline.runCapture(endingCamera, lambda: False) is False
+    assert time.monotonic() - startTime < 1.0 # gave up after maxFailedReads instead of spinning
+    time.sleep(0.2)
+    pipeline.stop()
+    assert errors and pipeline.errorCount == len(errors)
+    assert all(isinstance(error, ValueError) for error in errors)
+    calls = FlakyDetector.calls
+    assert calls == 20
+
+    pipeline.start() # started again, with a fresh queue
+    pipeline.submit(object())
+    time.sleep(0.2)
+    pipeline.stop()
+    assert FlakyDetector.calls == calls + 1
+
+
+def test_recording_end_stops_capture_at_once():
+    frames = iter(range(5))
+
+    def recording():
+        return next(frames, None) is not None, object()
+
+    reads = []
+    pipeline = FramePipeline(SlowDetector, maxFailedReads=1000)
+    startTime = time.monotonic()
+    assert pipeline.runCapture(recording, lambda: False, everyRead=lambda: reads.append(1), ended=lambda: True) is False
+    assert time.monotonic() - startTime < 0.5
+    assert len(reads) == 5
+
+
+# Four workers finishing out of order: the results reach onEmotion in frame order, however long onEmotion takes
+def test_results_are_delivered_in_order():
+    class JitteryDetector:
+        def detect_emotions(self, frame):
+            time.sleep(random.uniform(0.0, 0.02))
+            return [{"box": [0, 0, 10, 10], "emotions": {"happy": 1.0}}]
+
+    delivered = []
+
+    def onEmotion(result):
+        time.sleep(random.uniform(0.0, 0.005))
+        delivered.append(result.frameIndex)
+
+    pipeline = FramePipeline(JitteryDetector, onEmotion=onEmotion, numWorkers=4, queueSize=4)
+    pipeline.start()
+    for i in range(200):
+        pipeline.submit(object())
+        time.sleep(0.002)
+    time.sleep(0.1)
+    pipeline.stop()
+    assert len(delivered) > 20
+    assert delivered == sorted(delivered)
+    assert len(set(delivered)) == len(delivered)
+
+
+def test_start_refuses_while_workers_run():
+    release = threading.Event()
+
+    class StuckDetector:
+        def detect_emotions(self, frame):
+            release.wait(5.0)
+            return []
+
+    pipeline = FramePipeline(StuckDetector)
+    pipeline.start()
+    with pytest.raises(RuntimeError):
+        pipeline.start() # already running
+    pipeline.submit(object())
+    time.sleep(0.1)
+    pipeline.stop(timeout=0.05) # the worker is still inside detect_emotions
+    with pytest.raises(RuntimeError):
+        pipeline.start()
+    release.set()
+    time.sleep(0.2)
+    pipeline.start() # the old worker has finished
+    assert len(pipeline.workers) == 1
+    pipeline.stop()
@@ -0,0 +1,78 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import web_server
+from web_server import ServerRunner
+
+flask = pytest.importorskip("flask")
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask("web_server_test")
+
+    @app.route("/time")
+    def Get_Time():
+        return flask.jsonify(time=time.time())
+
+    return app
+
+
+# Every test runs on waitress (when it is installed) and on the Werkzeug fallback
+@pytest.fixture(params=["waitress", "werkzeug"])
+def backend(request, monkeypatch):
+    if request.param == "werkzeug":
+        monkeypatch.setattr(web_server, "waitress", None)
+    elif web_server.waitress is None:
+        pytest.skip("waitress is not installed")
+    return request.param
+
+
+# The ah-counter holds a keep-alive connection for the whole session, stop() must not wait for it to close
+def test_stop_with_keep_alive_client(app, backend):
+    runner = ServerRunner(app, host="127.0.0.1", port=0, threads=2)
+    assert runner.backend() == backend
+    thread = threading.Thread(target=runner.serve, daemon=True)
+    thread.start()
+    assert runner.ready.wait(5.0)
+    client = socket.create_connection(("127.0.0.1", runner.boundPort()))
+    try:
+        client.sendall(b"GET /time HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n")
+        assert b"200 OK" in client.recv(4096)
+        stopStart = time.monotonic()
+        assert runner.stop(timeout=5.0)
+        assert time.monotonic() - stopStart < 2.0
+        thread.join(1.0)
+        assert not thread.is_alive()
+    finally:
+        client.close()
+
+
+def test_stop_before_serve(app, backend):
+    runner = ServerRunner(app, host="127.0.0.1", port=0)
+    assert runner.stop(timeout=1.0)
+    runner.serve() # returns at once, the runner was already stopped
+    assert runner.finished.is_set()
+    assert runner.server is None
+
+
+# A client that connects after stop() gets no answer, and the port can be used again by the next server
+def test_port_is_released(app, backend):
+    runner = ServerRunner(app, host="127.0.0.1", port=0)
+    thread = threading.Thread(target=runner.serve, daemon=True)
+    thread.start()
+    assert runner.ready.wait(5.0)
+    port = runner.boundPort()
+    assert runner.stop(timeout=5.0)
+    thread.join(1.0)
+    with pytest.raises(OSError):
+        socket.create_connection(("127.0.0.1", port), timeout=1.0).recv(1)
+
+    again = ServerRunner(app, host="127.0.0.1", port=port)
+    thread = threading.Thread(target=again.serve, daemon=True)
+    thread.start()
+    assert again.ready.wait(5.0)
+    assert again.stop(timeout=5.0)
@@ -0,0 +1,85 @@
+import threading
+
+#================================ UI UPDATE BUS ============================================================
+# Worker threads publish what a widget should show, and the GUI thread applies the pending changes in batches from a
+# timer. Updates to the same property are merged and unchanged values are dropped.
+
+# widget method used for each kind of property
+SETTERS = {
+    "text": "setText", # QLabel text
+    "style": "setStyleSheet", # widget stylesheet
+    "message": "showMessage", # QStatusBar message
+}
+
+
+class UiUpdateBus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {} # (widget name, property) -> newest value not yet applied
+        self.shown = {} # (widget name, property) -> value currently on screen
+        self.calls = [] # functions to run on the GUI thread, in the order they were posted
+        self.published = 0 # updates published by the workers
+        self.coalesced = 0 # updates replaced by a newer value before they were applied
+        self.unchanged = 0 # updates dropped because the widget already showed that value
+        self.applied = 0 # updates that reached a widget
+        self.batches = 0 # number of times apply() found work to do
+
+    # Worker side: widget should show value for property ("text", "style" or "message")
+    def publish(self, widget, property, value):
+        key = (widget, property)
+        with self.lock:
+            self.published += 1
+            if key in self.pending:
+                self.coalesced += 1
+            if self.shown.get(key) == value: # already on screen, nothing to do
+                self.pending.pop(key, None)
+                self.unchanged += 1
+                return
+            self.pending[key] = value
+
+    # shorthand for the most common updates
+    def setText(self, widget, text):
+        self.publish(widget, "text", text)
+
+    def setStyle(self, widget, style):
+        self.publish(widget, "style", style)
+
+    # Worker side: run function(*args) on the GUI thread, e.g. clicking a button. Calls are never merged
+    def call(self, function, *args):
+        with self.lock:
+            self.calls.append((function, args))
+
+    # Take everything waiting: ([(widget, property, value)], [(function, args)])
+    def drain(self):
+        with self.lock:
+            updates = [(widget, property, value) for (widget, property), value in self.pending.items()]
+            self.shown.update(self.pending)
+            self.pending = {}
+            calls = self.calls
+            self.calls = []
+            self.applied += len(updates)
+            if updates or calls:
+                self.batches += 1
+        return updates, calls
+
+    # GUI side: apply every pending update to the widgets found as attributes of root (the loaded UI)
+    def apply(self, root):
+        updates, calls = self.drain()
+        for widget, property, value in updates:
+            getattr(getattr(root, widget), SETTERS[property])(value)
+        for function, args in calls:
+            function(*args)
+
+    # Forget what is on screen, e.g. after something on the GUI thread changed a widget directly
+    def forget(self, widget=None):
+        with self.lock:
+            if widget is None:
+                self.shown = {}
+            else:
+                self.shown = {key: value for key, value in self.shown.items() if key[0] != widget}
+
+    def stats(self):
+        with self.lock:
+            return {"published": self.published, "coalesced": self.coalesced, "unchanged": self.unchanged,
+                    "applied": self.applied, "batches": self.batches}
+#--------------------------------END UI UPDATE BUS-----------------------------------------------
@@ -0,0 +1,151 @@
+import itertools
+import threading
+import time
+import uuid
+
+import requests
+
+#================================ UPDATE SENDER ============================================================
+# Sends the ah-counter client's updates from a background thread. Newer values for an endpoint replace the waiting one,
+# every update carries a sequence number, and an unreachable server is retried with exponential backoff.
+
+class CoalescingSender:
+    # baseUrl: e.g. "http://10.0.2.5:5000"
+    # timeout: seconds to wait for one request
+    # minBackoff, maxBackoff: seconds between retries while the server is down, doubled after every failure
+    def __init__(self, baseUrl, timeout=2.0, minBackoff=0.25, maxBackoff=8.0):
+        self.baseUrl = baseUrl.rstrip("/")
+        self.timeout = timeout
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.clientId = uuid.uuid4().hex # lets the server tell this client's sequence numbers apart from another's
+        self.sequence = itertools.count(1)
+        self.session = requests.Session()
+        self.condition = threading.Condition()
+        self.pending = {} # endpoint -> newest payload not yet sent
+        self.order = [] # endpoints waiting, oldest first, so one busy endpoint cannot starve another
+        self.running = False
+        self.thread = None
+        self.backoff = 0.0 # current wait before the next retry, 0 while the server is reachable
+        self.lastResponse = {} # endpoint -> JSON of the last successful reply
+        self.sentCount = 0 # requests the server accepted
+        self.coalescedCount = 0 # updates replaced by a newer one before they were sent
+        self.failedCount = 0 # requests that could not be delivered (each one is retried)
+        self.staleCount = 0 # updates the server reported as out of order
+        self.sendTimes = [] # when the last few requests were sent, for sendRate()
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name="Update-Sender", daemon=True)
+        self.thread.start()
+
+    # Queue payload for endpoint ("/set_text", "/set_color"), never blocks
+    def send(self, endpoint, payload):
+        with self.condition:
+            if endpoint in self.pending:
+                self.coalescedCount += 1
+            else:
+                self.order.append(endpoint)
+            payload = dict(payload)
+            payload["client"] = self.clientId
+            payload["sequence"] = next(self.sequence)
+            self.pending[endpoint] = payload
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                endpoint = self.order.pop(0)
+                payload = self.pending.pop(endpoint)
+
+            if self.post(endpoint, payload):
+                self.backoff = 0.0
+                continue
+
+            with self.condition:
+                if endpoint not in self.pending: # keep it for the retry unless something newer arrived meanwhile
+                    self.pending[endpoint] = payload
+                    self.order.insert(0, endpoint)
+                self.backoff = min(self.maxBackoff, max(self.minBackoff, self.backoff * 2))
+                self.condition.wait_for(lambda: not self.running, self.backoff)
+
+    # One request, True when the server took it
+    def post(self, endpoint, payload):
+        try:
+            response = self.session.post(self.baseUrl + endpoint, json=payload, timeout=self.timeout)
+        except requests.RequestException:
+            self.failedCount += 1
+            return False
+        if not response.ok:
+            self.failedCount += 1
+            return response.status_code < 500 # a request the server rejected will not get better by retrying
+        self.sentCount += 1
+        self.sendTimes = self.sendTimes[-49:] + [time.monotonic()]
+        try:
+            reply = response.json()
+        except ValueError:
+            reply = None
+        if isinstance(reply, dict) and reply.get("stale"):
+            self.staleCount += 1
+        self.lastResponse[endpoint] = reply
+        return True
+
+    # Requests per second over the last few seconds
+    def sendRate(self, seconds=5.0):
+        now = time.monotonic()
+        recent = [sent for sent in self.sendTimes if now - sent <= seconds]
+        return len(recent) / seconds
+
+    def connected(self):
+        return self.backoff == 0.0
+
+    def stats(self):
+        with self.condition:
+            waiting = len(self.pending)
+        return {"sent": self.sentCount, "coalesced": self.coalescedCount, "failed": self.failedCount,
+                "stale": self.staleCount, "waiting": waiting, "sendRate": round(self.sendRate(), 1),
+                "connected": self.connected()}
+
+    # Stop the sender; updates still waiting are given up to `flush` seconds to go out first
+    def stop(self, flush=1.0):
+        deadline = time.monotonic() + flush
+        while self.pending and self.connected() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(self.timeout + 1.0)
+        self.session.close()
+#--------------------------------END UPDATE SENDER-----------------------------------------------
+
+
+#================================ SEQUENCE FILTER ==========================================================
+# Server side: remembers the newest sequence number seen from each client on each endpoint and reports an update as
+# stale when an equal or newer one was already applied. Updates without a sequence number (older clients) always pass.
+
+class SequenceFilter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = {} # (client, endpoint) -> newest sequence number applied
+        self.staleCount = 0
+
+    def accept(self, endpoint, payload):
+        sequence = payload.get("sequence")
+        if sequence is None:
+            return True
+        key = (payload.get("client"), endpoint)
+        with self.lock:
+            if key in self.latest and int(sequence) <= self.latest[key]:
+                self.staleCount += 1
+                return False
+            self.latest[key] = int(sequence)
+            return True
+#--------------------------------END SEQUENCE FILTER-----------------------------------------------
@@ -0,0 +1,332 @@
+import logging
+import threading
+import time
+
+import cv2
+import numpy
+
+#================================ FRAME PIPELINE ============================================================
+# Capture, a drop-the-oldest queue and FER worker threads, so the preview is never held back by the emotion CNN.
+
+logger = logging.getLogger(__name__)
+
+# Bounded queue where putting into a full queue drops the oldest frame instead of blocking the producer
+class LatestFrameQueue:
+    def __init__(self, maxSize=1):
+        self.maxSize = max(1, int(maxSize)) # number of frames the queue can hold before it starts dropping
+        self.items = [] # frames waiting for an inference worker, oldest first
+        self.condition = threading.Condition() # used to wake up workers when a frame arrives
+        self.closed = False # once closed, workers waiting on get() return None
+        self.droppedCount = 0 # total number of frames thrown away because the workers were busy
+
+    # Add a frame to the queue, returns True if an older frame had to be dropped to make room
+    def put(self, item):
+        with self.condition:
+            dropped = False
+            while len(self.items) >= self.maxSize: # queue full, throw away the oldest frame
+                self.items.pop(0)
+                self.droppedCount += 1
+                dropped = True
+            self.items.append(item)
+            self.condition.notify() # wake up one waiting worker
+            return dropped
+
+    # Take the oldest waiting frame, waits up to timeout seconds, returns None on timeout or when closed
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.pop(0)
+
+    def depth(self):
+        with self.condition:
+            return len(self.items)
+
+    # Wake every waiting worker so they can exit
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+# Counts events and turns them into a rate over the last reporting window
+class StageStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0 # number of events since the stage started
+        self.windowCount = 0 # number of events since the last call to rate()
+        self.windowStart = time.monotonic() # start of the current window
+        self.lastLatency = 0.0 # latency of the most recent event, in seconds
+        self.lastRate = 0.0 # rate calculated at the end of the previous window
+
+    def tick(self, latency=0.0):
+        with self.lock:
+            self.total += 1
+            self.windowCount += 1
+            self.lastLatency = latency
+
+    # Events per second since the last call, the window restarts every time this is called
+    def rate(self):
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.windowStart
+            if elapsed > 0:
+                self.lastRate = self.windowCount / elapsed
+            self.windowCount = 0
+            self.windowStart = now
+            return self.lastRate
+
+
+# Result handed back from an inference worker. emotion, score and scores are None when no face was found in the frame
+class EmotionResult:
+    __slots__ = ("frameIndex", "captureTime", "doneTime", "emotion", "score", "scores", "faces")
+
+    def __init__(self, frameIndex, captureTime, doneTime, scores, faces=None):
+        self.frameIndex = frameIndex # index of the frame this result belongs to
+        self.captureTime = captureTime # time.monotonic() when the frame was read from the camera
+        self.doneTime = time.monotonic() if doneTime is None else doneTime # time.monotonic() when inference finished
+        self.scores = scores # every emotion score FER gave the face, e.g. {"happy": 0.9, "sad": 0.01, ...}
+        self.faces = faces # [(box, scores)] of every face, when the analysis looks at more than one (audience mode)
+        self.emotion = None # top emotion label, e.g. "happy"
+        self.score = None # confidence of the top emotion
+        if scores:
+            self.emotion = max(scores, key=scores.get)
+            self.score = scores[self.emotion]
+
+    def latency(self):
+        return self.doneTime - self.captureTime
+
+
+# Default per-frame analysis: all of FER's emotion scores for the largest face (the speaker), or None when there is no face
+def detectEmotions(detector, frame):
+    faces = detector.detect_emotions(frame)
+    if not faces:
+        return None
+    return max(faces, key=lambda face: face["box"][2] * face["box"][3])["emotions"]
+
+
+class FramePipeline:
+    # detectorFactory: called once per worker thread to build its own detector (FER models are not shared between threads)
+    # onFrame(frame): called on the capture thread for every frame, this feeds the preview
+    # onEmotion(result): called on a worker thread with an EmotionResult for every analysed frame
+    # numWorkers: number of inference worker threads, TensorFlow releases the GIL during inference so threads scale
+    # queueSize: how many frames may wait for a worker before the oldest is dropped
+    # analyse(detector, frame): returns the emotion scores dict for one frame (None for no face), defaults to detectEmotions().
+    #     It may instead return an object with .scores and .faces, for analyses that score several faces (see audience.py)
+    # onError(error): called on a worker thread when analysing a frame or handing on its result raised, the worker
+    #     logs the error, skips that frame and carries on
+    # maxFailedReads: runCapture() gives up after this many reads in a row return no frame
+    def __init__(self, detectorFactory, onFrame=None, onEmotion=None, numWorkers=1, queueSize=1, analyse=detectEmotions,
+                 onError=None, maxFailedReads=100):
+        self.detectorFactory = detectorFactory
+        self.onFrame = onFrame
+        self.onEmotion = onEmotion
+        self.numWorkers = max(1, int(numWorkers))
+        self.analyse = analyse
+        self.onError = onError
+        self.maxFailedReads = maxFailedReads
+        self.queueSize = queueSize
+        self.queue = LatestFrameQueue(queueSize)
+        self.captureStats = StageStats() # frames read from the camera
+        self.inferenceStats = StageStats() # frames scored by FER
+        self.workers = []
+        self.stopEvent = threading.Event()
+        self.resultLock = threading.Lock()
+        self.lastDeliveredIndex = -1 # results older than this are stale (another worker already reported a newer frame)
+        self.staleCount = 0 # results thrown away because they arrived after a newer one
+        self.errorCount = 0 # frames whose analysis or result callback raised
+        self.frameIndex = 0
+
+    # Start the workers. A stopped pipeline can be started again, it gets a fresh queue. Raises RuntimeError while any
+    # worker is still running (the pipeline was not stopped, or a worker did not finish its frame within stop's timeout)
+    def start(self):
+        if any(worker.is_alive() for worker in self.workers):
+            raise RuntimeError("FER workers are still running, stop() the pipeline first")
+        self.workers = []
+        if self.queue.closed:
+            self.queue = LatestFrameQueue(self.queueSize)
+        self.stopEvent.clear()
+        for i in range(self.numWorkers):
+            worker = threading.Thread(target=self.inferenceLoop, name="FER-Worker-" + str(i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=5.0):
+        self.stopEvent.set()
+        self.queue.close()
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = [worker for worker in self.workers if worker.is_alive()] # kept so start() can refuse while they run
+
+    # Capture stage, runs on the calling thread until shouldStop() returns True or the camera stops delivering frames
+    # (maxFailedReads reads in a row without a frame). read() must behave like cv2.VideoCapture.read() and return
+    # (ret, frame). Returns False when it stopped because the frames ran out
+    # everyRead(): optional, called after every read, with or without a frame (e.g. to report the stats once a second)
+    # ended(): optional, called when a read returns no frame, True when the frames are over for good (a recording has
+    #     played to its end) so capture stops at once instead of waiting for the camera
+    def runCapture(self, read, shouldStop, everyRead=None, ended=None):
+        failedReads = 0
+        while not shouldStop() and not self.stopEvent.is_set():
+            ret, frame = read()
+            if ret:
+                failedReads = 0
+                self.submit(frame)
+            elif ended is not None and ended():
+                return False
+            else:
+                failedReads += 1
+                if failedReads >= self.maxFailedReads:
+                    logger.warning("no frame in %d reads, capture stopped", failedReads)
+                    return False
+                time.sleep(0.01) # a camera that is briefly busy, do not spin on it
+            if everyRead is not None:
+                everyRead()
+        return True
+
+    # Hand one frame to the display and queue it for inference
+    def submit(self, frame):
+        captureTime = time.monotonic()
+        self.captureStats.tick()
+        if self.onFrame is not None:
+            self.onFrame(frame) # the preview always gets the newest frame, inference never holds it up
+        self.queue.put((self.frameIndex, captureTime, frame))
+        self.frameIndex += 1
+
+    # Inference stage, one of these runs on each worker thread
+    def inferenceLoop(self):
+        try:
+            detector = self.detectorFactory()
+        except Exception as error: # without a detector this worker has nothing to do
+            logger.exception("could not build the detector, FER worker stopped")
+            self.failed(error)
+            return
+        while not self.stopEvent.is_set():
+            item = self.queue.get(timeout=0.5)
+            if item is None:
+                continue
+            frameIndex, captureTime, frame = item
+            try:
+                analysed = self.analyse(detector, frame)
+                scores = getattr(analysed, "scores", analysed)
+                result = EmotionResult(frameIndex, captureTime, None, scores, getattr(analysed, "faces", None))
+                self.inferenceStats.tick(result.latency())
+                self.deliver(result)
+            except Exception as error: # one bad frame or callback must not take the worker down
+                logger.exception("frame %d could not be analysed", frameIndex)
+                self.failed(error)
+
+    def failed(self, error):
+        with self.resultLock:
+            self.errorCount += 1
+        if self.onError is not None:
+            self.onError(error)
+
+    # Pass a result on, unless a newer frame has already been reported by another worker. onEmotion is called with the
+    # lock held, so an older result can never reach it after a newer one
+    def deliver(self, result):
+        with self.resultLock:
+            if result.frameIndex < self.lastDeliveredIndex:
+                self.staleCount += 1
+                return
+            self.lastDeliveredIndex = result.frameIndex
+            if self.onEmotion is not None:
+                self.onEmotion(result)
+
+    # Snapshot of the pipeline for the FPS label. Calling this restarts the rate windows
+    def stats(self):
+        return {
+            "captureFps": round(self.captureStats.rate(), 1),
+            "inferenceFps": round(self.inferenceStats.rate(), 1),
+            "inferenceLatency": round(self.inferenceStats.lastLatency, 3),
+            "dropped": self.queue.droppedCount,
+            "stale": self.staleCount,
+            "errors": self.errorCount,
+            "queueDepth": self.queue.depth(),
+        }
+#----------------------------------END FRAME PIPELINE----------------------------------------------------------
+
+
+#================================ FRAME SOURCES ==============================================================
+# Stand-ins for cv2.VideoCapture(0) with the same read() / set() / release() methods, so the app and the benchmarks
+# can run without a webcam.
+
+# A recorded video played back as if it were a camera. With realtime=True frames are delivered at the video's frame
+# rate, with loop=True it starts again at the end (otherwise read() returns (False, None) from then on)
+class VideoFileSource:
+    def __init__(self, path, realtime=True, loop=True):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.nextFrame = time.monotonic()
+
+    def read(self):
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        if ret and self.realtime:
+            self.nextFrame = max(self.nextFrame + 1.0 / self.fps, time.monotonic() - 1.0) # never try to catch up a whole second
+            delay = self.nextFrame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return ret, frame
+
+    def set(self, prop, value):
+        return False # a recording has a fixed size
+
+    def release(self):
+        self.capture.release()
+
+
+# Generated frames: a bright "face" that drifts around and changes brightness every second (the batch analyzer's stub
+# detector reads an emotion from the brightness). Every frame is a fresh array, like a real camera delivers
+class SyntheticCamera:
+    def __init__(self, width=400, height=300, fps=30.0, realtime=True):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.frameNumber = 0
+        self.nextFrame = time.monotonic()
+
+    def read(self):
+        if self.realtime:
+            self.nextFrame = max(self.nextFrame + 1.0 / self.fps, time.monotonic() - 1.0)
+            delay = self.nextFrame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frame = numpy.zeros((self.height, self.width, 3), dtype=numpy.uint8)
+        second = int(self.frameNumber / self.fps)
+        x = self.width // 2 - 40 + int(20 * numpy.sin(self.frameNumber / 10.0))
+        y = self.height // 2 - 50 + int(10 * numpy.cos(self.frameNumber / 15.0))
+        frame[y:y + 100, x:x + 80] = 60 + (second * 37) % 190
+        self.frameNumber += 1
+        return True, frame
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        return True
+
+    def release(self):
+        pass
+
+
+# The frame source for a setting: a camera index, a video file to replay, or "synthetic" for generated frames
+def openFrameSource(source, width=400, height=300):
+    if source == "synthetic":
+        capture = SyntheticCamera(width, height)
+    elif isinstance(source, str):
+        return VideoFileSource(source)
+    else:
+        capture = cv2.VideoCapture(source)
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return capture
+#----------------------------------END FRAME SOURCES----------------------------------------------------------
@@ -0,0 +1,91 @@
+import logging
+import threading
+
+#================================ WEB SERVER RUNNER =========================================================
+# Serves a Flask app with waitress (or Werkzeug's threaded server when waitress is not installed), and can be stopped
+# from another thread.
+
+try:
+    import waitress
+    from waitress import wasyncore
+except ImportError:
+    waitress = None
+
+
+class ServerRunner:
+    # app: the Flask (or any WSGI) app
+    # threads: number of requests handled at the same time
+    def __init__(self, app, host="0.0.0.0", port=5000, threads=8):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.server = None
+        self.socketMap = {} # waitress: the listening socket and every open connection, served by serveUntilStopped()
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.ready = threading.Event() # set once the server is listening
+        self.finished = threading.Event() # set once serve() has returned
+
+    # Name of the backend that will be used
+    def backend(self):
+        return "waitress" if waitress is not None else "werkzeug"
+
+    # Serve requests until stop() is called. Blocks, so run it on its own thread
+    def serve(self):
+        try:
+            self.serveUntilStopped()
+        finally:
+            self.finished.set()
+
+    def serveUntilStopped(self):
+        with self.lock:
+            if self.stopping:
+                return
+            if waitress is not None:
+                logging.getLogger("waitress.queue").setLevel(logging.ERROR) # a busy queue is expected under load, not worth a warning per request
+                self.server = waitress.create_server(self.app, map=self.socketMap, host=self.host, port=self.port,
+                                                     threads=self.threads)
+            else:
+                from werkzeug.serving import make_server
+                self.server = make_server(self.host, self.port, self.app, threaded=True)
+            self.ready.set()
+        if waitress is None:
+            self.server.serve_forever()
+            return
+        # Waitress's own run() only returns once every client has closed its connection, and the ah-counter keeps its
+        # keep-alive connection open for the whole session. So the loop is run here, and once stop() has been called
+        # the listening socket and every connection are closed on this thread
+        while not self.stopping:
+            wasyncore.loop(timeout=1.0, map=self.socketMap, count=1)
+        with self.lock:
+            self.server.close()
+            wasyncore.close_all(self.socketMap)
+
+    # Port the server is really listening on (useful when it was started on port 0)
+    def boundPort(self):
+        if self.server is None:
+            return self.port
+        if waitress is not None:
+            return int(self.server.effective_port)
+        return self.server.server_port
+
+    # Stop accepting connections, close the open ones and let serve() return. Safe to call from any thread, and before
+    # serve() has started. Returns True when serve() returned within timeout seconds
+    def stop(self, timeout=5.0):
+        with self.lock:
+            self.stopping = True
+            server = self.server
+            if server is not None and waitress is not None:
+                try:
+                    server.pull_trigger() # wake the loop so it sees stopping at once
+                except OSError: # the loop has already closed the server
+                    pass
+        if server is None:
+            return True
+        if waitress is None and self.ready.is_set():
+            # shutdown() waits until serve_forever() has returned, and forever if it never started, so it gets its own
+            # thread and the wait is bounded below
+            threading.Thread(target=server.shutdown, name="Web-Server-Shutdown", daemon=True).start()
+        return self.finished.wait(timeout)
+#--------------------------------END WEB SERVER RUNNER-----------------------------------------------